@@ -1,7 +1,7 @@
 import streamlit as st
-import json
 import sys
 import os
+import uuid
 from dotenv import load_dotenv
 
 # Carregar variáveis de ambiente
@@ -11,7 +11,8 @@ load_dotenv()
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from utils.export import export_question_json, export_questions_list_json
-from pipeline import get_subjects, get_codes_for_subject, generate_questions
+from pipeline import start_generation_job
+from ui.generation_state import is_approved
 
 # Configuração da página
 st.set_page_config(
@@ -57,13 +58,25 @@ def check_authentication():
   
   return False
 
+@st.cache_resource
+def _start_background_tasks():
+  """Inicia uma única vez por processo a manutenção do cache e a reposição do estoque"""
+  from pipeline import pipeline
+  pipeline.start_background_tasks()
+  return True
+
+
 def main():
+  _start_background_tasks()
   st.title("📚 Gerador de Questões BNCC - 4º Ano")
   st.markdown("Gerador inteligente de questões baseado nos códigos de habilidade da BNCC")
   
   _cleanup_regenerate_keys()
   _process_regenerate_request_if_any()
+  _process_bulk_regenerate_request_if_any()
   _render_config_section()
+  _render_generation_progress()
+  _render_generation_notice()
   _render_advanced_section()
   _render_results_and_history()
 
@@ -108,23 +121,14 @@ def _alternativas_from_opcoes(opcoes):
   return {}
 
 
-def _is_approved(qwv) -> bool:
-  """Retorna True se a questão for considerada aprovada (alinhada e confiança >= 0.7)."""
-  try:
-    return bool(qwv.validation.is_aligned) and float(qwv.validation.confidence_score) >= 0.7
-  except Exception:
-    return False
-
-
 def _regen_find_old_question_text(regenerate_request):
   """Retorna o enunciado da questão antiga para evitar duplicação, ou None."""
-  if 'current_batches' not in st.session_state:
+  from ui.generation_state import current_generation
+  generation = current_generation()
+  if generation is None:
     return None
-  for batch in st.session_state.current_batches:
-    if batch.request.codigo == regenerate_request['codigo']:
-      if regenerate_request['index'] < len(batch.questions):
-        return batch.questions[regenerate_request['index']].question.enunciado
-  return None
+  qwv = generation.question_at(regenerate_request['codigo'], regenerate_request['index'])
+  return qwv.question.enunciado if qwv is not None else None
 
 def _regen_generate_new_question(regenerate_request, avoid_text):
   """Invoca pipeline para regenerar a questão."""
@@ -132,16 +136,11 @@ def _regen_generate_new_question(regenerate_request, avoid_text):
   return pipeline.regenerate_question_with_variety(regenerate_request['request'], avoid_text=avoid_text)
 
 def _regen_replace_question_in_batches(regenerate_request, new_question):
-  """Substitui a questão nos batches atuais e atualiza contadores."""
-  if 'current_batches' not in st.session_state:
-    return
-  for batch in st.session_state.current_batches:
-    if batch.request.codigo == regenerate_request['codigo']:
-      if regenerate_request['index'] < len(batch.questions):
-        batch.questions[regenerate_request['index']] = new_question
-        batch.total_approved = sum(1 for q in batch.questions if _is_approved(q))
-        batch.total_generated = len(batch.questions)
-      break
+  """Substitui a questão na geração atual (os contadores são atualizados pela própria geração)."""
+  from ui.generation_state import current_generation
+  generation = current_generation()
+  if generation is not None:
+    generation.replace(regenerate_request['codigo'], regenerate_request['index'], new_question)
 
 def _regen_show_generation_result(regenerate_request, new_question):
   """Mostra feedback para o usuário conforme a validação da nova questão."""
@@ -176,22 +175,68 @@ def _process_regenerate_request_if_any():
       del st.session_state['regenerate_request']
 
 
+def _process_bulk_regenerate_request_if_any():
+  """Regenera em paralelo todas as questões rejeitadas da geração atual (um único progresso)"""
+  if not st.session_state.pop('bulk_regenerate_request', False):
+    return
+  from pipeline import pipeline
+  from ui.generation_state import current_generation
+  generation = current_generation()
+  if generation is None:
+    return
+
+  rejected = generation.rejected()
+  if not rejected:
+    return
+  items = [
+    ((codigo, index), generation.requests[codigo], qwv.question.enunciado)
+    for codigo, index, qwv in rejected
+  ]
+  approved = 0
+  # A execução fica bloqueada até o fim do lote; a interface mostra apenas a barra de progresso
+  progress = st.progress(0.0, text=f"Regenerando 0/{len(items)} questões rejeitadas...")
+
+  def show_progress(done):
+    progress.progress(done / len(items), text=f"Regenerando {done}/{len(items)} questões rejeitadas...")
+
+  try:
+    for (codigo, index), new_question in pipeline.regenerate_questions_parallel(items, progress=show_progress):
+      # Cada resultado entra na posição original assim que fica pronto
+      generation.replace(codigo, index, new_question)
+      approved += int(is_approved(new_question))
+    if approved == len(items):
+      st.success(f"✅ {approved} questões regeneradas e aprovadas!")
+    else:
+      st.warning(f"⚠️ {approved} de {len(items)} questões regeneradas foram aprovadas; as demais ainda precisam de revisão.")
+  except Exception as e:
+    st.error(f"❌ Erro ao regenerar questões: {e}")
+  finally:
+    progress.empty()
+
+
 def _render_config_section():
   # Configurações como accordion
   from ui.config_panel import config_panel
   with st.expander("⚙️ Configurações", expanded=True):
     selected_subject, selected_codes, _codes_data = config_panel()
     questions_per_code = st.number_input("Questões por Código", min_value=1, max_value=20, value=1)
+    use_cache = st.checkbox(
+      "♻️ Reutilizar questões do cache",
+      value=False,
+      help="Entrega questões já aprovadas (sem repetir entre sessões) antes de gerar novas"
+    )
     total_questions = len(selected_codes) * questions_per_code
+    generation_running = 'generation_job' in st.session_state
     if st.button(
       f"🚀 Gerar {total_questions} questões",
-      disabled=len(selected_codes) == 0 or total_questions == 0,
+      disabled=len(selected_codes) == 0 or total_questions == 0 or generation_running,
       type="primary"
     ):
       st.session_state.generation_config = {
         'codes': selected_codes,
         'questions_per_code': questions_per_code,
-        'subject': selected_subject
+        'subject': selected_subject,
+        'use_cache': use_cache
       }
       generate_questions_ui()
 
@@ -215,78 +260,130 @@ def _render_results_and_history():
   from ui.results_panel import results_panel
   from ui.questions_table import questions_table_panel
   from ui.cache_panel import cache_panel
+  from ui.generation_state import current_generation
 
-  if 'current_batches' in st.session_state and st.session_state.current_batches:
-    results_panel(st.session_state.current_batches, lambda batches: questions_table_panel(batches, handle_question_actions))
+  # Ações pendentes do histórico também precisam ser processadas sem uma geração atual
+  handle_question_actions()
+  generation = current_generation()
+  if generation is not None and len(generation):
+    results_panel(generation, lambda batches: questions_table_panel(batches, handle_question_actions))
   # Seção do histórico do cache em accordion
   with st.expander("🗄️ Histórico Completo de Questões", expanded=False):
       cache_panel()
 
 def generate_questions_ui():
-  """Interface para geração de questões"""
+  """Inicia a geração em segundo plano; o progresso é acompanhado por _render_generation_progress"""
   
   # Verificar se há configurações no session state
   if 'generation_config' not in st.session_state:
     st.error("❌ Configurações de geração não encontradas!")
     return
+  job = st.session_state.get('generation_job')
+  if job is not None and job.status in ("running", "cancelling"):
+    st.warning("⚠️ Já existe uma geração em andamento.")
+    return
   
   config = st.session_state.generation_config
-  
+  try:
+    # Um owner por sessão: os leases impedem que outra sessão receba as mesmas questões do cache
+    if 'lease_owner' not in st.session_state:
+      st.session_state.lease_owner = uuid.uuid4().hex
+    st.session_state.generation_job = start_generation_job(
+      codes=config['codes'],
+      questions_per_code=config['questions_per_code'],
+      use_cache=config.get('use_cache', False),
+      lease_owner=st.session_state.lease_owner
+    )
+    # Os lotes da nova geração substituem os anteriores à medida que ficam prontos
+    from ui.generation_state import CurrentGeneration
+    st.session_state.current_generation = CurrentGeneration()
+    st.rerun()
+  except Exception as e:
+    st.error(f"❌ Erro na geração: {str(e)}")
+    st.exception(e)
+
+
+def _format_duration(seconds) -> str:
+  if seconds is None:
+    return "calculando..."
+  minutes, secs = divmod(int(seconds), 60)
+  return f"{minutes}min {secs:02d}s" if minutes else f"{secs}s"
+
+
+def _render_generation_progress():
+  """Acompanha a geração em segundo plano; o fragmento com polling só existe enquanto há um job"""
+  job = st.session_state.get('generation_job')
+  if job is not None:
+    _generation_progress_fragment(job)
+
+
+@st.fragment(run_every=1.0)
+def _generation_progress_fragment(job):
+  """Só este trecho é reexecutado a cada segundo; ao terminar, o rerun completo deixa de renderizá-lo"""
+  snapshot = job.snapshot()
+  finished = snapshot['status'] in ("done", "cancelled", "error")
+
   with st.container():
     st.header("🔄 Gerando Questões...")
-    
-    # Barra de progresso
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    
-    try:
-      # Gerar questões
-      with st.spinner("Processando..."):
-        batches = generate_questions(
-          codes=config['codes'],
-          questions_per_code=config['questions_per_code']
-        )
-      # Salvar todas as questões aprovadas no cache
-      try:
-        from pipeline import pipeline
-        for batch in batches:
-          for qwv in batch.questions:
-            if qwv.validation.is_aligned:
-              pipeline.cache_manager.cache_question(batch.request, qwv.question, qwv.validation)
-      except Exception as cache_error:
-        st.warning(f"⚠️ Erro ao salvar questões no cache: {cache_error}")
-      progress_bar.progress(100)
-      status_text.text("✅ Questões geradas com sucesso!")
-      # Salvar no session state
-      st.session_state.current_batches = batches
-      st.rerun()  # Rerun para mostrar os resultados na main
-      
-    except Exception as e:
-      st.error(f"❌ Erro na geração: {str(e)}")
-      st.exception(e)
+    done, total = snapshot['done'], snapshot['total']
+    st.progress(
+      done / total if total else 1.0,
+      text=f"{done}/{total} questões · decorrido {_format_duration(snapshot['elapsed_seconds'])} · restante {_format_duration(snapshot['eta_seconds'])}"
+    )
+    for code, code_done in snapshot['per_code'].items():
+      st.progress(min(code_done / job.questions_per_code, 1.0), text=f"{code}: {code_done}/{job.questions_per_code}")
+    if snapshot['status'] == "cancelling":
+      st.info("⏹️ Cancelando: aguardando a questão em andamento terminar...")
+    elif st.button("⏹️ Cancelar geração", key="cancel_generation"):
+      job.cancel()
+      st.rerun()
+
+  # Lotes novos (ou fim da geração): só os novos entram na sessão
+  from ui.generation_state import CurrentGeneration
+  generation = st.session_state.get('current_generation')
+  if generation is None:
+    generation = st.session_state.current_generation = CurrentGeneration()
+  new_batches = snapshot['batches'][len(generation):]
+  if finished or new_batches:
+    for batch in new_batches:
+      generation.add_batch(batch)
+    if finished:
+      del st.session_state['generation_job']
+      if snapshot['status'] == "error":
+        st.session_state.generation_notice = ("error", f"❌ Erro na geração: {snapshot['error']}")
+      elif snapshot['status'] == "cancelled":
+        st.session_state.generation_notice = ("warning", f"⏹️ Geração cancelada: {done} de {total} questões mantidas.")
+      else:
+        st.session_state.generation_notice = ("success", "✅ Questões geradas com sucesso!")
+    st.rerun()
+
+
+def _render_generation_notice():
+  notice = st.session_state.pop('generation_notice', None)
+  if notice is not None:
+    level, message = notice
+    getattr(st, level)(message)
 
 def display_results(batches):
   """Exibe os resultados das questões geradas (orquestração simplificada)."""
   # Persistir batches e delegar responsabilidades a helpers
-  st.session_state.current_batches = batches
+  from ui.generation_state import CurrentGeneration
+  generation = st.session_state.current_generation = CurrentGeneration.from_batches(batches)
 
-  _render_results_header(batches)
-  _render_rejected_questions_section(batches)
+  _render_results_header(generation)
+  _render_rejected_questions_section(generation, batches)
   _render_approved_analysis_section(batches)
   st.subheader("📋 Tabela de Todas as Questões")
   display_questions_table(batches)
   _render_export_current_generation(batches)
 
 
-def _render_results_header(batches):
-  """Renderiza cabeçalho e métricas principais."""
+def _render_results_header(generation):
+  """Renderiza cabeçalho e métricas principais (agregados mantidos pela geração)."""
   st.header("📊 Resultados da Geração Atual")
 
-  total_generated = sum(batch.total_generated for batch in batches)
-  total_approved = sum(
-    sum(1 for q in batch.questions if _is_approved(q))
-    for batch in batches
-  )
+  total_generated = generation.total_generated
+  total_approved = generation.total_approved
   approval_rate = (total_approved / total_generated * 100) if total_generated > 0 else 0
 
   col1, col2, col3, col4 = st.columns(4)
@@ -297,7 +394,7 @@ def _render_results_header(batches):
   with col3:
     st.metric("Taxa de Aprovação", f"{approval_rate:.1f}%")
   with col4:
-    st.metric("Códigos Processados", len(batches))
+    st.metric("Códigos Processados", len(generation))
 
 
 def _render_single_rejected_question(batch, index_in_list, question_with_validation):
@@ -335,13 +432,9 @@ def _render_single_rejected_question(batch, index_in_list, question_with_validat
   st.divider()
 
 
-def _render_rejected_questions_section(batches):
+def _render_rejected_questions_section(generation, batches):
   """Renderiza a seção de questões rejeitadas com ações de regeneração."""
-  rejected_exists = any(
-    any(not _is_approved(q) for q in batch.questions)
-    for batch in batches
-  )
-  if not rejected_exists:
+  if not generation.has_rejected:
     return
 
   with st.expander("⚠️ Questões Rejeitadas na Validação", expanded=True):
@@ -349,7 +442,7 @@ def _render_rejected_questions_section(batches):
 
     for batch in batches:
       # manter índices originais para regeneração correta
-      rejected_pairs = [(idx, q) for idx, q in enumerate(batch.questions) if not _is_approved(q)]
+      rejected_pairs = [(idx, q) for idx, q in enumerate(batch.questions) if not is_approved(q)]
       if not rejected_pairs:
         continue
 
@@ -366,7 +459,7 @@ def _render_approved_analysis_section(batches):
         st.markdown(f"## 📖 {batch.request.codigo} - {batch.request.objeto_conhecimento[:80]}...")
         st.info(f"**Unidade Temática:** {batch.request.unidade_tematica}")
 
-        approved_questions = [q for q in batch.questions if _is_approved(q)]
+        approved_questions = [q for q in batch.questions if is_approved(q)]
         if not approved_questions:
           st.warning("⚠️ Nenhuma questão foi aprovada na validação para este código.")
           st.markdown("---")
@@ -394,16 +487,12 @@ def _render_export_current_generation(batches):
   _, col2, _ = st.columns([1, 2, 1])
   with col2:
     try:
-      from utils.export import export_questions_list_json, export_question_json
-      export_list = []
-      for batch in batches:
-        for idx, qwv in enumerate(batch.questions):
-          q = qwv.question
-          disciplina = getattr(q, 'materia', getattr(q, 'subject', None))
-          alternativas = q.opcoes if hasattr(q, 'opcoes') else {}
-          gabarito = q.gabarito if q.gabarito in ['A', 'B', 'C', 'D'] else str(q.gabarito)
-          json_data_individual, _ = export_question_json(disciplina, batch.request.codigo, q.enunciado, alternativas, gabarito, f"_atual_{idx+1}")
-          export_list.append(json.loads(json_data_individual))
+      from utils.export import export_questions_list_json, question_export
+      export_list = [
+        question_export(qwv.question, batch.request.codigo)
+        for batch in batches
+        for qwv in batch.questions
+      ]
       json_data, file_name = export_questions_list_json(export_list, filename_prefix="questoes_bncc_4ano")
       st.download_button(
         label="💾 Exportar Geração Atual (JSON)",
@@ -436,9 +525,9 @@ def handle_question_actions():
     del st.session_state['delete_selected_questions']
     sources_removed = {item['source'] for item in selected_items}
     if 'current' in sources_removed and 'selected_questions_current' in st.session_state:
-      st.session_state['selected_questions_current'] = []
+      st.session_state['selected_questions_current'].clear()
     if 'cache' in sources_removed and 'selected_questions_cache' in st.session_state:
-      st.session_state['selected_questions_cache'] = []
+      st.session_state['selected_questions_cache'].clear()
     st.rerun()
 
 
@@ -494,15 +583,13 @@ def show_system_info():
     
     st.header("ℹ️ Informações do Sistema")
     try:
-      from pipeline import pipeline
-      cache_stats = pipeline.get_cache_stats()
+      from ui.data import cached_cache_stats, cached_subjects, cached_total_codes
+      cache_stats = cached_cache_stats()
       st.write(f"**Cache:** {cache_stats['total_entries']} entradas")
       
-      subjects = get_subjects()
-      st.write(f"**Matérias:** {len(subjects)}")
+      st.write(f"**Matérias:** {len(cached_subjects())}")
       
-      total_codes = sum(len(get_codes_for_subject(subject)) for subject in subjects)
-      st.write(f"**Códigos BNCC:** {total_codes}")
+      st.write(f"**Códigos BNCC:** {cached_total_codes()}")
       
     except Exception as e:
       st.write(f"Erro ao carregar stats: {e}")
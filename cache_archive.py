@@ -0,0 +1,23 @@
+import zlib
+from typing import Iterable
+
+# zlib usa no máximo os últimos 32 KiB do dicionário (tamanho da janela)
+_MAX_DICTIONARY_BYTES = 32 * 1024
+
+def build_dictionary(samples: Iterable[str]) -> bytes:
+  """Dicionário compartilhado a partir de documentos de exemplo do próprio cache.
+
+  Todas as linhas repetem as mesmas chaves JSON e o mesmo vocabulário; com o dicionário,
+  cada linha comprime bem mesmo sozinha (sem depender das vizinhas).
+  """
+  data = b"".join(sample.encode("utf-8") for sample in samples)
+  # As sequências do fim do dicionário ficam mais baratas de referenciar
+  return data[-_MAX_DICTIONARY_BYTES:]
+
+def compress_payload(payload: str, dictionary: bytes) -> bytes:
+  compressor = zlib.compressobj(level=9, zdict=dictionary) if dictionary else zlib.compressobj(level=9)
+  return compressor.compress(payload.encode("utf-8")) + compressor.flush()
+
+def decompress_payload(blob: bytes, dictionary: bytes) -> str:
+  decompressor = zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+  return (decompressor.decompress(blob) + decompressor.flush()).decode("utf-8")
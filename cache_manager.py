@@ -1,30 +1,206 @@
-import sqlite3
 import hashlib
 import json
-from datetime import datetime
-from pathlib import Path
-from typing import Optional, List
-from models.schemas import Question, ValidationResult, CacheEntry, QuestionRequest
-
-class CacheManager:
-  def __init__(self, db_path: str = "db/questions_cache.db"):
-    self.db_path = Path(db_path)
-    self.db_path.parent.mkdir(exist_ok=True)
+import logging
+import threading
+import uuid
+import zlib
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Optional, List, Dict, Iterator, Tuple
+from pydantic import ValidationError
+from models.schemas import (
+  Question, ValidationResult, CacheEntry, QuestionRequest, CacheRetentionPolicy
+)
+from cache_migrations import content_hash, ProgressCallback
+from cache_storage import SQLiteStorage
+from cache_archive import build_dictionary, compress_payload, decompress_payload
+
+logger = logging.getLogger(__name__)
+
+# Colunas permitidas para ordenação da listagem (paginação por cursor usa a coluna + cache_key)
+_SORT_COLUMNS = {
+  "created_at": "created_at",
+  "confidence": "confidence_score",
+  "codigo": "codigo",
+}
+
+# Ordem de descarte: duplicatas marcadas, já entregues (o estoque nunca servido fica), menor confiança e mais antigas primeiro
+_EVICTION_ORDER_SQL = "(duplicate_of IS NULL), (served_count = 0), confidence_score, created_at"
+
+# Colunas lidas para mover linhas ao arquivo frio
+_ARCHIVE_SOURCE_SQL = """
+  SELECT rowid, cache_key, codigo, subject, confidence_score, is_aligned, content_hash, served_count, created_at,
+    question_data, validation_data
+  FROM question_cache
+"""
+
+# Por quanto tempo após o vencimento um lease ainda impede reentregar a questão ao mesmo owner (sessão)
+_LEASE_HISTORY_DAYS = 1
+
+# Estoque: questões validadas, não duplicadas e ainda não entregues
+_STOCK_SQL = "served_count = 0 AND is_aligned = 1 AND duplicate_of IS NULL"
+
+# Faixas de confiança usadas nas estatísticas (mesmos limites dos ícones da interface)
+_CONFIDENCE_BAND_SQL = """
+  CASE
+    WHEN confidence_score >= 0.8 THEN 'alta'
+    WHEN confidence_score >= 0.6 THEN 'media'
+    ELSE 'baixa'
+  END
+"""
+
+class _LRUCache:
+  """Cache em memória com tamanho máximo e descarte do item menos usado (thread-safe)"""
+
+  def __init__(self, maxsize: int):
+    self.maxsize = maxsize
+    self._data = OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(self, key, default=None):
+    with self._lock:
+      if key not in self._data:
+        return default
+      self._data.move_to_end(key)
+      return self._data[key]
+
+  def put(self, key, value):
+    with self._lock:
+      self._data[key] = value
+      self._data.move_to_end(key)
+      while len(self._data) > self.maxsize:
+        self._data.popitem(last=False)
+
+  def pop(self, key):
+    with self._lock:
+      return self._data.pop(key, None)
+
+  def clear(self):
+    with self._lock:
+      self._data.clear()
+
+class PagedCacheReads:
+  """Iteradores paginados sobre cache_keys_page/export_rows_page (local ou remoto).
+
+  Cada página é uma chamada curta; nada mantém uma transação de leitura aberta nem o resultado inteiro em memória.
+  """
+
+  def iter_cache_keys(self, filters: Optional[dict] = None, batch_size: int = 5000) -> Iterator[Tuple[str, str]]:
+    """Percorre (cache_key, codigo) das entradas que atendem aos filtros, em páginas por cursor"""
+    after: Optional[str] = None
+    while True:
+      rows = self.cache_keys_page(filters, after, batch_size)
+      yield from rows
+      if len(rows) < batch_size:
+        return
+      after = rows[-1][0]
+
+  def iter_export_rows(
+    self, filters: Optional[dict] = None, batch_size: int = 1000, cache_keys: Optional[List[str]] = None
+  ) -> Iterator[dict]:
+    """Percorre o cache (mais recentes primeiro) com os campos de exportação, em páginas por cursor.
+
+    Com cache_keys, exporta só essas entradas (na ordem pedida), em lotes de chaves.
+    """
+    if cache_keys is not None:
+      keys = list(dict.fromkeys(cache_keys))
+      step = min(batch_size, 500)
+      for start in range(0, len(keys), step):
+        yield from self.export_rows_for_keys(keys[start:start + step], filters)
+      return
+
+    cursor: Optional[Tuple[str, str]] = None
+    while True:
+      rows = self.export_rows_page(filters, cursor, batch_size)
+      yield from rows
+      if len(rows) < batch_size:
+        return
+      cursor = (rows[-1]["created_at"], rows[-1]["cache_key"])
+
+class CacheManager(PagedCacheReads):
+  def __init__(
+    self,
+    db_path: str = "db/questions_cache.db",
+    max_cached_entries: int = 5000,
+    max_cached_lists: int = 128,
+    retention: Optional[CacheRetentionPolicy] = None,
+    migration_progress: Optional[ProgressCallback] = None,
+    storage: Optional[SQLiteStorage] = None
+  ):
+    # Armazenamento plugável: SQLite local por padrão, ou servidor compartilhado entre réplicas
+    self.storage = storage or SQLiteStorage(db_path)
+    self.db_path = getattr(self.storage, "db_path", None)
+    self.retention = retention or CacheRetentionPolicy()
+    self._maintenance_thread: Optional[threading.Thread] = None
+    self._maintenance_stop = threading.Event()
+    # Entradas decodificadas por cache_key -> (rowid, CacheEntry) e listas por versão dos dados
+    self._entry_cache = _LRUCache(max_cached_entries)
+    self._list_cache = _LRUCache(max_cached_lists)
+    self._fts_enabled = False
+    # Dicionários de compressão do arquivo por dict_id (imutáveis, lidos uma vez)
+    self._archive_dictionaries: Dict[int, bytes] = {}
+    self._migration_progress = migration_progress
     self._init_db()
   
   def _init_db(self):
-    """Inicializa o banco de dados SQLite"""
-    with sqlite3.connect(self.db_path) as conn:
-      conn.execute("""
-        CREATE TABLE IF NOT EXISTS question_cache (
-          cache_key TEXT PRIMARY KEY,
-          question_data TEXT NOT NULL,
-          validation_data TEXT NOT NULL,
-          created_at TEXT NOT NULL
-        )
-      """)
-      conn.commit()
-  
+    """Inicializa o banco de dados aplicando as migrações pendentes"""
+    self.storage.initialize(progress=self._migration_progress)
+    with self.storage.connect() as conn:
+      self._fts_enabled = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'question_fts'"
+      ).fetchone() is not None
+
+  @staticmethod
+  def _fts_query(text: str, prefix: bool = True) -> str:
+    """Converte texto livre em consulta FTS5 (termos entre aspas, com prefixo opcional)"""
+    terms = [term.replace('"', '""') for term in text.split()]
+    suffix = "*" if prefix else ""
+    return " ".join(f'"{term}"{suffix}' for term in terms if term)
+
+  def _read_data_version(self, conn, codigo: Optional[str] = None) -> int:
+    key = "data_version" if codigo is None else f"data_version:{codigo}"
+    row = conn.execute("SELECT value FROM cache_meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else 0
+
+  def get_data_version(self, codigo: Optional[str] = None) -> int:
+    """Retorna a versão atual dos dados do cache (global ou de um código)"""
+    with self.storage.connect() as conn:
+      return self._read_data_version(conn, codigo)
+
+  def _load_entries(self, conn, keyed_rows) -> List[CacheEntry]:
+    """Monta entradas a partir de (cache_key, rowid), decodificando apenas linhas ausentes da memória"""
+    entries: Dict[str, CacheEntry] = {}
+    missing = []
+    for cache_key, rowid in keyed_rows:
+      cached = self._entry_cache.get(cache_key)
+      if cached is not None and cached[0] == rowid:
+        entries[cache_key] = cached[1]
+      else:
+        missing.append(rowid)
+
+    for start in range(0, len(missing), 500):
+      chunk = missing[start:start + 500]
+      placeholders = ",".join("?" * len(chunk))
+      cursor = conn.execute(
+        f"""
+        SELECT cache_key, question_data, validation_data, created_at, rowid
+        FROM question_cache
+        WHERE rowid IN ({placeholders})
+        """,
+        chunk,
+      )
+      for cache_key, question_data, validation_data, created_at, rowid in cursor:
+        try:
+          entry = self._decode_entry(cache_key, question_data, validation_data, created_at)
+        except ValidationError as e:
+          # Uma linha ilegível não derruba a leitura inteira: fica de fora até ser corrigida ou removida
+          logger.warning("Entrada %s do cache ilegível, ignorada: %s", cache_key, e)
+          continue
+        self._entry_cache.put(cache_key, (rowid, entry))
+        entries[cache_key] = entry
+
+    return [entries[cache_key] for cache_key, _ in keyed_rows if cache_key in entries]
+
   def _generate_cache_key(self, request: QuestionRequest, question_content: str = "") -> str:
     """Gera chave única para cache baseada nos parâmetros da solicitação"""
     key_data = {
@@ -36,23 +212,17 @@ class CacheManager:
     key_string = json.dumps(key_data, sort_keys=True)
     return hashlib.sha256(key_string.encode()).hexdigest()[:16]
 
-  def _parse_row(self, row):
-    try:
-      question_data = json.loads(row[1])
-      validation_data = json.loads(row[2])
+  @staticmethod
+  def _decode_entry(cache_key: str, question_data: str, validation_data: str, created_at: str) -> CacheEntry:
+    """Caminho rápido para dados gravados por nós: a linha inteira vira um único documento JSON,
+    decodificado e montado de uma vez pelo núcleo do pydantic (sem json.loads nem modelos intermediários).
 
-      q_kwargs = dict(question_data)
-      try:
-        question = Question(**q_kwargs)
-      except Exception:
-        if 'materia' in q_kwargs:
-          q_kwargs.pop('materia')
-        question = Question(**q_kwargs)
-
-      validation = ValidationResult(**validation_data)
-      return question, validation
-    except Exception:
-      return None, None
+    Linhas antigas/inconsistentes são normalizadas uma única vez pela migração normalize_legacy_rows.
+    """
+    return CacheEntry.model_validate_json(
+      f'{{"cache_key":{json.dumps(cache_key)},"created_at":{json.dumps(created_at)},'
+      f'"question":{question_data},"validation":{validation_data}}}'
+    )
 
   def _matches_request(self, question: Question, request: QuestionRequest) -> bool:
     if question.codigo != request.codigo:
@@ -66,49 +236,147 @@ class CacheManager:
   
   def get_cached_questions(self, request: QuestionRequest, limit: int = 10) -> List[CacheEntry]:
     """Busca questões em cache para a solicitação (versão simplificada)."""
-    entries: List[CacheEntry] = []
-    with sqlite3.connect(self.db_path) as conn:
-      cursor = conn.execute(
+    list_key = ("request", request.codigo, request.question_type.value, request.subject.value, limit)
+    with self.storage.connect() as conn:
+      version = self._read_data_version(conn, request.codigo)
+      cached = self._list_cache.get(list_key)
+      if cached is not None and cached[0] == version:
+        return list(cached[1])
+
+      # A janela é do próprio código: só escritas nele (versão por código) mudam o resultado
+      rows = conn.execute(
         """
-        SELECT cache_key, question_data, validation_data, created_at
+        SELECT cache_key, rowid
         FROM question_cache
+        WHERE codigo = ? AND duplicate_of IS NULL
         ORDER BY created_at DESC
         LIMIT ?
         """,
-        (max(50, limit * 3),),
-      )
-      rows = cursor.fetchall()
+        (request.codigo, max(50, limit * 3)),
+      ).fetchall()
+      candidates = self._load_entries(conn, rows)
 
-    for row in rows:
-      question, validation = self._parse_row(row)
-      if question is None:
-        continue
-      if not self._matches_request(question, request):
-        continue
-      entries.append(CacheEntry(cache_key=row[0], question=question, validation=validation, created_at=row[3]))
-
-    return entries
+    entries = [entry for entry in candidates if self._matches_request(entry.question, request)]
+    self._list_cache.put(list_key, (version, entries))
+    return list(entries)
   
-  def cache_question(self, request: QuestionRequest, question: Question, validation: ValidationResult) -> str:
-    """Armazena questão no cache"""
+  def _insert_question(
+    self,
+    conn,
+    request: QuestionRequest,
+    question: Question,
+    validation: ValidationResult,
+    conflict: str,
+    served: bool = False
+  ) -> Tuple[str, bool, Optional[int], str]:
+    """Grava a questão na conexão informada, sem commit; retorna (cache_key, inserida, rowid, created_at)"""
     cache_key = self._generate_cache_key(request, question.enunciado)
-    
-    question_data = question.model_dump_json()
-    validation_data = validation.model_dump_json()
+    question_hash = content_hash(question.enunciado)
     created_at = datetime.now().isoformat()
-    
-    with sqlite3.connect(self.db_path) as conn:
-      conn.execute("""
-        INSERT OR REPLACE INTO question_cache 
-        (cache_key, question_data, validation_data, created_at)
-        VALUES (?, ?, ?, ?)
-      """, (cache_key, question_data, validation_data, created_at))
+
+    if conflict == "REPLACE":
+      # Remove explicitamente as linhas substituídas para que os triggers de exclusão (versão, FTS) disparem
+      conn.execute("DELETE FROM question_cache WHERE cache_key = ? OR content_hash = ?", (cache_key, question_hash))
+    cursor = conn.execute("""
+      INSERT OR IGNORE INTO question_cache 
+      (cache_key, question_data, validation_data, created_at, codigo, subject, confidence_score, is_aligned, content_hash,
+       served_count, last_served_at)
+      VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (
+      cache_key, question.model_dump_json(), validation.model_dump_json(), created_at,
+      question.codigo, request.subject.value, validation.confidence_score, int(validation.is_aligned), question_hash,
+      int(served), created_at if served else None
+    ))
+    if cursor.rowcount > 0:
+      return cache_key, True, cursor.lastrowid, created_at
+
+    existing = conn.execute(
+      "SELECT cache_key FROM question_cache WHERE content_hash = ? OR cache_key = ?",
+      (question_hash, cache_key),
+    ).fetchone()
+    return (existing[0] if existing else cache_key), False, None, created_at
+
+  def store_questions(
+    self,
+    items: List[Tuple[QuestionRequest, Question, ValidationResult, str, bool]]
+  ) -> List[Tuple[str, bool]]:
+    """Grava várias questões (request, question, validation, conflito REPLACE/IGNORE, servida) em uma única transação"""
+    if not items:
+      return []
+    stored = []
+    with self.storage.connect() as conn:
+      for request, question, validation, conflict, served in items:
+        stored.append(self._insert_question(conn, request, question, validation, conflict, served))
       conn.commit()
-    
+
+    results = []
+    for (_, question, validation, _, _), (cache_key, inserted, rowid, created_at) in zip(items, stored):
+      if inserted:
+        # Já deixa a entrada decodificada em memória para a próxima leitura
+        entry = CacheEntry(cache_key=cache_key, question=question, validation=validation, created_at=created_at)
+        self._entry_cache.put(cache_key, (rowid, entry))
+      results.append((cache_key, inserted))
+    return results
+
+  def _store_question(
+    self,
+    request: QuestionRequest,
+    question: Question,
+    validation: ValidationResult,
+    conflict: str,
+    served: bool = False
+  ) -> Tuple[str, bool]:
+    """Grava a questão com a política de conflito REPLACE ou IGNORE; retorna (cache_key, inserida)"""
+    return self.store_questions([(request, question, validation, conflict, served)])[0]
+
+  def cache_question(self, request: QuestionRequest, question: Question, validation: ValidationResult, served: bool = False) -> str:
+    """Armazena questão no cache (substitui entrada com mesma chave ou mesmo conteúdo)"""
+    cache_key, _ = self._store_question(request, question, validation, "REPLACE", served)
     return cache_key
+
+  def insert_question_if_absent(
+    self,
+    request: QuestionRequest,
+    question: Question,
+    validation: ValidationResult,
+    served: bool = False
+  ) -> Tuple[str, bool]:
+    """Insere a questão apenas se o conteúdo ainda não existir (atômico entre processos).
+
+    Retorna (cache_key, inserida); em conflito, a chave é a da entrada já existente.
+    served=True registra a questão como já entregue a quem a gerou.
+    """
+    return self._store_question(request, question, validation, "IGNORE", served)
+
+  def has_content(self, enunciado: str) -> bool:
+    """Verifica por hash (índice único) se já existe questão com o mesmo enunciado normalizado"""
+    with self.storage.connect() as conn:
+      row = conn.execute(
+        "SELECT 1 FROM question_cache WHERE content_hash = ?",
+        (content_hash(enunciado),),
+      ).fetchone()
+    return row is not None
   
+  def get_keys_by_content(self, enunciados: List[str]) -> Dict[str, str]:
+    """Mapeia enunciado -> cache_key das questões já gravadas (busca pelo hash do conteúdo)"""
+    hashes = {content_hash(enunciado): enunciado for enunciado in enunciados}
+    digests = list(hashes)
+    keys: Dict[str, str] = {}
+    with self.storage.connect() as conn:
+      for start in range(0, len(digests), 500):
+        chunk = digests[start:start + 500]
+        for digest, cache_key in conn.execute(
+          f"SELECT content_hash, cache_key FROM question_cache WHERE content_hash IN ({','.join('?' * len(chunk))})",
+          chunk,
+        ):
+          keys[hashes[digest]] = cache_key
+    return keys
+
   def is_duplicate(self, request: QuestionRequest, new_question: Question, similarity_threshold: float = 0.8) -> bool:
     """Verifica se uma questão é muito similar a questões existentes"""
+    if self.has_content(new_question.enunciado):
+      return True
+
     cached_questions = self.get_cached_questions(request, limit=50)
     
     new_question_text = new_question.enunciado.lower()
@@ -135,98 +403,800 @@ class CacheManager:
   
   def clear_cache(self, older_than_days: int = 30):
     """Remove entradas antigas do cache"""
-    cutoff_date = datetime.now().replace(day=datetime.now().day - older_than_days).isoformat()
+    cutoff_date = (datetime.now() - timedelta(days=older_than_days)).isoformat()
     
-    with sqlite3.connect(self.db_path) as conn:
+    with self.storage.connect() as conn:
       cursor = conn.execute("DELETE FROM question_cache WHERE created_at < ?", (cutoff_date,))
       deleted_count = cursor.rowcount
       conn.commit()
     
     return deleted_count
-  
+
+  def mark_served(self, cache_keys: List[str]) -> int:
+    """Registra que as questões foram entregues a um usuário (usado na política de descarte)"""
+    if not cache_keys:
+      return 0
+    now = datetime.now().isoformat()
+    with self.storage.connect() as conn:
+      cursor = conn.executemany(
+        "UPDATE question_cache SET served_count = served_count + 1, last_served_at = ? WHERE cache_key = ?",
+        [(now, key) for key in cache_keys],
+      )
+      conn.commit()
+    return cursor.rowcount
+
+  def count_unserved(self, codigos: Optional[List[str]] = None) -> Dict[str, int]:
+    """Estoque por código: questões validadas (alinhadas) ainda não entregues a ninguém"""
+    sql = f"SELECT codigo, COUNT(*) FROM question_cache WHERE {_STOCK_SQL}"
+    params: list = []
+    if codigos:
+      sql += f" AND codigo IN ({','.join('?' * len(codigos))})"
+      params = list(codigos)
+    with self.storage.connect() as conn:
+      return dict(conn.execute(sql + " GROUP BY codigo", params).fetchall())
+
+  def take_unserved(self, request: QuestionRequest, n: int, owner: str, lease_seconds: int = 300) -> List[CacheEntry]:
+    """Retira até n questões do estoque do código para o owner.
+
+    Marca como servidas e registra o lease na mesma transação, como lease_questions, para que
+    sessões concorrentes não recebam a mesma questão logo em seguida.
+    """
+    if n <= 0:
+      return []
+    now = datetime.now()
+    with self.storage.connect() as conn:
+      rows = conn.execute(
+        f"""
+        UPDATE question_cache SET served_count = served_count + 1, last_served_at = ?
+        WHERE rowid IN (
+          SELECT rowid FROM question_cache
+          WHERE {_STOCK_SQL} AND codigo = ? AND json_extract(question_data, '$.question_type') = ?
+          ORDER BY confidence_score DESC, created_at
+          LIMIT ?
+        )
+        RETURNING cache_key, rowid, confidence_score, created_at
+        """,
+        (now.isoformat(), request.codigo, request.question_type.value, n),
+      ).fetchall()
+      self._record_leases(conn, [row[0] for row in rows], owner, now + timedelta(seconds=lease_seconds))
+      conn.commit()
+      rows.sort(key=lambda row: (-(row[2] or 0), row[3]))
+      return self._load_entries(conn, [(cache_key, rowid) for cache_key, rowid, _, _ in rows])
+
+  def lease_questions(self, request: QuestionRequest, n: int, owner: str, lease_seconds: int = 300) -> List[CacheEntry]:
+    """Entrega até n questões distintas do código, com lease curto para o owner.
+
+    Prioriza as menos servidas, depois maior confiança e mais recentes. Questões com lease ativo
+    (ou já entregues ao mesmo owner) ficam de fora, então sessões concorrentes recebem conjuntos disjuntos.
+    """
+    if n <= 0:
+      return []
+    now = datetime.now()
+    with self.storage.connect() as conn:
+      now_iso = now.isoformat()
+      rows = conn.execute(
+        """
+        UPDATE question_cache SET served_count = served_count + 1, last_served_at = ?
+        WHERE rowid IN (
+          SELECT rowid FROM question_cache
+          WHERE codigo = ? AND json_extract(question_data, '$.question_type') = ?
+            AND is_aligned = 1 AND duplicate_of IS NULL
+            AND NOT EXISTS (
+              SELECT 1 FROM question_lease
+              WHERE question_lease.cache_key = question_cache.cache_key
+                AND (question_lease.owner = ? OR question_lease.leased_until > ?)
+            )
+          ORDER BY served_count, confidence_score DESC, created_at DESC
+          LIMIT ?
+        )
+        RETURNING cache_key, rowid, served_count, confidence_score, created_at
+        """,
+        (now_iso, request.codigo, request.question_type.value, owner, now_iso, n),
+      ).fetchall()
+      # Mesma transação do UPDATE: nenhuma outra sessão vê as questões entregues sem o lease
+      self._record_leases(conn, [row[0] for row in rows], owner, now + timedelta(seconds=lease_seconds))
+      conn.commit()
+      # RETURNING não garante ordem: reaplica o ranking (menos servidas, maior confiança, mais recentes)
+      rows.sort(key=lambda row: row[4], reverse=True)
+      rows.sort(key=lambda row: (row[2], -(row[3] or 0)))
+      return self._load_entries(conn, [(row[0], row[1]) for row in rows])
+
+  def _record_leases(self, conn, cache_keys: List[str], owner: str, leased_until: datetime):
+    """Grava (ou renova) o lease de cada questão para o owner, sem commit"""
+    conn.executemany(
+      """
+      INSERT INTO question_lease (cache_key, owner, leased_until) VALUES (?, ?, ?)
+      ON CONFLICT (cache_key, owner) DO UPDATE SET leased_until = excluded.leased_until
+      """,
+      [(cache_key, owner, leased_until.isoformat()) for cache_key in cache_keys],
+    )
+
+  def return_unused(self, cache_keys: List[str], owner: str) -> int:
+    """Devolve questões retiradas (estoque ou lease) que o owner acabou não usando (ex.: geração cancelada).
+
+    Desfaz a entrega no mesmo UPDATE: a contagem volta um passo (estoque volta a ser inédito) e o lease
+    do owner é apagado, então a questão pode ser entregue de novo, inclusive a ele.
+    """
+    if not cache_keys:
+      return 0
+    placeholders = ",".join("?" * len(cache_keys))
+    with self.storage.connect() as conn:
+      cursor = conn.execute(
+        f"""
+        UPDATE question_cache SET
+          served_count = MAX(served_count - 1, 0),
+          last_served_at = CASE WHEN served_count <= 1 THEN NULL ELSE last_served_at END
+        WHERE cache_key IN ({placeholders}) AND served_count > 0
+        """,
+        list(cache_keys),
+      )
+      conn.execute(f"DELETE FROM question_lease WHERE owner = ? AND cache_key IN ({placeholders})", [owner, *cache_keys])
+      conn.commit()
+    return cursor.rowcount
+
+  def release_leases(self, owner: str) -> int:
+    """Libera antes do prazo os leases ativos do owner (a contagem de entregas e o histórico do owner são mantidos)"""
+    now = datetime.now().isoformat()
+    with self.storage.connect() as conn:
+      cursor = conn.execute(
+        "UPDATE question_lease SET leased_until = ? WHERE owner = ? AND leased_until > ?", (now, owner, now)
+      )
+      conn.commit()
+    return cursor.rowcount
+
+  def _archive_dictionary(self, conn, samples: List[str]) -> Tuple[int, bytes]:
+    """Dicionário de compressão atual do arquivo (criado a partir das amostras na primeira vez)"""
+    row = conn.execute("SELECT dict_id, data FROM archive_dictionary ORDER BY dict_id DESC LIMIT 1").fetchone()
+    if row is None:
+      data = build_dictionary(samples)
+      dict_id = conn.execute(
+        "INSERT INTO archive_dictionary (data, created_at) VALUES (?, ?)", (data, datetime.now().isoformat())
+      ).lastrowid
+      row = (dict_id, data)
+    self._archive_dictionaries[row[0]] = row[1]
+    return row[0], row[1]
+
+  def _load_archive_dictionary(self, conn, dict_id: Optional[int]) -> bytes:
+    if dict_id is None:
+      return b""
+    if dict_id not in self._archive_dictionaries:
+      row = conn.execute("SELECT data FROM archive_dictionary WHERE dict_id = ?", (dict_id,)).fetchone()
+      self._archive_dictionaries[dict_id] = row[0] if row else b""
+    return self._archive_dictionaries[dict_id]
+
+  def _archive_batch(self, conn, older_than_days: Optional[int], unserved_older_than_days: Optional[int], batch_size: int) -> int:
+    """Move até batch_size linhas antigas (ou nunca entregues) para o arquivo comprimido, sem commit"""
+    now = datetime.now()
+    conditions, params = [], []
+    if older_than_days is not None:
+      conditions.append("created_at < ?")
+      params.append((now - timedelta(days=older_than_days)).isoformat())
+    if unserved_older_than_days is not None:
+      conditions.append("(served_count = 0 AND created_at < ?)")
+      params.append((now - timedelta(days=unserved_older_than_days)).isoformat())
+    if not conditions:
+      return 0
+
+    rows = conn.execute(
+      f"""
+      {_ARCHIVE_SOURCE_SQL}
+      WHERE ({" OR ".join(conditions)}) AND NOT EXISTS (
+        SELECT 1 FROM question_lease
+        WHERE question_lease.cache_key = question_cache.cache_key AND question_lease.leased_until > ?
+      )
+      ORDER BY created_at
+      LIMIT ?
+      """,
+      (*params, now.isoformat(), batch_size),
+    ).fetchall()
+    return self._move_to_archive(conn, rows)
+
+  def _move_to_archive(self, conn, rows) -> int:
+    """Comprime as linhas (no formato de _ARCHIVE_SOURCE_SQL) no arquivo e as remove do cache, sem commit"""
+    if not rows:
+      return 0
+    payloads = [f'{{"question":{row[9]},"validation":{row[10]}}}' for row in rows]
+    dict_id, dictionary = self._archive_dictionary(conn, payloads)
+    archived_at = datetime.now().isoformat()
+    conn.executemany(
+      """
+      INSERT INTO question_archive
+      (cache_key, codigo, subject, confidence_score, is_aligned, content_hash, served_count, created_at, archived_at, dict_id, payload)
+      VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+      """,
+      [(*row[1:9], archived_at, dict_id, compress_payload(payload, dictionary)) for row, payload in zip(rows, payloads)],
+    )
+    rowids = [row[0] for row in rows]
+    conn.execute(f"DELETE FROM question_cache WHERE rowid IN ({','.join('?' * len(rowids))})", rowids)
+    for row in rows:
+      self._entry_cache.pop(row[1])
+    return len(rows)
+
+  def _evict_rows(self, conn, rowids: List[int], archive: bool) -> int:
+    """Tira as linhas do cache: arquiva (arquivo frio ativo) ou apaga; sem commit"""
+    if not rowids:
+      return 0
+    placeholders = ",".join("?" * len(rowids))
+    if archive:
+      return self._move_to_archive(conn, conn.execute(f"{_ARCHIVE_SOURCE_SQL} WHERE rowid IN ({placeholders})", rowids).fetchall())
+    return conn.execute(f"DELETE FROM question_cache WHERE rowid IN ({placeholders})", rowids).rowcount
+
+  def archive_entries(
+    self,
+    older_than_days: Optional[int] = None,
+    unserved_older_than_days: Optional[int] = None,
+    batch_size: int = 500
+  ) -> int:
+    """Arquiva (comprimido) entradas antigas ou nunca entregues; retorna quantas foram movidas"""
+    archived = 0
+    while True:
+      with self.storage.connect() as conn:
+        moved = self._archive_batch(conn, older_than_days, unserved_older_than_days, batch_size)
+        conn.commit()
+      archived += moved
+      if moved < batch_size:
+        return archived
+
+  def list_archived(self, codigo: Optional[str] = None, limit: int = 100) -> List[CacheEntry]:
+    """Lista entradas arquivadas (mais recentes primeiro), opcionalmente de um código"""
+    where, params = ("WHERE codigo = ?", [codigo]) if codigo else ("", [])
+    with self.storage.connect() as conn:
+      rows = conn.execute(
+        f"""
+        SELECT cache_key, created_at, dict_id, payload FROM question_archive {where}
+        ORDER BY created_at DESC, archive_id DESC
+        LIMIT ?
+        """,
+        (*params, limit),
+      ).fetchall()
+      entries = []
+      for cache_key, created_at, dict_id, payload in rows:
+        entry = self._decode_archived(conn, cache_key, created_at, dict_id, payload)
+        if entry is not None:
+          entries.append(entry)
+    return entries
+
+  def _decode_archived(self, conn, cache_key: str, created_at: str, dict_id: Optional[int], payload: bytes) -> Optional[CacheEntry]:
+    """Descomprime uma entrada do arquivo; None (registrado no log) se ela estiver ilegível"""
+    try:
+      document = decompress_payload(payload, self._load_archive_dictionary(conn, dict_id))
+      return CacheEntry.model_validate_json(
+        f'{{"cache_key":{json.dumps(cache_key)},"created_at":{json.dumps(created_at)},{document[1:]}'
+      )
+    except (ValidationError, zlib.error, UnicodeDecodeError) as e:
+      logger.warning("Entrada %s do arquivo ilegível, ignorada: %s", cache_key, e)
+      return None
+
+  def count_archived(self, codigo: Optional[str] = None) -> int:
+    where, params = ("WHERE codigo = ?", (codigo,)) if codigo else ("", ())
+    with self.storage.connect() as conn:
+      return conn.execute(f"SELECT COUNT(*) FROM question_archive {where}", params).fetchone()[0]
+
+  def restore_archived(self, cache_keys: List[str]) -> int:
+    """Devolve entradas arquivadas ao cache; conteúdo já presente no cache não é duplicado"""
+    keys = list(dict.fromkeys(cache_keys))
+    restored = 0
+    with self.storage.connect() as conn:
+      for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        placeholders = ",".join("?" * len(chunk))
+        rows = conn.execute(
+          f"""
+          SELECT cache_key, codigo, subject, confidence_score, is_aligned, served_count, created_at, dict_id, payload
+          FROM question_archive WHERE cache_key IN ({placeholders})
+          """,
+          chunk,
+        ).fetchall()
+        readable = []
+        for cache_key, codigo, subject, confidence, is_aligned, served_count, created_at, dict_id, payload in rows:
+          entry = self._decode_archived(conn, cache_key, created_at, dict_id, payload)
+          if entry is None:
+            # Fica no arquivo (não é restaurada nem perdida)
+            continue
+          readable.append(cache_key)
+          restored += conn.execute(
+            """
+            INSERT OR IGNORE INTO question_cache
+            (cache_key, question_data, validation_data, created_at, codigo, subject, confidence_score, is_aligned, content_hash,
+             served_count)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+              cache_key, entry.question.model_dump_json(), entry.validation.model_dump_json(), created_at,
+              codigo, subject, confidence, is_aligned, content_hash(entry.question.enunciado), served_count,
+            ),
+          ).rowcount
+        if readable:
+          conn.execute(f"DELETE FROM question_archive WHERE cache_key IN ({','.join('?' * len(readable))})", readable)
+      conn.commit()
+    return restored
+
+  def run_maintenance(self, batch_size: int = 500, vacuum_pages: int = 1000) -> dict:
+    """Executa um passo limitado de arquivamento, retenção (TTL, limite por código, limite total) e compactação.
+
+    Cada etapa move/remove no máximo batch_size linhas; chame repetidamente até "archived" e "evicted" serem 0.
+    Com o arquivo frio ativo, as linhas descartadas pela retenção são arquivadas em vez de apagadas.
+    """
+    policy = self.retention
+    archive = policy.archive_enabled
+    report = {"archived": 0, "ttl": 0, "per_codigo": 0, "total": 0, "evicted": 0}
+    with self.storage.connect() as conn:
+      # Arquiva antes do descarte: o que seria apagado por idade fica guardado comprimido
+      report["archived"] = self._archive_batch(conn, policy.archive_after_days, policy.archive_unserved_after_days, batch_size)
+      if policy.ttl_days is not None:
+        cutoff_date = (datetime.now() - timedelta(days=policy.ttl_days)).isoformat()
+        rowids = [row[0] for row in conn.execute(
+          "SELECT rowid FROM question_cache WHERE created_at < ? ORDER BY created_at LIMIT ?",
+          (cutoff_date, batch_size),
+        )]
+        report["ttl"] = self._evict_rows(conn, rowids, archive)
+
+      if policy.max_rows_per_codigo is not None:
+        rowids = [row[0] for row in conn.execute(
+          f"""
+          SELECT row_id FROM (
+            SELECT rowid AS row_id, duplicate_of, confidence_score, served_count, created_at,
+              ROW_NUMBER() OVER (
+                PARTITION BY codigo
+                ORDER BY (duplicate_of IS NULL) DESC, (served_count = 0) DESC, confidence_score DESC, created_at DESC
+              ) AS position
+            FROM question_cache
+          )
+          WHERE position > ?
+          ORDER BY {_EVICTION_ORDER_SQL}
+          LIMIT ?
+          """,
+          (policy.max_rows_per_codigo, batch_size),
+        )]
+        report["per_codigo"] = self._evict_rows(conn, rowids, archive)
+
+      if policy.max_total_rows is not None:
+        total = conn.execute("SELECT COUNT(*) FROM question_cache").fetchone()[0]
+        excess = min(total - policy.max_total_rows, batch_size)
+        if excess > 0:
+          rowids = [row[0] for row in conn.execute(
+            f"SELECT rowid FROM question_cache ORDER BY {_EVICTION_ORDER_SQL} LIMIT ?", (excess,)
+          )]
+          report["total"] = self._evict_rows(conn, rowids, archive)
+      # Histórico de leases só precisa durar uma sessão
+      conn.execute(
+        "DELETE FROM question_lease WHERE leased_until < ?",
+        ((datetime.now() - timedelta(days=_LEASE_HISTORY_DAYS)).isoformat(),),
+      )
+      conn.commit()
+
+      report["evicted"] = report["ttl"] + report["per_codigo"] + report["total"]
+      # Devolve ao sistema de arquivos as páginas livres, em passos pequenos
+      conn.execute(f"PRAGMA incremental_vacuum({int(vacuum_pages)})").fetchall()
+    return report
+
+  def claim_worker_lease(self, name: str, owner: str, lease_seconds: float) -> bool:
+    """Assume ou renova o lease da tarefa de fundo se estiver livre, vencido ou já for do owner (UPSERT atômico)"""
+    now = datetime.now()
+    with self.storage.connect() as conn:
+      cursor = conn.execute(
+        """
+        INSERT INTO worker_lease (name, owner, expires_at) VALUES (?, ?, ?)
+        ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+        WHERE worker_lease.owner = excluded.owner OR worker_lease.expires_at < ?
+        """,
+        (name, owner, (now + timedelta(seconds=lease_seconds)).isoformat(), now.isoformat()),
+      )
+      conn.commit()
+    return cursor.rowcount > 0
+
+  def release_worker_lease(self, name: str, owner: str):
+    with self.storage.connect() as conn:
+      conn.execute("DELETE FROM worker_lease WHERE name = ? AND owner = ?", (name, owner))
+      conn.commit()
+
+  def start_maintenance(self, interval_seconds: float = 600.0, pause_seconds: float = 1.0):
+    """Inicia thread de baixa prioridade que aplica a retenção em passos incrementais.
+
+    Com vários processos no mesmo banco, só o eleito (lease "maintenance") executa; os demais
+    conferem a cada intervalo e assumem se o lease vencer.
+    """
+    if self._maintenance_thread is not None and self._maintenance_thread.is_alive():
+      return
+    self._maintenance_stop.clear()
+    owner = uuid.uuid4().hex
+    # O lease precisa sobreviver à espera entre rodadas do eleito
+    lease_seconds = 2 * interval_seconds + 60
+
+    def loop():
+      while not self._maintenance_stop.is_set():
+        report = {"archived": 0, "evicted": 0}
+        try:
+          if self.claim_worker_lease("maintenance", owner, lease_seconds):
+            report = self.run_maintenance()
+        except Exception:
+          # Falha de um passo não derruba a thread; o traceback fica no log
+          logger.exception("Erro na manutenção do cache")
+        # Continua em passos curtos enquanto houver o que mover ou remover; depois aguarda o intervalo
+        busy = report["archived"] or report["evicted"]
+        self._maintenance_stop.wait(pause_seconds if busy else interval_seconds)
+      try:
+        self.release_worker_lease("maintenance", owner)
+      except Exception:
+        logger.exception("Erro ao liberar a manutenção do cache")
+
+    self._maintenance_thread = threading.Thread(target=loop, name="cache-maintenance", daemon=True)
+    self._maintenance_thread.start()
+
+  def stop_maintenance(self):
+    """Interrompe a thread de manutenção (liberando o lease para outro processo), se estiver ativa"""
+    self._maintenance_stop.set()
+    if self._maintenance_thread is not None:
+      self._maintenance_thread.join(timeout=5)
+      self._maintenance_thread = None
+
   def get_cache_stats(self) -> dict:
-    """Retorna estatísticas do cache"""
-    with sqlite3.connect(self.db_path) as conn:
-      cursor = conn.execute("SELECT COUNT(*) FROM question_cache")
-      total_entries = cursor.fetchone()[0]
-      
-      cursor = conn.execute("""
-        SELECT 
-          COUNT(*) as count,
-          substr(cache_key, 1, 10) as key_prefix
-        FROM question_cache 
-        GROUP BY substr(cache_key, 1, 10)
-        ORDER BY count DESC
-        LIMIT 10
-      """)
-      top_keys = cursor.fetchall()
+    """Retorna estatísticas do cache (agregações SQL sobre colunas indexadas)"""
+    with self.storage.connect() as conn:
+      total_entries, high_confidence, unique_codes, latest_created_at = conn.execute("""
+        SELECT
+          COUNT(*),
+          COUNT(CASE WHEN confidence_score >= 0.8 THEN 1 END),
+          COUNT(DISTINCT codigo),
+          MAX(created_at)
+        FROM question_cache
+        WHERE duplicate_of IS NULL
+      """).fetchone()
+
+      def grouped(column_sql: str) -> Dict[str, int]:
+        cursor = conn.execute(f"""
+          SELECT {column_sql} AS grupo, COUNT(*)
+          FROM question_cache
+          WHERE duplicate_of IS NULL
+          GROUP BY grupo
+          ORDER BY COUNT(*) DESC
+        """)
+        return {row[0]: row[1] for row in cursor if row[0] is not None}
+
+      by_subject = grouped("subject")
+      by_codigo = grouped("codigo")
+      by_confidence_band = grouped(_CONFIDENCE_BAND_SQL)
+      archived_entries = conn.execute("SELECT COUNT(*) FROM question_archive").fetchone()[0]
     
     return {
       "total_entries": total_entries,
-      "top_cached_patterns": [{"pattern": row[1], "count": row[0]} for row in top_keys]
+      "high_confidence": high_confidence,
+      "unique_codes": unique_codes,
+      "latest_created_at": latest_created_at,
+      "by_subject": by_subject,
+      "by_codigo": by_codigo,
+      "by_confidence_band": by_confidence_band,
+      "archived_entries": archived_entries
     }
-  
+
+  def _build_filters(self, filters: Optional[dict]) -> Tuple[List[str], list]:
+    """Converte filtros (codigo, subject, date_from, date_to, min_confidence, max_confidence, is_aligned) em SQL"""
+    filters = filters or {}
+    conditions = ["duplicate_of IS NULL"]
+    params: list = []
+    if filters.get("codigo"):
+      codigos = filters["codigo"]
+      if isinstance(codigos, str):
+        codigos = [codigos]
+      conditions.append(f"codigo IN ({','.join('?' * len(codigos))})")
+      params.extend(codigos)
+    if filters.get("subject"):
+      subject = filters["subject"]
+      conditions.append("subject = ?")
+      params.append(subject.value if hasattr(subject, "value") else subject)
+    if filters.get("date_from"):
+      conditions.append("created_at >= ?")
+      params.append(str(filters["date_from"]))
+    if filters.get("date_to"):
+      # date_to inclusivo: uma data sem horário cobre o dia inteiro
+      date_to = str(filters["date_to"])
+      if len(date_to) == 10:
+        conditions.append("created_at < ?")
+        params.append((date.fromisoformat(date_to) + timedelta(days=1)).isoformat())
+      else:
+        conditions.append("created_at <= ?")
+        params.append(date_to)
+    if filters.get("min_confidence") is not None:
+      conditions.append("confidence_score >= ?")
+      params.append(float(filters["min_confidence"]))
+    if filters.get("max_confidence") is not None:
+      conditions.append("confidence_score <= ?")
+      params.append(float(filters["max_confidence"]))
+    if filters.get("is_aligned") is not None:
+      conditions.append("is_aligned = ?")
+      params.append(int(bool(filters["is_aligned"])))
+    return conditions, params
+
+  def cache_keys_page(self, filters: Optional[dict] = None, after: Optional[str] = None, limit: int = 5000) -> List[Tuple[str, str]]:
+    """Uma página de (cache_key, codigo) das entradas que atendem aos filtros, após a chave informada"""
+    conditions, params = self._build_filters(filters)
+    if after is not None:
+      conditions.append("cache_key > ?")
+      params.append(after)
+    with self.storage.connect() as conn:
+      rows = conn.execute(
+        f"""
+        SELECT cache_key, codigo FROM question_cache
+        WHERE {" AND ".join(conditions)}
+        ORDER BY cache_key
+        LIMIT ?
+        """,
+        (*params, limit),
+      ).fetchall()
+    return [(row[0], row[1]) for row in rows]
+
+  def filter_keys(self, cache_keys: List[str], filters: Optional[dict] = None) -> set:
+    """Subconjunto das chaves informadas que atende aos filtros (uma consulta por lote de chaves)"""
+    conditions, params = self._build_filters(filters)
+    keys = list(dict.fromkeys(cache_keys))
+    matched = set()
+    with self.storage.connect() as conn:
+      for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        matched.update(row[0] for row in conn.execute(
+          f"SELECT cache_key FROM question_cache WHERE {' AND '.join(conditions)} "
+          f"AND cache_key IN ({','.join('?' * len(chunk))})",
+          (*params, *chunk),
+        ))
+    return matched
+
+  def count_cache_entries(self, filters: Optional[dict] = None) -> int:
+    """Conta as entradas que atendem aos filtros"""
+    conditions, params = self._build_filters(filters)
+    with self.storage.connect() as conn:
+      return conn.execute(
+        f"SELECT COUNT(*) FROM question_cache WHERE {' AND '.join(conditions)}",
+        params,
+      ).fetchone()[0]
+
   def get_all_cache_entries(self) -> List[CacheEntry]:
     """Retorna todas as entradas do cache"""
-    with sqlite3.connect(self.db_path) as conn:
-      cursor = conn.execute("""
-        SELECT cache_key, question_data, validation_data, created_at
+    with self.storage.connect() as conn:
+      version = self._read_data_version(conn)
+      cached = self._list_cache.get(("all",))
+      if cached is not None and cached[0] == version:
+        return list(cached[1])
+
+      rows = conn.execute("""
+        SELECT cache_key, rowid
         FROM question_cache 
-        ORDER BY created_at DESC
+        WHERE duplicate_of IS NULL
+        ORDER BY created_at DESC, cache_key DESC
+      """).fetchall()
+      entries = self._load_entries(conn, rows)
+
+    self._list_cache.put(("all",), (version, entries))
+    return list(entries)
+
+  def search_questions(self, query: str, limit: int = 20, filters: Optional[dict] = None) -> List[CacheEntry]:
+    """Busca textual no enunciado e nas opções, ordenada por relevância (bm25)"""
+    fts_query = self._fts_query(query)
+    if not fts_query:
+      return []
+    conditions, params = self._build_filters(filters)
+
+    with self.storage.connect() as conn:
+      if self._fts_enabled:
+        rows = conn.execute(
+          f"""
+          SELECT question_cache.cache_key, question_cache.rowid
+          FROM question_fts
+          JOIN question_cache ON question_cache.rowid = question_fts.rowid
+          WHERE question_fts MATCH ? AND {" AND ".join(conditions)}
+          ORDER BY bm25(question_fts)
+          LIMIT ?
+          """,
+          (fts_query, *params, limit),
+        ).fetchall()
+      else:
+        like_conditions = ["json_extract(question_data, '$.enunciado') LIKE ?" for _ in query.split()]
+        rows = conn.execute(
+          f"""
+          SELECT cache_key, rowid
+          FROM question_cache
+          WHERE {" AND ".join(conditions + like_conditions)}
+          ORDER BY created_at DESC
+          LIMIT ?
+          """,
+          (*params, *[f"%{term}%" for term in query.split()], limit),
+        ).fetchall()
+      return self._load_entries(conn, rows)
+
+  def list_cache_entries(
+    self,
+    after: Optional[Tuple] = None,
+    limit: int = 20,
+    filters: Optional[dict] = None,
+    order_by: str = "created_at",
+    descending: bool = True
+  ) -> Tuple[List[CacheEntry], Optional[Tuple]]:
+    """Lista uma página do cache com paginação por cursor (valor da ordenação, cache_key).
+
+    Filtros e ordenação são aplicados no SQL (ver _build_filters e _SORT_COLUMNS).
+    Retorna as entradas e o cursor da próxima página (None quando não há mais itens).
+    """
+    if order_by not in _SORT_COLUMNS:
+      raise ValueError(f"Ordenação não suportada: {order_by}")
+    column = _SORT_COLUMNS[order_by]
+    direction = "DESC" if descending else "ASC"
+
+    conditions, params = self._build_filters(filters)
+    if after is not None:
+      conditions.append(f"({column}, cache_key) {'<' if descending else '>'} (?, ?)")
+      params.extend(after)
+
+    with self.storage.connect() as conn:
+      rows = conn.execute(
+        f"""
+        SELECT cache_key, rowid, {column}
+        FROM question_cache
+        WHERE {" AND ".join(conditions)}
+        ORDER BY {column} {direction}, cache_key {direction}
+        LIMIT ?
+        """,
+        (*params, limit + 1),
+      ).fetchall()
+      page = rows[:limit]
+      entries = self._load_entries(conn, [(row[0], row[1]) for row in page])
+
+    next_cursor = (page[-1][2], page[-1][0]) if len(rows) > limit else None
+    return entries, next_cursor
+
+  @staticmethod
+  def _export_row(row) -> dict:
+    return {
+      "cache_key": row[0],
+      "codigo": row[1],
+      "materia": row[2],
+      "enunciado": row[3],
+      "alternativas": [option for option in row[4:8] if option is not None],
+      "gabarito": row[8],
+      "confidence_score": row[9],
+      "is_aligned": bool(row[10]),
+      "created_at": row[11],
+    }
+
+  _EXPORT_SELECT_SQL = """
+    SELECT cache_key, codigo, json_extract(question_data, '$.materia'), json_extract(question_data, '$.enunciado'),
+      json_extract(question_data, '$.opcoes[0]'), json_extract(question_data, '$.opcoes[1]'),
+      json_extract(question_data, '$.opcoes[2]'), json_extract(question_data, '$.opcoes[3]'),
+      json_extract(question_data, '$.gabarito'), confidence_score, is_aligned, created_at
+    FROM question_cache
+  """
+
+  def export_rows_page(
+    self, filters: Optional[dict] = None, cursor: Optional[Tuple[str, str]] = None, limit: int = 1000
+  ) -> List[dict]:
+    """Uma página de linhas de exportação (mais recentes primeiro) após o cursor (created_at, cache_key).
+
+    Os campos vêm extraídos no SQL, sem decodificar os modelos pydantic.
+    """
+    conditions, params = self._build_filters(filters)
+    if cursor is not None:
+      conditions.append("(created_at, cache_key) < (?, ?)")
+      params.extend(cursor)
+    with self.storage.connect() as conn:
+      rows = conn.execute(
+        f"""{self._EXPORT_SELECT_SQL}
+        WHERE {" AND ".join(conditions)}
+        ORDER BY created_at DESC, cache_key DESC
+        LIMIT ?
+        """,
+        (*params, limit),
+      ).fetchall()
+    return [self._export_row(row) for row in rows]
+
+  def export_rows_for_keys(self, cache_keys: List[str], filters: Optional[dict] = None) -> List[dict]:
+    """Linhas de exportação das chaves informadas (na ordem pedida; chaves inexistentes são ignoradas)"""
+    conditions, params = self._build_filters(filters)
+    keys = list(dict.fromkeys(cache_keys))
+    by_key = {}
+    with self.storage.connect() as conn:
+      for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        for row in conn.execute(
+          f"{self._EXPORT_SELECT_SQL} WHERE {' AND '.join(conditions)} AND cache_key IN ({','.join('?' * len(chunk))})",
+          (*params, *chunk),
+        ):
+          by_key[row[0]] = row
+    return [self._export_row(by_key[key]) for key in keys if key in by_key]
+
+  def get_dedupe_candidates(self) -> Dict[str, List[Tuple[str, str, float, str]]]:
+    """Agrupa por código as questões ativas como (cache_key, enunciado, confiança, created_at)"""
+    candidates: Dict[str, List[Tuple[str, str, float, str]]] = {}
+    with self.storage.connect() as conn:
+      cursor = conn.execute("""
+        SELECT
+          cache_key,
+          codigo,
+          json_extract(question_data, '$.enunciado'),
+          confidence_score,
+          created_at
+        FROM question_cache
+        WHERE duplicate_of IS NULL AND json_valid(question_data)
       """)
-      
-      entries = []
-      for row in cursor.fetchall():
-        try:
-          question_data = json.loads(row[1])
-          validation_data = json.loads(row[2])
-          
-          question = Question(**question_data)
-          validation = ValidationResult(**validation_data)
-          
-          entry = CacheEntry(
-            cache_key=row[0],
-            question=question,
-            validation=validation,
-            created_at=row[3]
-          )
-          entries.append(entry)
-        except Exception:
-          # Se houver erro ao deserializar, ignora entrada
+      for cache_key, codigo, enunciado, confidence, created_at in cursor:
+        if not codigo or not enunciado:
           continue
-      
-      return entries
+        candidates.setdefault(codigo, []).append((cache_key, enunciado, float(confidence or 0.0), created_at))
+    return candidates
+
+  def resolve_duplicates(self, clusters: Dict[str, List[str]], delete: bool = False) -> int:
+    """Marca (ou remove) as duplicatas de cada representante em uma única transação"""
+    pairs = [(representative, key) for representative, keys in clusters.items() for key in keys if key != representative]
+    if not pairs:
+      return 0
+    with self.storage.connect() as conn:
+      if delete:
+        cursor = conn.executemany("DELETE FROM question_cache WHERE cache_key = ?", [(key,) for _, key in pairs])
+      else:
+        cursor = conn.executemany("UPDATE question_cache SET duplicate_of = ? WHERE cache_key = ?", pairs)
+      affected = cursor.rowcount
+      conn.commit()
+    return affected
+
+  def get_entries_by_keys(self, cache_keys: List[str]) -> List[CacheEntry]:
+    """Busca várias entradas pela chave primária (na ordem pedida; chaves inexistentes são ignoradas)"""
+    keys = list(dict.fromkeys(cache_keys))
+    rowids: Dict[str, int] = {}
+    with self.storage.connect() as conn:
+      for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        rowids.update(conn.execute(
+          f"SELECT cache_key, rowid FROM question_cache WHERE cache_key IN ({','.join('?' * len(chunk))})",
+          chunk,
+        ).fetchall())
+      return self._load_entries(conn, [(key, rowids[key]) for key in keys if key in rowids])
+
+  def delete_by_keys(self, cache_keys: List[str]) -> int:
+    """Remove várias entradas em uma única transação; retorna quantas foram removidas"""
+    keys = list(dict.fromkeys(cache_keys))
+    deleted = 0
+    with self.storage.connect() as conn:
+      for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        deleted += conn.execute(
+          f"DELETE FROM question_cache WHERE cache_key IN ({','.join('?' * len(chunk))})", chunk
+        ).rowcount
+      conn.commit()
+    for key in keys:
+      self._entry_cache.pop(key)
+    return deleted
 
   def remove_by_key(self, cache_key: str) -> bool:
     """Remove uma entrada específica do cache por chave"""
     try:
-      with sqlite3.connect(self.db_path) as conn:
+      with self.storage.connect() as conn:
         cursor = conn.execute("DELETE FROM question_cache WHERE cache_key = ?", (cache_key,))
         conn.commit()
-        return cursor.rowcount > 0
+      self._entry_cache.pop(cache_key)
+      return cursor.rowcount > 0
     except Exception as e:
       print(f"Erro ao remover entrada do cache: {e}")
       return False
 
+  def remove_questions_by_content(self, question_contents: List[str]) -> int:
+    """Remove várias questões pelo conteúdo do enunciado (hash normalizado) em uma única transação"""
+    hashes = list(dict.fromkeys(content_hash(content) for content in question_contents))
+    keys_to_remove: List[str] = []
+    deleted = 0
+    with self.storage.connect() as conn:
+      for start in range(0, len(hashes), 500):
+        chunk = hashes[start:start + 500]
+        placeholders = ",".join("?" * len(chunk))
+        keys_to_remove.extend(
+          row[0] for row in conn.execute(f"SELECT cache_key FROM question_cache WHERE content_hash IN ({placeholders})", chunk)
+        )
+        deleted += conn.execute(f"DELETE FROM question_cache WHERE content_hash IN ({placeholders})", chunk).rowcount
+      conn.commit()
+    for key in keys_to_remove:
+      self._entry_cache.pop(key)
+    return deleted
+
   def remove_question_by_content(self, question_content: str) -> bool:
     """Remove questão do cache baseado no conteúdo do enunciado"""
     try:
-      with sqlite3.connect(self.db_path) as conn:
-        cursor = conn.execute("SELECT cache_key, question_data FROM question_cache")
-        keys_to_remove = []
-        for row in cursor.fetchall():
-          try:
-            question_data = json.loads(row[1])
-            if question_data.get("enunciado") == question_content:
-              keys_to_remove.append(row[0])
-          except Exception:
-            continue
-        removed_count = 0
-        for key in keys_to_remove:
-          cursor = conn.execute("DELETE FROM question_cache WHERE cache_key = ?", (key,))
-          removed_count += cursor.rowcount
-        conn.commit()
-        return removed_count > 0
+      return self.remove_questions_by_content([question_content]) > 0
     except Exception as e:
       print(f"Erro ao remover questão por conteúdo: {e}")
-      return False
\ No newline at end of file
+      return False
@@ -0,0 +1,468 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+import unicodedata
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Tuple
+from models.schemas import Question, ValidationResult, Subject
+
+logger = logging.getLogger(__name__)
+
+# Callback de progresso: (nome da migração, itens processados, total)
+ProgressCallback = Callable[[str, int, int], None]
+
+_SUBJECTS = {subject.value for subject in Subject}
+# Valores antigos de "materia" gravados no formato curto da exportação
+_LEGACY_SUBJECTS = {"MA": Subject.MATEMATICA, "LP": Subject.PORTUGUES, "CI": Subject.CIENCIAS}
+
+def content_hash(enunciado: str) -> str:
+  """Hash do enunciado normalizado (Unicode NFKC, minúsculas, espaços colapsados)"""
+  normalized = " ".join(unicodedata.normalize("NFKC", enunciado).casefold().split())
+  return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+def _ensure_column(conn, name: str, ddl: str):
+  """Adiciona coluna à tabela de cache caso ainda não exista"""
+  columns = {row[1] for row in conn.execute("PRAGMA table_info(question_cache)")}
+  if name not in columns:
+    conn.execute(f"ALTER TABLE question_cache ADD COLUMN {name} {ddl}")
+
+def _in_rowid_chunks(conn, name: str, process: Callable[[int, int], None], chunk_size: int, progress: Optional[ProgressCallback]):
+  """Executa process(primeiro_rowid, ultimo_rowid) em faixas, com commit a cada faixa.
+
+  Commits curtos liberam o banco para os leitores/escritores da aplicação durante backfills grandes;
+  cada faixa deve ser idempotente para que uma migração interrompida possa ser retomada.
+  """
+  max_rowid = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM question_cache").fetchone()[0]
+  for start in range(0, max_rowid, chunk_size):
+    end = min(start + chunk_size, max_rowid)
+    process(start + 1, end)
+    conn.commit()
+    if progress:
+      progress(name, end, max_rowid)
+
+def _enable_incremental_vacuum(conn, chunk_size, progress):
+  # Bancos novos já nascem no modo incremental (_prepare_new_database). Em bancos existentes o modo
+  # só vale depois de um VACUUM, que reescreve o arquivo com lock exclusivo: passo offline em
+  # scripts/migrate_cache.py --vacuum, nunca na inicialização da aplicação
+  conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
+def vacuum_database(conn) -> int:
+  """Reescreve o banco inteiro (VACUUM) aplicando auto_vacuum incremental; retorna o modo resultante.
+
+  Bloqueia leitores e escritores durante toda a reescrita: rodar com a aplicação parada.
+  """
+  conn.commit()
+  conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+  conn.execute("VACUUM")
+  return conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+
+def _create_question_cache(conn, chunk_size, progress):
+  conn.execute("""
+    CREATE TABLE IF NOT EXISTS question_cache (
+      cache_key TEXT PRIMARY KEY,
+      question_data TEXT NOT NULL,
+      validation_data TEXT NOT NULL,
+      created_at TEXT NOT NULL
+    )
+  """)
+  conn.execute("CREATE INDEX IF NOT EXISTS idx_question_cache_created ON question_cache (created_at, cache_key)")
+
+def _add_duplicate_of(conn, chunk_size, progress):
+  _ensure_column(conn, "duplicate_of", "TEXT")
+
+def _normalize_legacy_rows(conn, chunk_size, progress):
+  """Revalida todas as linhas e regrava no formato atual; as ilegíveis vão para question_quarantine"""
+  conn.execute("""
+    CREATE TABLE IF NOT EXISTS question_quarantine (
+      cache_key TEXT PRIMARY KEY,
+      question_data TEXT,
+      validation_data TEXT,
+      created_at TEXT,
+      reason TEXT NOT NULL,
+      quarantined_at TEXT NOT NULL
+    )
+  """)
+  quarantined = 0
+
+  def process(first, last):
+    nonlocal quarantined
+    rows = conn.execute(
+      "SELECT rowid, question_data, validation_data FROM question_cache WHERE rowid BETWEEN ? AND ?",
+      (first, last),
+    ).fetchall()
+    for rowid, question_data, validation_data in rows:
+      try:
+        question_fields = json.loads(question_data)
+        materia = question_fields.get("materia")
+        if materia is not None and materia not in _SUBJECTS:
+          legacy_subject = _LEGACY_SUBJECTS.get(materia)
+          question_fields["materia"] = legacy_subject.value if legacy_subject else None
+        normalized_question = Question(**question_fields).model_dump_json()
+        normalized_validation = ValidationResult(**json.loads(validation_data)).model_dump_json()
+      except Exception as e:
+        # Linha nunca foi legível pelos leitores do cache: sai da tabela, mas fica guardada para inspeção
+        conn.execute(
+          """
+          INSERT OR REPLACE INTO question_quarantine
+          (cache_key, question_data, validation_data, created_at, reason, quarantined_at)
+          SELECT cache_key, question_data, validation_data, created_at, ?, ? FROM question_cache WHERE rowid = ?
+          """,
+          (f"{type(e).__name__}: {e}"[:500], datetime.now().isoformat(), rowid),
+        )
+        conn.execute("DELETE FROM question_cache WHERE rowid = ?", (rowid,))
+        quarantined += 1
+        continue
+      if normalized_question != question_data or normalized_validation != validation_data:
+        conn.execute(
+          "UPDATE question_cache SET question_data = ?, validation_data = ? WHERE rowid = ?",
+          (normalized_question, normalized_validation, rowid),
+        )
+
+  _in_rowid_chunks(conn, "normalize_legacy_rows", process, chunk_size, progress)
+  if quarantined:
+    logger.warning("Cache: %d entradas ilegíveis movidas para question_quarantine na normalização", quarantined)
+
+def _add_metadata_columns(conn, chunk_size, progress):
+  """Colunas extraídas do JSON para filtros, ordenação e estatísticas direto no SQL"""
+  _ensure_column(conn, "codigo", "TEXT")
+  _ensure_column(conn, "subject", "TEXT")
+  _ensure_column(conn, "confidence_score", "REAL")
+  _ensure_column(conn, "is_aligned", "INTEGER")
+
+  def process(first, last):
+    conn.execute(
+      """
+      UPDATE question_cache SET
+        codigo = json_extract(question_data, '$.codigo'),
+        subject = CASE substr(json_extract(question_data, '$.codigo'), 5, 2)
+          WHEN 'MA' THEN 'Matemática'
+          WHEN 'LP' THEN 'Português'
+          WHEN 'CI' THEN 'Ciências'
+        END,
+        confidence_score = json_extract(validation_data, '$.confidence_score'),
+        is_aligned = json_extract(validation_data, '$.is_aligned')
+      WHERE rowid BETWEEN ? AND ? AND codigo IS NULL
+      """,
+      (first, last),
+    )
+
+  _in_rowid_chunks(conn, "metadata_columns", process, chunk_size, progress)
+  conn.execute("CREATE INDEX IF NOT EXISTS idx_question_cache_codigo ON question_cache (codigo, created_at)")
+  conn.execute("CREATE INDEX IF NOT EXISTS idx_question_cache_subject ON question_cache (subject)")
+  conn.execute("CREATE INDEX IF NOT EXISTS idx_question_cache_confidence ON question_cache (confidence_score, cache_key)")
+
+def _add_content_hash(conn, chunk_size, progress):
+  """Hash do enunciado normalizado com índice único (duplicata exata e exclusão por conteúdo em O(log n))"""
+  _ensure_column(conn, "content_hash", "TEXT")
+  conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_question_cache_content_hash ON question_cache (content_hash)")
+
+  def process(first, last):
+    rows = conn.execute(
+      """
+      SELECT cache_key, json_extract(question_data, '$.enunciado'), confidence_score
+      FROM question_cache
+      WHERE rowid BETWEEN ? AND ? AND content_hash IS NULL AND duplicate_of IS NULL
+      """,
+      (first, last),
+    ).fetchall()
+    for cache_key, enunciado, confidence in rows:
+      digest = content_hash(enunciado or "")
+      owner = conn.execute(
+        "SELECT cache_key, confidence_score FROM question_cache WHERE content_hash = ?", (digest,)
+      ).fetchone()
+      if owner is None:
+        conn.execute("UPDATE question_cache SET content_hash = ? WHERE cache_key = ?", (digest, cache_key))
+      elif (confidence or 0) > (owner[1] or 0):
+        # Conteúdo repetido: a de maior confiança fica com o hash, as demais viram duplicatas dela
+        conn.execute("UPDATE question_cache SET content_hash = NULL, duplicate_of = ? WHERE cache_key = ?", (cache_key, owner[0]))
+        conn.execute("UPDATE question_cache SET duplicate_of = ? WHERE duplicate_of = ?", (cache_key, owner[0]))
+        conn.execute("UPDATE question_cache SET content_hash = ? WHERE cache_key = ?", (digest, cache_key))
+      else:
+        conn.execute("UPDATE question_cache SET duplicate_of = ? WHERE cache_key = ?", (owner[0], cache_key))
+
+  _in_rowid_chunks(conn, "content_hash", process, chunk_size, progress)
+
+def _add_served_tracking(conn, chunk_size, progress):
+  """Contagem de entregas; linhas já existentes são histórico entregue, não estoque inédito"""
+  _ensure_column(conn, "served_count", "INTEGER NOT NULL DEFAULT 0")
+  _ensure_column(conn, "last_served_at", "TEXT")
+
+  def process(first, last):
+    conn.execute(
+      """
+      UPDATE question_cache SET served_count = 1, last_served_at = created_at
+      WHERE rowid BETWEEN ? AND ? AND served_count = 0 AND last_served_at IS NULL
+      """,
+      (first, last),
+    )
+
+  _in_rowid_chunks(conn, "served_tracking", process, chunk_size, progress)
+
+def _add_data_version(conn, chunk_size, progress):
+  """Contadores de versão (global e por código) incrementados por triggers a cada escrita"""
+  conn.execute("""
+    CREATE TABLE IF NOT EXISTS cache_meta (
+      key TEXT PRIMARY KEY,
+      value INTEGER NOT NULL
+    )
+  """)
+  conn.execute("INSERT OR IGNORE INTO cache_meta (key, value) VALUES ('data_version', 0)")
+  code_sql = "COALESCE(CASE WHEN json_valid({row}.question_data) THEN json_extract({row}.question_data, '$.codigo') END, '')"
+  for event, rows in (("INSERT", ("NEW",)), ("DELETE", ("OLD",)), ("UPDATE", ("OLD", "NEW"))):
+    per_code = "".join(
+      f"""
+      INSERT OR IGNORE INTO cache_meta (key, value) VALUES ('data_version:' || {code_sql.format(row=row)}, 0);
+      UPDATE cache_meta SET value = value + 1 WHERE key = 'data_version:' || {code_sql.format(row=row)};"""
+      for row in rows
+    )
+    conn.execute(f"DROP TRIGGER IF EXISTS question_cache_version_{event.lower()}")
+    conn.execute(f"""
+      CREATE TRIGGER question_cache_version_{event.lower()}
+      AFTER {event} ON question_cache
+      BEGIN
+        UPDATE cache_meta SET value = value + 1 WHERE key = 'data_version';{per_code}
+      END
+    """)
+
+def _add_full_text_search(conn, chunk_size, progress):
+  """Índice de busca textual (FTS5) sobre enunciado e opções, sincronizado por triggers"""
+  try:
+    conn.execute("""
+      CREATE VIRTUAL TABLE IF NOT EXISTS question_fts
+      USING fts5(enunciado, opcoes, tokenize = 'unicode61 remove_diacritics 2')
+    """)
+  except sqlite3.OperationalError as e:
+    # SQLite compilado sem FTS5: busca cai para varredura simples
+    print(f"FTS5 indisponível, busca textual sem índice: {e}")
+    return
+
+  fts_values = (
+    "{row}.rowid, json_extract({row}.question_data, '$.enunciado'), json_extract({row}.question_data, '$.opcoes')"
+  )
+  # Sem trigger BEFORE INSERT: ele dispara também quando um INSERT OR IGNORE é ignorado.
+  # Substituições apagam a linha antiga explicitamente (o trigger de DELETE limpa o índice).
+  for trigger in ("insert", "delete", "update"):
+    conn.execute(f"DROP TRIGGER IF EXISTS question_fts_{trigger}")
+  conn.execute(f"""
+    CREATE TRIGGER question_fts_insert
+    AFTER INSERT ON question_cache WHEN json_valid(NEW.question_data)
+    BEGIN
+      INSERT INTO question_fts (rowid, enunciado, opcoes) VALUES ({fts_values.format(row="NEW")});
+    END
+  """)
+  conn.execute("""
+    CREATE TRIGGER question_fts_delete
+    AFTER DELETE ON question_cache
+    BEGIN
+      DELETE FROM question_fts WHERE rowid = OLD.rowid;
+    END
+  """)
+  conn.execute(f"""
+    CREATE TRIGGER question_fts_update
+    AFTER UPDATE OF question_data ON question_cache
+    BEGIN
+      DELETE FROM question_fts WHERE rowid = OLD.rowid;
+      INSERT INTO question_fts (rowid, enunciado, opcoes)
+        SELECT {fts_values.format(row="NEW")} WHERE json_valid(NEW.question_data);
+    END
+  """)
+
+  def process(first, last):
+    conn.execute(
+      f"""
+      INSERT INTO question_fts (rowid, enunciado, opcoes)
+      SELECT {fts_values.format(row="question_cache")}
+      FROM question_cache
+      WHERE question_cache.rowid BETWEEN ? AND ?
+        AND json_valid(question_data)
+        AND question_cache.rowid NOT IN (SELECT rowid FROM question_fts WHERE rowid BETWEEN ? AND ?)
+      """,
+      (first, last, first, last),
+    )
+
+  _in_rowid_chunks(conn, "full_text_search", process, chunk_size, progress)
+
+def _enable_wal(conn, chunk_size, progress):
+  # Leitores não bloqueiam o escritor (e vice-versa) com muitas tarefas concorrentes
+  conn.execute("PRAGMA journal_mode = WAL").fetchone()
+
+def _add_stock_index(conn, chunk_size, progress):
+  # Índice parcial só com o estoque (questões validadas ainda não entregues)
+  conn.execute("""
+    CREATE INDEX IF NOT EXISTS idx_question_cache_stock ON question_cache (codigo, confidence_score)
+    WHERE served_count = 0 AND is_aligned = 1 AND duplicate_of IS NULL
+  """)
+
+def _add_leases(conn, chunk_size, progress):
+  # Lease curto por sessão: questões entregues ficam reservadas ao owner até leased_until.
+  # Um lease por (questão, owner): guarda a quem cada questão já foi entregue, não só o último owner
+  conn.execute("""
+    CREATE TABLE IF NOT EXISTS question_lease (
+      cache_key TEXT NOT NULL,
+      owner TEXT NOT NULL,
+      leased_until TEXT NOT NULL,
+      PRIMARY KEY (cache_key, owner)
+    ) WITHOUT ROWID
+  """)
+  conn.execute("CREATE INDEX IF NOT EXISTS idx_question_lease_until ON question_lease (leased_until)")
+
+def _add_archive(conn, chunk_size, progress):
+  """Arquivo frio: linhas antigas comprimidas (zlib com dicionário compartilhado), pesquisáveis por código"""
+  conn.execute("""
+    CREATE TABLE IF NOT EXISTS archive_dictionary (
+      dict_id INTEGER PRIMARY KEY,
+      data BLOB NOT NULL,
+      created_at TEXT NOT NULL
+    )
+  """)
+  conn.execute("""
+    CREATE TABLE IF NOT EXISTS question_archive (
+      archive_id INTEGER PRIMARY KEY,
+      cache_key TEXT NOT NULL,
+      codigo TEXT,
+      subject TEXT,
+      confidence_score REAL,
+      is_aligned INTEGER,
+      content_hash TEXT,
+      served_count INTEGER NOT NULL DEFAULT 0,
+      created_at TEXT NOT NULL,
+      archived_at TEXT NOT NULL,
+      dict_id INTEGER REFERENCES archive_dictionary (dict_id),
+      payload BLOB NOT NULL
+    )
+  """)
+  conn.execute("CREATE INDEX IF NOT EXISTS idx_question_archive_codigo ON question_archive (codigo, created_at)")
+  conn.execute("CREATE INDEX IF NOT EXISTS idx_question_archive_key ON question_archive (cache_key)")
+
+def _add_worker_leases(conn, chunk_size, progress):
+  # Eleição de um único processo para tarefas de fundo (ex.: manutenção) entre réplicas do mesmo banco
+  conn.execute("""
+    CREATE TABLE IF NOT EXISTS worker_lease (
+      name TEXT PRIMARY KEY,
+      owner TEXT NOT NULL,
+      expires_at TEXT NOT NULL
+    )
+  """)
+
+# Migrações em ordem; cada uma precisa ser idempotente (bancos antigos podem já ter parte do esquema)
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+  (1, "enable_incremental_vacuum", _enable_incremental_vacuum),
+  (2, "create_question_cache", _create_question_cache),
+  (3, "add_duplicate_of", _add_duplicate_of),
+  (4, "normalize_legacy_rows", _normalize_legacy_rows),
+  (5, "add_metadata_columns", _add_metadata_columns),
+  (6, "add_content_hash", _add_content_hash),
+  (7, "add_served_tracking", _add_served_tracking),
+  (8, "add_data_version", _add_data_version),
+  (9, "add_full_text_search", _add_full_text_search),
+  (10, "enable_wal", _enable_wal),
+  (11, "add_stock_index", _add_stock_index),
+  (12, "add_leases", _add_leases),
+  (13, "add_archive", _add_archive),
+  (14, "add_worker_leases", _add_worker_leases),
+]
+
+# Lock de migração sem renovação por mais tempo que isso é considerado abandonado (processo encerrado)
+_MIGRATION_LOCK_SECONDS = 600
+
+def get_schema_version(conn) -> int:
+  """Retorna a última migração aplicada (0 para banco sem controle de versão)"""
+  exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'").fetchone()
+  if not exists:
+    return 0
+  return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+def _prepare_new_database(conn):
+  # auto_vacuum só pode ser definido sem VACUUM antes da primeira tabela
+  if conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone() is None:
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+  conn.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+      version INTEGER PRIMARY KEY,
+      name TEXT NOT NULL,
+      applied_at TEXT NOT NULL
+    )
+  """)
+  conn.execute("""
+    CREATE TABLE IF NOT EXISTS schema_lock (
+      id INTEGER PRIMARY KEY CHECK (id = 1),
+      owner TEXT NOT NULL,
+      expires_at TEXT NOT NULL
+    )
+  """)
+  conn.commit()
+
+def _lock_expiry() -> str:
+  return (datetime.now() + timedelta(seconds=_MIGRATION_LOCK_SECONDS)).isoformat()
+
+def _acquire_migration_lock(conn, owner: str, poll_seconds: float) -> bool:
+  """Assume o lock de migração (aguardando outro processo terminar); False se não há nada pendente"""
+  while True:
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+      if get_schema_version(conn) >= MIGRATIONS[-1][0]:
+        return False
+      row = conn.execute("SELECT owner, expires_at FROM schema_lock WHERE id = 1").fetchone()
+      if row is None or row[0] == owner or row[1] < datetime.now().isoformat():
+        conn.execute(
+          "INSERT OR REPLACE INTO schema_lock (id, owner, expires_at) VALUES (1, ?, ?)", (owner, _lock_expiry())
+        )
+        return True
+    finally:
+      conn.commit()
+    # Outro processo está migrando: espera e confere de novo (as migrações dele valem para nós)
+    time.sleep(poll_seconds)
+
+def _holds_migration_lock(conn, owner: str) -> bool:
+  row = conn.execute("SELECT owner FROM schema_lock WHERE id = 1").fetchone()
+  return row is not None and row[0] == owner
+
+def run_migrations(
+  conn, chunk_size: int = 1000, progress: Optional[ProgressCallback] = None, poll_seconds: float = 0.5
+) -> List[str]:
+  """Aplica as migrações pendentes em ordem; retorna os nomes das migrações executadas.
+
+  Vários processos podem chamar ao mesmo tempo: um lock em schema_lock (assumido com BEGIN IMMEDIATE)
+  garante que só um migra; os outros aguardam e encontram o esquema pronto. O lock é renovado a cada
+  faixa dos backfills, que continuam commitando aos poucos para não bloquear a aplicação.
+  """
+  conn.commit()
+  _prepare_new_database(conn)
+  owner = uuid.uuid4().hex
+  if not _acquire_migration_lock(conn, owner, poll_seconds):
+    return []
+
+  def heartbeat(name: str, done: int, total: int):
+    conn.execute("UPDATE schema_lock SET expires_at = ? WHERE id = 1 AND owner = ?", (_lock_expiry(), owner))
+    if progress:
+      progress(name, done, total)
+
+  applied = []
+  try:
+    for version, name, migrate in MIGRATIONS:
+      # Confere versão e posse do lock dentro de uma transação de escrita antes de cada migração
+      conn.execute("BEGIN IMMEDIATE")
+      pending = get_schema_version(conn) < version and _holds_migration_lock(conn, owner)
+      conn.commit()
+      if not pending:
+        continue
+      migrate(conn, chunk_size, heartbeat)
+      conn.commit()
+      conn.execute("BEGIN IMMEDIATE")
+      if get_schema_version(conn) < version and _holds_migration_lock(conn, owner):
+        conn.execute(
+          "INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+          (version, name, datetime.now().isoformat()),
+        )
+        conn.execute("UPDATE schema_lock SET expires_at = ? WHERE id = 1 AND owner = ?", (_lock_expiry(), owner))
+        applied.append(name)
+      conn.commit()
+  finally:
+    if conn.in_transaction:
+      conn.rollback()
+    conn.execute("DELETE FROM schema_lock WHERE id = 1 AND owner = ?", (owner,))
+    conn.commit()
+  return applied
@@ -0,0 +1,207 @@
+import base64
+import http.client
+import ipaddress
+import json
+import os
+import sqlite3
+import threading
+from datetime import date
+from enum import Enum
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import urlparse
+from pydantic import BaseModel
+from cache_manager import CacheManager, PagedCacheReads
+from models.schemas import CacheEntry, CacheRetentionPolicy, Question, QuestionRequest, ValidationResult
+
+# Operações do CacheManager expostas às réplicas. Cada uma roda inteira no servidor, com as mesmas
+# transações do uso local; o cliente nunca envia SQL. Manutenção e leases de tarefas ficam só no servidor.
+REMOTE_OPERATIONS = frozenset({
+  "get_data_version", "get_cached_questions", "store_questions", "cache_question", "insert_question_if_absent",
+  "has_content", "get_keys_by_content", "is_duplicate", "clear_cache", "mark_served", "count_unserved",
+  "take_unserved", "lease_questions", "return_unused", "release_leases", "archive_entries", "list_archived", "count_archived",
+  "restore_archived", "get_cache_stats", "cache_keys_page", "filter_keys", "count_cache_entries",
+  "get_all_cache_entries", "search_questions", "list_cache_entries", "export_rows_page", "export_rows_for_keys",
+  "get_dedupe_candidates", "resolve_duplicates", "get_entries_by_keys", "delete_by_keys", "remove_by_key",
+  "remove_questions_by_content", "remove_question_by_content",
+})
+
+# Operações só de leitura: podem ser repetidas com segurança se a conexão cair no meio da chamada
+_READ_OPERATIONS = frozenset({
+  "get_data_version", "get_cached_questions", "has_content", "get_keys_by_content", "is_duplicate", "count_unserved",
+  "list_archived", "count_archived", "get_cache_stats", "cache_keys_page", "filter_keys", "count_cache_entries",
+  "get_all_cache_entries", "search_questions", "list_cache_entries", "export_rows_page", "export_rows_for_keys",
+  "get_dedupe_candidates", "get_entries_by_keys",
+})
+
+# Modelos aceitos na serialização (nada além disso é instanciado a partir da rede)
+_MODELS = {model.__name__: model for model in (CacheEntry, CacheRetentionPolicy, Question, QuestionRequest, ValidationResult)}
+
+# Erros repassados ao cliente com o mesmo tipo; os demais viram RuntimeError
+_ERRORS = {error.__name__: error for error in (ValueError, TypeError, KeyError, PermissionError)}
+
+def _encode(value):
+  """Converte argumentos/resultados em JSON preservando modelos, tuplas, conjuntos e bytes"""
+  if isinstance(value, BaseModel):
+    return {"$model": type(value).__name__, "data": value.model_dump(mode="json")}
+  if isinstance(value, Enum):
+    return value.value
+  if isinstance(value, date):
+    return value.isoformat()
+  if isinstance(value, bytes):
+    return {"$b64": base64.b64encode(value).decode("ascii")}
+  if isinstance(value, tuple):
+    return {"$tuple": [_encode(item) for item in value]}
+  if isinstance(value, (set, frozenset)):
+    return {"$set": [_encode(item) for item in value]}
+  if isinstance(value, dict):
+    return {"$dict": [[_encode(key), _encode(item)] for key, item in value.items()]}
+  if isinstance(value, list):
+    return [_encode(item) for item in value]
+  return value
+
+def _decode(value):
+  if isinstance(value, list):
+    return [_decode(item) for item in value]
+  if not isinstance(value, dict):
+    return value
+  if "$model" in value:
+    model = _MODELS.get(value["$model"])
+    if model is None:
+      raise ValueError(f"Modelo não suportado: {value['$model']}")
+    return model.model_validate(value["data"])
+  if "$b64" in value:
+    return base64.b64decode(value["$b64"])
+  if "$tuple" in value:
+    return tuple(_decode(item) for item in value["$tuple"])
+  if "$set" in value:
+    return {_decode(item) for item in value["$set"]}
+  if "$dict" in value:
+    return {_decode(key): _decode(item) for key, item in value["$dict"]}
+  raise ValueError("Valor serializado inválido")
+
+class RemoteCacheManager(PagedCacheReads):
+  """Cliente do servidor de cache compartilhado (scripts/cache_server.py) entre réplicas da aplicação.
+
+  Expõe os mesmos métodos do CacheManager; cada chamada é uma operação nomeada executada no servidor.
+  A manutenção (retenção, arquivo) roda só no servidor, então start_maintenance aqui não faz nada.
+  """
+
+  def __init__(self, url: str, token: Optional[str] = None, timeout: float = 30.0):
+    parsed = urlparse(url)
+    self.url = url
+    self._host = parsed.hostname or "127.0.0.1"
+    self._port = parsed.port or 80
+    self._path = (parsed.path.rstrip("/") or "") + "/call"
+    self._token = token
+    self._timeout = timeout
+    # Uma conexão HTTP persistente por thread (evita um handshake por chamada)
+    self._local = threading.local()
+    # Confirma na criação que o servidor está acessível e aceita o token
+    self.get_data_version()
+
+  def _http(self) -> http.client.HTTPConnection:
+    conn = getattr(self._local, "conn", None)
+    if conn is None:
+      conn = http.client.HTTPConnection(self._host, self._port, timeout=self._timeout)
+      self._local.conn = conn
+    return conn
+
+  def _call(self, operation: str, *args, **kwargs):
+    body = json.dumps({"operation": operation, "args": _encode(list(args)), "kwargs": _encode(kwargs)}).encode("utf-8")
+    headers = {"Content-Type": "application/json"}
+    if self._token:
+      headers["Authorization"] = f"Bearer {self._token}"
+    # Escritas não são repetidas: o servidor pode ter aplicado a operação antes de a conexão cair
+    attempts = 2 if operation in _READ_OPERATIONS else 1
+    for attempt in range(attempts):
+      conn = self._http()
+      try:
+        conn.request("POST", self._path, body=body, headers=headers)
+        response = conn.getresponse()
+        payload = json.loads(response.read())
+        break
+      except (http.client.HTTPException, ConnectionError):
+        # Conexão persistente encerrada pelo servidor: leituras reabrem e tentam uma vez mais
+        conn.close()
+        self._local.conn = None
+        if attempt == attempts - 1:
+          raise
+    if response.status == 401:
+      raise PermissionError("Token do servidor de cache inválido ou ausente")
+    if response.status != 200:
+      error_type = _ERRORS.get(payload.get("type")) or getattr(sqlite3, payload.get("type", ""), None)
+      if not (isinstance(error_type, type) and issubclass(error_type, Exception)):
+        error_type = RuntimeError
+      raise error_type(payload.get("error", f"HTTP {response.status}"))
+    return _decode(payload["result"])
+
+  def __getattr__(self, name: str):
+    if name in REMOTE_OPERATIONS:
+      return partial(self._call, name)
+    raise AttributeError(name)
+
+  def start_maintenance(self, *args, **kwargs):
+    """A manutenção do banco compartilhado roda no servidor"""
+
+  def stop_maintenance(self):
+    pass
+
+def cache_manager_from_env(retention: Optional[CacheRetentionPolicy] = None):
+  """Usa o servidor de cache compartilhado se CACHE_STORAGE_URL estiver definida (senão, SQLite local)"""
+  url = os.getenv("CACHE_STORAGE_URL")
+  if not url:
+    return CacheManager(retention=retention)
+  return RemoteCacheManager(url, token=os.getenv("CACHE_STORAGE_TOKEN"))
+
+def _is_loopback(host: str) -> bool:
+  if host == "localhost":
+    return True
+  try:
+    return ipaddress.ip_address(host).is_loopback
+  except ValueError:
+    return False
+
+def make_server(cache_manager: CacheManager, host: str = "127.0.0.1", port: int = 8765, token: Optional[str] = None):
+  """Servidor HTTP que executa as operações nomeadas (REMOTE_OPERATIONS) no CacheManager local.
+
+  Fora do localhost o token é obrigatório.
+  """
+  if not token and not _is_loopback(host):
+    raise ValueError("Defina CACHE_STORAGE_TOKEN para expor o servidor de cache fora do localhost")
+
+  class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self, status: int, payload: dict):
+      body = json.dumps(payload).encode("utf-8")
+      self.send_response(status)
+      self.send_header("Content-Type", "application/json")
+      self.send_header("Content-Length", str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+
+    def do_POST(self):
+      body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+      if self.path.rstrip("/").split("/")[-1] != "call":
+        self._reply(404, {"error": "not found"})
+        return
+      if token and self.headers.get("Authorization") != f"Bearer {token}":
+        self._reply(401, {"error": "unauthorized"})
+        return
+      try:
+        request = json.loads(body)
+        operation = request["operation"]
+        if operation not in REMOTE_OPERATIONS:
+          raise ValueError(f"Operação não suportada: {operation}")
+        result = getattr(cache_manager, operation)(*_decode(request["args"]), **_decode(request["kwargs"]))
+      except Exception as e:
+        self._reply(400, {"error": str(e), "type": type(e).__name__})
+        return
+      self._reply(200, {"result": _encode(result)})
+
+    def log_message(self, format, *args):
+      pass
+
+  return ThreadingHTTPServer((host, port), Handler)
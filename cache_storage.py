@@ -0,0 +1,19 @@
+import sqlite3
+from pathlib import Path
+from typing import Optional
+from cache_migrations import ProgressCallback, run_migrations
+
+class SQLiteStorage:
+  """Banco SQLite local: entrega conexões no estilo DB-API (execute, executemany, commit)"""
+
+  def __init__(self, db_path: str = "db/questions_cache.db"):
+    self.db_path = Path(db_path)
+    self.db_path.parent.mkdir(exist_ok=True)
+
+  def connect(self):
+    return sqlite3.connect(self.db_path)
+
+  def initialize(self, progress: Optional[ProgressCallback] = None):
+    """Prepara o esquema do banco (migrações)"""
+    with self.connect() as conn:
+      run_migrations(conn, progress=progress)
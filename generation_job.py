@@ -0,0 +1,106 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from models.schemas import QuestionBatch
+
+logger = logging.getLogger(__name__)
+
+# generate_batch(code, progress(done), cancel) -> QuestionBatch (parcial se cancelado)
+BatchGenerator = Callable[[str, Callable[[int], None], threading.Event], QuestionBatch]
+
+class GenerationJob:
+  """Geração de vários códigos em uma thread de fundo, com progresso, ETA e cancelamento.
+
+  A interface consulta snapshot() periodicamente; os lotes concluídos ficam disponíveis
+  assim que cada código termina. O cancelamento é verificado entre questões, então só a
+  chamada ao LLM já em andamento chega ao fim.
+  """
+
+  def __init__(self, codes: List[str], questions_per_code: int, generate_batch: BatchGenerator):
+    self.codes = list(codes)
+    self.questions_per_code = questions_per_code
+    self.generate_batch = generate_batch
+    self.batches: List[QuestionBatch] = []
+    self.progress: Dict[str, int] = {code: 0 for code in self.codes}
+    self.error: Optional[Exception] = None
+    self.started_at: Optional[float] = None
+    self.finished_at: Optional[float] = None
+    self._cancel = threading.Event()
+    self._lock = threading.Lock()
+    self._thread: Optional[threading.Thread] = None
+
+  @property
+  def total(self) -> int:
+    return len(self.codes) * self.questions_per_code
+
+  def start(self):
+    """Inicia a thread de geração (no-op se já tiver sido iniciada)"""
+    if self._thread is not None:
+      return
+    self.started_at = time.monotonic()
+    self._thread = threading.Thread(target=self._run, name="generation-job", daemon=True)
+    self._thread.start()
+
+  def cancel(self):
+    """Pede o fim da geração; os lotes já concluídos (e o parcial do código atual) são mantidos"""
+    self._cancel.set()
+
+  def wait(self, timeout: Optional[float] = None) -> bool:
+    """Aguarda o fim da thread; retorna True se terminou"""
+    if self._thread is None:
+      return False
+    self._thread.join(timeout)
+    return not self._thread.is_alive()
+
+  def _run(self):
+    try:
+      for code in self.codes:
+        if self._cancel.is_set():
+          break
+
+        def progress(done: int, code: str = code):
+          with self._lock:
+            self.progress[code] = done
+
+        batch = self.generate_batch(code, progress, self._cancel)
+        with self._lock:
+          if batch.questions:
+            self.batches.append(batch)
+          self.progress[code] = max(self.progress[code], len(batch.questions))
+    except Exception as e:
+      logger.exception("Erro na geração em segundo plano")
+      self.error = e
+    finally:
+      self.finished_at = time.monotonic()
+
+  @property
+  def status(self) -> str:
+    if self.finished_at is None:
+      return "cancelling" if self._cancel.is_set() else "running"
+    if self.error is not None:
+      return "error"
+    return "cancelled" if self._cancel.is_set() else "done"
+
+  def snapshot(self) -> dict:
+    """Estado atual para a interface: progresso geral e por código, ETA e lotes concluídos"""
+    with self._lock:
+      progress = dict(self.progress)
+      batches = list(self.batches)
+    done = sum(progress.values())
+    end = self.finished_at if self.finished_at is not None else time.monotonic()
+    elapsed = end - self.started_at if self.started_at is not None else 0.0
+    eta = None
+    if self.finished_at is None and done:
+      # Média por questão até agora, aplicada ao que falta
+      eta = elapsed / done * max(self.total - done, 0)
+    return {
+      "status": self.status,
+      "done": done,
+      "total": self.total,
+      "per_code": progress,
+      "elapsed_seconds": elapsed,
+      "eta_seconds": eta,
+      "batches": batches,
+      "error": self.error,
+    }
@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field
 from typing import List, Optional, Literal
 from enum import Enum
+import os
 
 class QuestionType(str, Enum):
   MULTIPLE_CHOICE = "multipla_escolha"
@@ -30,7 +31,7 @@ class Question(BaseModel):
     """Formata a questão no padrão solicitado - sempre múltipla escolha"""
     # Remover prefixos A), B), C), D) das opções se já existirem
     opcoes_limpas = []
-    for opcao in self.opcoes:
+    for opcao in self.opcoes or []:
       # Verificar se a opção já tem prefixo A), B), C), ou D)
       if opcao.startswith(('A) ', 'B) ', 'C) ', 'D) ')):
         # Remover o prefixo existente
@@ -85,4 +86,34 @@ class CacheEntry(BaseModel):
   cache_key: str = Field(description="Chave única do cache")
   question: Question = Field(description="Questão em cache")
   validation: ValidationResult = Field(description="Validação em cache")
-  created_at: str = Field(description="Timestamp de criação")
\ No newline at end of file
+  created_at: str = Field(description="Timestamp de criação")
+
+class CacheRetentionPolicy(BaseModel):
+  max_rows_per_codigo: Optional[int] = Field(default=None, ge=1, description="Máximo de questões por código (None = sem limite)")
+  max_total_rows: Optional[int] = Field(default=None, ge=1, description="Máximo de questões no cache (None = sem limite)")
+  ttl_days: Optional[int] = Field(default=None, ge=0, description="Idade máxima em dias (None = sem expiração)")
+  archive_after_days: Optional[int] = Field(default=None, ge=0, description="Arquiva (comprimido) após N dias (None = não arquiva)")
+  archive_unserved_after_days: Optional[int] = Field(
+    default=None, ge=0, description="Arquiva questões nunca entregues após N dias (None = não arquiva)"
+  )
+
+  @property
+  def archive_enabled(self) -> bool:
+    """Com o arquivo frio ativo, o descarte (TTL e limites) arquiva em vez de apagar"""
+    return self.archive_after_days is not None or self.archive_unserved_after_days is not None
+
+  @classmethod
+  def from_env(cls) -> "CacheRetentionPolicy":
+    """Lê limites das variáveis CACHE_MAX_ROWS_PER_CODE, CACHE_MAX_ROWS, CACHE_TTL_DAYS e CACHE_ARCHIVE_* ('none' desativa)"""
+    values = {}
+    for field, env_name in (
+      ("max_rows_per_codigo", "CACHE_MAX_ROWS_PER_CODE"),
+      ("max_total_rows", "CACHE_MAX_ROWS"),
+      ("ttl_days", "CACHE_TTL_DAYS"),
+      ("archive_after_days", "CACHE_ARCHIVE_AFTER_DAYS"),
+      ("archive_unserved_after_days", "CACHE_ARCHIVE_UNSERVED_AFTER_DAYS"),
+    ):
+      raw = os.getenv(env_name)
+      if raw is not None and raw.strip() != "":
+        values[field] = None if raw.strip().lower() == "none" else int(raw)
+    return cls(**values)
@@ -1,4 +1,8 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Iterator, Optional, Tuple
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import uuid
 import json
 from pathlib import Path
 from datetime import datetime
@@ -10,22 +14,39 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from models.schemas import (
   QuestionRequest, Question, QuestionBatch, 
-  QuestionWithValidation, Subject, QuestionType, ValidationResult
+  QuestionWithValidation, Subject, QuestionType, ValidationResult, CacheRetentionPolicy, CacheEntry
 )
 from chains.matematica import math_chain
 from chains.portugues import portuguese_chain
 from chains.ciencias import science_chain
 from chains.validator import validate_question
-from cache_manager import CacheManager
+from cache_remote import cache_manager_from_env
+from question_pool import QuestionPool
+from generation_job import GenerationJob
+
+logger = logging.getLogger(__name__)
 
 class QuestionGeneratorPipeline:
   """Pipeline principal para geração de questões"""
   
   def __init__(self):
-    self.cache_manager = CacheManager()
+    # CACHE_STORAGE_URL aponta para o cache compartilhado entre réplicas (padrão: SQLite local)
+    self.cache_manager = cache_manager_from_env(CacheRetentionPolicy.from_env())
+    # Estoque de questões prontas por código, reposto em segundo plano quando o sistema está ocioso
+    self.question_pool = QuestionPool.from_env(
+      self.cache_manager, lambda request: self.generate_single_question(request, served=False)
+    )
     self.data_path = Path("data/BNCC_4ano_Mapeamento.json")
     self.bncc_data = self._load_bncc_data()
   
+  def start_background_tasks(self):
+    """Inicia a manutenção do cache (retenção/compactação em passos pequenos) e a reposição do estoque.
+
+    Chamado explicitamente pela aplicação; importar o módulo não cria threads.
+    """
+    self.cache_manager.start_maintenance()
+    self.question_pool.start()
+
   def _load_bncc_data(self) -> Dict[str, List[Dict]]:
     """Carrega dados da BNCC do arquivo JSON"""
     try:
@@ -85,14 +106,20 @@ class QuestionGeneratorPipeline:
     else:
       raise ValueError(f"Matéria não suportada: {request.subject}")
   
-  def generate_single_question(self, request: QuestionRequest, use_cache: bool = False) -> QuestionWithValidation:
-    """Gera uma única questão com validação"""
+  def generate_single_question(
+    self,
+    request: QuestionRequest,
+    use_cache: bool = False,
+    served: bool = True,
+    lease_owner: Optional[str] = None
+  ) -> QuestionWithValidation:
+    """Gera uma única questão com validação (served=False grava a questão aprovada como estoque)"""
     
-    # Verificar cache primeiro se habilitado
+    # Verificar cache primeiro se habilitado (lease evita entregar a mesma questão a sessões concorrentes)
     if use_cache:
-      cached_questions = self.cache_manager.get_cached_questions(request, limit=5)
+      cached_questions = self.cache_manager.lease_questions(request, 1, owner=lease_owner or uuid.uuid4().hex)
       if cached_questions:
-        cached_entry = cached_questions[0]  # Pegar a mais recente
+        cached_entry = cached_questions[0]
         return QuestionWithValidation(
           question=cached_entry.question,
           validation=cached_entry.validation
@@ -112,9 +139,12 @@ class QuestionGeneratorPipeline:
         # Validar questão
         validation = validate_question(question, request)
         
-        # Salvar no cache apenas se válida
+        # Salvar no cache apenas se válida; conflito de conteúdo indica duplicata gravada
+        # por outro worker desde a verificação acima
         if validation.is_aligned:
-          self.cache_manager.cache_question(request, question, validation)
+          _, inserted = self.cache_manager.insert_question_if_absent(request, question, validation, served=served)
+          if not inserted:
+            continue
         
         return QuestionWithValidation(
           question=question,
@@ -124,26 +154,30 @@ class QuestionGeneratorPipeline:
       except Exception as e:
         if attempt == max_attempts - 1:
           # Última tentativa falhou, criar validação de erro
-          validation = ValidationResult(
-            is_aligned=False,
-            confidence_score=0.0,
-            feedback=f"Erro na geração: {str(e)}",
-            suggestions="Tentar novamente ou revisar parâmetros"
-          )
-          
-          # Criar questão de fallback
-          question = Question(
-            codigo=request.codigo,
-            enunciado="Erro na geração da questão",
-            opcoes=None,
-            gabarito="N/A",
-            question_type=request.question_type
-          )
-          
-          return QuestionWithValidation(question=question, validation=validation)
+          return self._generation_error(request, e)
         
         continue
-  
+
+  def _generation_error(self, request: QuestionRequest, error: Exception) -> QuestionWithValidation:
+    """Questão de fallback quando todas as tentativas de geração falham"""
+    validation = ValidationResult(
+      is_aligned=False,
+      confidence_score=0.0,
+      feedback=f"Erro na geração: {str(error)}",
+      suggestions="Tentar novamente ou revisar parâmetros"
+    )
+    
+    # Criar questão de fallback
+    question = Question(
+      codigo=request.codigo,
+      enunciado="Erro na geração da questão",
+      opcoes=None,
+      gabarito="N/A",
+      question_type=request.question_type
+    )
+    
+    return QuestionWithValidation(question=question, validation=validation)
+
   def regenerate_question_with_variety(self, request: QuestionRequest, avoid_text: str = None) -> QuestionWithValidation:
     """Gera uma nova questão garantindo variedade e evitando texto específico"""
     
@@ -193,14 +227,70 @@ class QuestionGeneratorPipeline:
       
       return QuestionWithValidation(question=question, validation=validation)
   
+  def regenerate_questions_parallel(
+    self,
+    items: List[Tuple[Any, QuestionRequest, Optional[str]]],
+    max_workers: int = 4,
+    progress: Optional[Callable[[int], None]] = None
+  ) -> Iterator[Tuple[Any, QuestionWithValidation]]:
+    """Regenera várias questões ao mesmo tempo; produz (id, nova questão) na ordem em que ficam prontas.
+
+    items: (id, pedido, enunciado a evitar). Uma falha vira questão de erro só para aquele item.
+    progress recebe o total de itens concluídos antes de cada resultado ser produzido.
+    """
+    if not items:
+      return
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items))), thread_name_prefix="regenerate") as executor:
+      futures = {
+        executor.submit(self.regenerate_question_with_variety, request, avoid_text): (item_id, request)
+        for item_id, request, avoid_text in items
+      }
+      for done, future in enumerate(as_completed(futures), start=1):
+        item_id, request = futures[future]
+        try:
+          new_question = future.result()
+        except Exception as e:
+          logger.exception("Erro ao regenerar questão")
+          new_question = self._generation_error(request, e)
+        if progress is not None:
+          progress(done)
+        yield item_id, new_question
+
+  def _take_ready_questions(
+    self,
+    request: QuestionRequest,
+    n: int,
+    use_cache: bool,
+    use_stock: bool,
+    lease_owner: str
+  ) -> List[CacheEntry]:
+    """Questões prontas para o pedido: primeiro do estoque (inéditas), depois do cache com lease.
+
+    Só com reutilização ativada (use_cache); sem ela todas as questões são geradas na hora.
+    """
+    if not use_cache:
+      return []
+    ready = self.question_pool.take(request, n, owner=lease_owner) if use_stock else []
+    if len(ready) < n:
+      ready.extend(self.cache_manager.lease_questions(request, n - len(ready), owner=lease_owner))
+    return ready
+
   def generate_questions_batch(
     self, 
     code: str, 
     question_types: List[QuestionType],
     quantity: int = 20,
-    use_cache: bool = False
+    use_cache: bool = False,
+    use_stock: bool = True,
+    lease_owner: Optional[str] = None,
+    progress: Optional[Callable[[int], None]] = None,
+    cancel: Optional[threading.Event] = None
   ) -> QuestionBatch:
-    """Gera um lote de questões para um código de habilidade"""
+    """Gera um lote de questões para um código de habilidade (estoque, depois cache com lease, depois geração).
+
+    progress recebe o total de questões prontas após cada uma; com cancel sinalizado, o lote
+    para antes da próxima questão e é devolvido parcial.
+    """
     
     # Encontrar informações da habilidade
     skill_info = self.find_skill_by_code(code)
@@ -214,20 +304,44 @@ class QuestionGeneratorPipeline:
     questions_with_validation = []
     total_generated = 0
     
+    # Estoque e cache atendidos de uma vez por tipo de questão; o restante é gerado na hora
+    needed: Dict[QuestionType, int] = {}
     for question_type in question_types:
-      for _ in range(quantity):
-        request = QuestionRequest(
-          codigo=code,
-          objeto_conhecimento=skill_info["objeto_conhecimento"],
-          unidade_tematica=skill_info["unidade_tematica"],
-          subject=subject,
-          question_type=question_type,
-          quantity=1
-        )
-        
-        question_with_validation = self.generate_single_question(request, use_cache)
-        questions_with_validation.append(question_with_validation)
-        total_generated += 1
+      needed[question_type] = needed.get(question_type, 0) + quantity
+    ready: Dict[QuestionType, List[CacheEntry]] = {}
+    lease_owner = lease_owner or uuid.uuid4().hex
+    
+    with self.question_pool.foreground():
+      try:
+        for question_type in question_types:
+          for _ in range(quantity):
+            if cancel is not None and cancel.is_set():
+              break
+            request = QuestionRequest(
+              codigo=code,
+              objeto_conhecimento=skill_info["objeto_conhecimento"],
+              unidade_tematica=skill_info["unidade_tematica"],
+              subject=subject,
+              question_type=question_type,
+              quantity=1
+            )
+            
+            if question_type not in ready:
+              ready[question_type] = self._take_ready_questions(request, needed[question_type], use_cache, use_stock, lease_owner)
+            if ready[question_type]:
+              entry = ready[question_type].pop(0)
+              question_with_validation = QuestionWithValidation(question=entry.question, validation=entry.validation)
+            else:
+              question_with_validation = self.generate_single_question(request)
+            questions_with_validation.append(question_with_validation)
+            total_generated += 1
+            if progress is not None:
+              progress(total_generated)
+      finally:
+        # Cancelada ou com erro: o que foi retirado e não entrou no lote volta ao estoque/cache
+        unused = [entry.cache_key for entries in ready.values() for entry in entries]
+        if unused:
+          self.cache_manager.return_unused(unused, owner=lease_owner)
     
     # Contar questões aprovadas
     total_approved = sum(
@@ -243,7 +357,8 @@ class QuestionGeneratorPipeline:
         unidade_tematica=skill_info["unidade_tematica"],
         subject=subject,
         question_type=question_types[0] if question_types else QuestionType.MULTIPLE_CHOICE,
-        quantity=total_generated
+        # Lote cancelado antes da primeira questão fica vazio; quantity exige ao menos 1
+        quantity=max(total_generated, 1)
       ),
       questions=questions_with_validation,
       total_generated=total_generated,
@@ -256,11 +371,13 @@ class QuestionGeneratorPipeline:
     self,
     codes: List[str],
     questions_per_code: int = 20,
-    use_cache: bool = False
+    use_cache: bool = False,
+    lease_owner: Optional[str] = None
   ) -> List[QuestionBatch]:
     """Gera questões com distribuição customizada - sempre múltipla escolha"""
     
     results = []
+    lease_owner = lease_owner or uuid.uuid4().hex
     
     for code in codes:
       # Todas as questões serão múltipla escolha
@@ -271,7 +388,8 @@ class QuestionGeneratorPipeline:
         code=code,
         question_types=question_types_ordered,
         quantity=1,  # Cada tipo será gerado uma vez
-        use_cache=use_cache
+        use_cache=use_cache,
+        lease_owner=lease_owner
       )
       
       results.append(batch)
@@ -311,12 +429,41 @@ def get_codes_for_subject(subject: str) -> List[Dict[str, str]]:
   """Retorna códigos para uma matéria"""
   return pipeline.get_skill_codes_by_subject(subject)
 
+def start_generation_job(
+  codes: List[str],
+  questions_per_code: int = 20,
+  use_cache: bool = False,
+  lease_owner: Optional[str] = None
+) -> GenerationJob:
+  """Inicia a geração em segundo plano (mesma distribuição de generate_questions) e devolve o job"""
+  lease_owner = lease_owner or uuid.uuid4().hex
+
+  # As aprovadas já são gravadas no cache por generate_single_question
+  def generate_batch(code, progress, cancel):
+    return pipeline.generate_questions_batch(
+      code=code,
+      question_types=[QuestionType.MULTIPLE_CHOICE] * questions_per_code,
+      quantity=1,
+      use_cache=use_cache,
+      lease_owner=lease_owner,
+      progress=progress,
+      cancel=cancel
+    )
+
+  job = GenerationJob(codes, questions_per_code, generate_batch)
+  job.start()
+  return job
+
 def generate_questions(
   codes: List[str],
-  questions_per_code: int = 20
+  questions_per_code: int = 20,
+  use_cache: bool = False,
+  lease_owner: Optional[str] = None
 ) -> List[QuestionBatch]:
   """Função principal para gerar questões - sempre múltipla escolha"""
   return pipeline.generate_custom_distribution(
     codes=codes,
-    questions_per_code=questions_per_code
+    questions_per_code=questions_per_code,
+    use_cache=use_cache,
+    lease_owner=lease_owner
   )
\ No newline at end of file
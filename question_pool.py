@@ -0,0 +1,130 @@
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+from cache_manager import CacheManager
+from models.schemas import CacheEntry, QuestionRequest, QuestionWithValidation
+
+logger = logging.getLogger(__name__)
+
+class QuestionPool:
+  """Estoque de questões validadas e ainda não entregues, por código BNCC.
+
+  Os pedidos são atendidos primeiro pelo estoque; uma thread de baixa prioridade repõe os
+  códigos já pedidos até target_per_codigo, apenas enquanto não há geração em primeiro plano.
+  """
+
+  def __init__(
+    self,
+    cache_manager: CacheManager,
+    generate: Callable[[QuestionRequest], Optional[QuestionWithValidation]],
+    target_per_codigo: int = 5,
+    max_failures: int = 3
+  ):
+    self.cache_manager = cache_manager
+    self.generate = generate
+    self.target_per_codigo = target_per_codigo
+    self.max_failures = max_failures
+    # Modelo de pedido por código (o refill precisa de objeto de conhecimento, unidade temática etc.)
+    self._demand: Dict[str, QuestionRequest] = {}
+    self._failures: Dict[str, int] = {}
+    self._foreground = 0
+    self._lock = threading.Lock()
+    self._thread: Optional[threading.Thread] = None
+    self._stop = threading.Event()
+    self._wake = threading.Event()
+
+  @classmethod
+  def from_env(cls, cache_manager: CacheManager, generate) -> "QuestionPool":
+    """Lê o alvo de estoque de QUESTION_POOL_TARGET (0 desativa a reposição)"""
+    return cls(cache_manager, generate, target_per_codigo=int(os.getenv("QUESTION_POOL_TARGET", "5")))
+
+  def note_demand(self, request: QuestionRequest):
+    """Registra o código pedido para que a reposição passe a mantê-lo em estoque"""
+    with self._lock:
+      self._demand[request.codigo] = request.model_copy(update={"quantity": 1})
+      self._failures.pop(request.codigo, None)
+
+  def take(self, request: QuestionRequest, n: int, owner: str) -> List[CacheEntry]:
+    """Retira até n questões prontas do estoque (com lease para o owner) e agenda a reposição do código"""
+    self.note_demand(request)
+    entries = self.cache_manager.take_unserved(request, n, owner=owner)
+    self._wake.set()
+    return entries
+
+  @contextmanager
+  def foreground(self):
+    """Marca geração em primeiro plano; a reposição espera até o sistema ficar ocioso"""
+    with self._lock:
+      self._foreground += 1
+    try:
+      yield
+    finally:
+      with self._lock:
+        self._foreground -= 1
+      self._wake.set()
+
+  def _next_request(self) -> Optional[QuestionRequest]:
+    """Código pedido com menor estoque abaixo do alvo (ignorando os que falham seguidamente)"""
+    with self._lock:
+      if self._foreground:
+        return None
+      candidates = {
+        codigo: request for codigo, request in self._demand.items()
+        if self._failures.get(codigo, 0) < self.max_failures
+      }
+    if not candidates:
+      return None
+    stock = self.cache_manager.count_unserved(list(candidates))
+    missing = [(stock.get(codigo, 0), codigo) for codigo in candidates if stock.get(codigo, 0) < self.target_per_codigo]
+    if not missing:
+      return None
+    return candidates[min(missing)[1]]
+
+  def refill_once(self) -> bool:
+    """Gera uma questão para o código mais desfalcado; retorna False se não havia o que repor"""
+    request = self._next_request()
+    if request is None:
+      return False
+    before = self.cache_manager.count_unserved([request.codigo]).get(request.codigo, 0)
+    try:
+      self.generate(request)
+    except Exception:
+      logger.exception("Erro na reposição do estoque (%s)", request.codigo)
+    after = self.cache_manager.count_unserved([request.codigo]).get(request.codigo, 0)
+    with self._lock:
+      # Questão reprovada ou duplicada não aumenta o estoque; desiste do código após algumas tentativas
+      self._failures[request.codigo] = 0 if after > before else self._failures.get(request.codigo, 0) + 1
+    return True
+
+  def start(self, idle_seconds: float = 30.0, pause_seconds: float = 1.0):
+    """Inicia a thread de reposição (no-op com alvo 0 ou se já estiver ativa)"""
+    if self.target_per_codigo <= 0 or (self._thread is not None and self._thread.is_alive()):
+      return
+    self._stop.clear()
+
+    def loop():
+      while not self._stop.is_set():
+        self._wake.clear()
+        try:
+          worked = self.refill_once()
+        except Exception:
+          logger.exception("Erro na reposição do estoque")
+          worked = False
+        if worked:
+          self._stop.wait(pause_seconds)
+        else:
+          # Ocioso ou em primeiro plano: aguarda um novo pedido, o fim da geração ou o intervalo
+          self._wake.wait(idle_seconds)
+
+    self._thread = threading.Thread(target=loop, name="question-pool", daemon=True)
+    self._thread.start()
+
+  def stop(self):
+    """Interrompe a thread de reposição, se estiver ativa"""
+    self._stop.set()
+    self._wake.set()
+    if self._thread is not None:
+      self._thread.join(timeout=5)
+      self._thread = None
@@ -0,0 +1,33 @@
+import argparse
+import os
+import sys
+
+# Permite executar tanto da raiz quanto da pasta scripts
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache_manager import CacheManager
+from cache_remote import make_server
+from models.schemas import CacheRetentionPolicy
+
+def main():
+  parser = argparse.ArgumentParser(description="Servidor do cache compartilhado entre réplicas da aplicação")
+  parser.add_argument("--db", default="db/questions_cache.db", help="Caminho do banco de cache")
+  parser.add_argument("--host", default="127.0.0.1", help="Endereço de escuta")
+  parser.add_argument("--port", type=int, default=8765, help="Porta de escuta")
+  args = parser.parse_args()
+
+  # Fora do localhost exige CACHE_STORAGE_TOKEN; a manutenção do banco roda só aqui, não nas réplicas
+  cache_manager = CacheManager(args.db, retention=CacheRetentionPolicy.from_env())
+  server = make_server(cache_manager, args.host, args.port, token=os.getenv("CACHE_STORAGE_TOKEN"))
+  cache_manager.start_maintenance()
+  print(f"🗄️ Cache compartilhado em http://{args.host}:{args.port} (banco: {args.db})")
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    cache_manager.stop_maintenance()
+    server.server_close()
+
+if __name__ == "__main__":
+  main()
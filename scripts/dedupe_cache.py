@@ -0,0 +1,149 @@
+import argparse
+import math
+import os
+import sys
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Permite executar tanto da raiz quanto da pasta scripts
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache_manager import CacheManager
+
+def _tokenize(text: str) -> set:
+  # Mesmo critério de CacheManager.is_duplicate: conjunto de palavras em minúsculas
+  return set(text.lower().split())
+
+def _jaccard(a: set, b: set) -> float:
+  union = len(a | b)
+  return len(a & b) / union if union else 0.0
+
+def _similar_pairs(token_sets: List[set], threshold: float, chunk_size: int = 512):
+  """Gera pares (i, j), i < j, com similaridade de Jaccard >= threshold.
+
+  Índice invertido só dos prefixos (tokens mais raros primeiro): um par com Jaccard >= threshold
+  divide ao menos um token do prefixo, então só esses candidatos são conferidos. Os candidatos
+  são montados por bloco de linhas, sem matriz densa linhas x vocabulário.
+  """
+  frequency = Counter(token for tokens in token_sets for token in tokens)
+  rank = {token: n for n, token in enumerate(sorted(frequency, key=lambda token: (frequency[token], token)))}
+  prefixes = []
+  postings: Dict[int, List[int]] = {}
+  for row, tokens in enumerate(token_sets):
+    ordered = sorted(rank[token] for token in tokens)
+    # Arredondamento de ponto flutuante (ex.: 0.7 * 10) não pode encurtar o prefixo
+    prefix = ordered[:len(ordered) - math.ceil(threshold * len(ordered) - 1e-9) + 1] if ordered else []
+    prefixes.append(prefix)
+    for token in prefix:
+      postings.setdefault(token, []).append(row)
+  index = {token: np.array(rows, dtype=np.int64) for token, rows in postings.items()}
+  n = len(token_sets)
+
+  for start in range(0, n, chunk_size):
+    firsts, seconds = [], []
+    for i in range(start, min(start + chunk_size, n)):
+      for token in prefixes[i]:
+        rows = index[token]
+        later = rows[np.searchsorted(rows, i, side="right"):]
+        firsts.append(np.full(len(later), i, dtype=np.int64))
+        seconds.append(later)
+    if not firsts:
+      continue
+    pairs = np.unique(np.concatenate(firsts) * n + np.concatenate(seconds))
+    for i, j in zip((pairs // n).tolist(), (pairs % n).tolist()):
+      if _jaccard(token_sets[i], token_sets[j]) >= threshold:
+        yield i, j
+
+def find_duplicate_clusters(
+  entries: List[Tuple[str, str, float, str]],
+  threshold: float = 0.8,
+  chunk_size: int = 512
+) -> Dict[str, List[str]]:
+  """Agrupa entradas quase idênticas; retorna {representante: [chaves do grupo]} para grupos com 2+ itens"""
+  token_sets = [_tokenize(e[1]) for e in entries]
+  parent = list(range(len(entries)))
+
+  def find(i):
+    while parent[i] != i:
+      parent[i] = parent[parent[i]]
+      i = parent[i]
+    return i
+
+  for i, j in _similar_pairs(token_sets, threshold, chunk_size):
+    root_i, root_j = find(i), find(j)
+    if root_i != root_j:
+      parent[root_j] = root_i
+
+  groups: Dict[int, List[int]] = {}
+  for idx in range(len(entries)):
+    groups.setdefault(find(idx), []).append(idx)
+
+  clusters = {}
+  for members in groups.values():
+    # Componentes ligados em cadeia (A~B, B~C) podem juntar questões diferentes (A e C): cada grupo
+    # final só tem itens parecidos com o próprio representante, o de maior confiança (em empate, o mais recente)
+    members.sort(key=lambda idx: (entries[idx][2], entries[idx][3] or ""), reverse=True)
+    while len(members) > 1:
+      best = members[0]
+      similar = [idx for idx in members if idx == best or _jaccard(token_sets[best], token_sets[idx]) >= threshold]
+      if len(similar) > 1:
+        clusters[entries[best][0]] = [entries[idx][0] for idx in similar]
+      grouped = set(similar)
+      members = [idx for idx in members if idx not in grouped]
+  return clusters
+
+def dedupe_cache(
+  cache_manager: CacheManager,
+  threshold: float = 0.8,
+  apply: bool = False,
+  delete: bool = False,
+  chunk_size: int = 512
+) -> dict:
+  """Executa a deduplicação por código; sem apply, apenas gera o relatório (dry-run)"""
+  report = {"codes": {}, "clusters": 0, "duplicates": 0, "applied": 0}
+  all_clusters: Dict[str, List[str]] = {}
+
+  for codigo, entries in sorted(cache_manager.get_dedupe_candidates().items()):
+    clusters = find_duplicate_clusters(entries, threshold, chunk_size)
+    if not clusters:
+      continue
+    duplicates = sum(len(keys) - 1 for keys in clusters.values())
+    report["codes"][codigo] = {"total": len(entries), "clusters": len(clusters), "duplicates": duplicates}
+    report["clusters"] += len(clusters)
+    report["duplicates"] += duplicates
+    all_clusters.update(clusters)
+
+  if apply:
+    report["applied"] = cache_manager.resolve_duplicates(all_clusters, delete=delete)
+  return report
+
+def main():
+  parser = argparse.ArgumentParser(description="Deduplicação em lote do cache de questões")
+  parser.add_argument("--db", default="db/questions_cache.db", help="Caminho do banco de cache")
+  parser.add_argument("--threshold", type=float, default=0.8, help="Similaridade mínima (Jaccard) para duplicata")
+  parser.add_argument("--chunk-size", type=int, default=512, help="Linhas por bloco na comparação vetorizada")
+  parser.add_argument("--apply", action="store_true", help="Aplica a deduplicação (padrão: apenas relatório)")
+  parser.add_argument("--delete", action="store_true", help="Remove as duplicatas em vez de apenas marcá-las")
+  args = parser.parse_args()
+
+  report = dedupe_cache(
+    CacheManager(args.db),
+    threshold=args.threshold,
+    apply=args.apply,
+    delete=args.delete,
+    chunk_size=args.chunk_size
+  )
+
+  for codigo, info in report["codes"].items():
+    print(f"{codigo}: {info['clusters']} grupos, {info['duplicates']} duplicatas de {info['total']} questões")
+  print(f"Total: {report['clusters']} grupos, {report['duplicates']} duplicatas")
+  if args.apply:
+    action = "removidas" if args.delete else "marcadas"
+    print(f"✅ {report['applied']} entradas {action}")
+  else:
+    print("ℹ️ Dry-run: nenhuma alteração feita (use --apply para aplicar)")
+
+if __name__ == "__main__":
+  main()
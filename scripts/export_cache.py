@@ -0,0 +1,33 @@
+import argparse
+import os
+import sys
+
+# Permite executar tanto da raiz quanto da pasta scripts
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache_manager import CacheManager
+from utils.export import EXPORT_FORMATS, parquet_available, write_cache_export
+
+def main():
+  parser = argparse.ArgumentParser(description="Exporta o histórico do cache (JSON, NDJSON, CSV ou Parquet), gravando em partes")
+  parser.add_argument("--db", default="db/questions_cache.db", help="Caminho do banco de cache")
+  parser.add_argument("--output", required=True, help="Arquivo de saída ('-' para a saída padrão)")
+  parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="json", help="Formato da exportação")
+  parser.add_argument("--codigo", action="append", help="Exporta apenas o código BNCC informado (pode repetir)")
+  parser.add_argument("--batch-size", type=int, default=1000, help="Linhas lidas do banco por página")
+  args = parser.parse_args()
+
+  if args.format == "parquet" and not parquet_available():
+    parser.error("o formato parquet requer o pacote pyarrow (pip install pyarrow)")
+
+  cache_manager = CacheManager(db_path=args.db)
+  rows = cache_manager.iter_export_rows({"codigo": args.codigo}, batch_size=args.batch_size)
+  if args.output == "-":
+    count = write_cache_export(rows, sys.stdout.buffer, args.format)
+  else:
+    with open(args.output, "wb") as fp:
+      count = write_cache_export(rows, fp, args.format)
+  print(f"✅ {count} questões exportadas", file=sys.stderr)
+
+if __name__ == "__main__":
+  main()
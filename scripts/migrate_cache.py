@@ -0,0 +1,43 @@
+import argparse
+import os
+import sqlite3
+import sys
+
+# Permite executar tanto da raiz quanto da pasta scripts
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache_migrations import MIGRATIONS, get_schema_version, run_migrations, vacuum_database
+
+def _print_progress(name: str, done: int, total: int):
+  percent = 100 * done / total if total else 100
+  print(f"  {name}: {done}/{total} ({percent:.0f}%)", flush=True)
+
+def main():
+  parser = argparse.ArgumentParser(description="Aplica as migrações pendentes do banco de cache")
+  parser.add_argument("--db", default="db/questions_cache.db", help="Caminho do banco de cache")
+  parser.add_argument("--chunk-size", type=int, default=1000, help="Linhas por lote nos preenchimentos (backfills)")
+  parser.add_argument("--status", action="store_true", help="Apenas mostra a versão atual e as migrações pendentes")
+  parser.add_argument(
+    "--vacuum",
+    action="store_true",
+    help="Passo offline: reescreve o banco (VACUUM) para ativar a compactação incremental; pare a aplicação antes"
+  )
+  args = parser.parse_args()
+
+  with sqlite3.connect(args.db) as conn:
+    current = get_schema_version(conn)
+    pending = [name for version, name, _ in MIGRATIONS if version > current]
+    print(f"Versão do esquema: {current} (pendentes: {', '.join(pending) or 'nenhuma'})")
+    if pending and not args.status:
+      applied = run_migrations(conn, chunk_size=args.chunk_size, progress=_print_progress)
+      print(f"✅ {len(applied)} migrações aplicadas; versão {get_schema_version(conn)}")
+    incremental = conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    if not incremental and not args.vacuum:
+      print("Compactação incremental inativa (banco antigo): rode com --vacuum com a aplicação parada")
+    if args.vacuum and not incremental and not args.status:
+      print("Reescrevendo o banco (VACUUM)...", flush=True)
+      mode = vacuum_database(conn)
+      print("✅ Compactação incremental ativa" if mode == 2 else f"⚠️ auto_vacuum = {mode} após o VACUUM")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,649 @@
+#!/usr/bin/env python3
+"""
+Testes do sistema de cache (SQLite) sem usar API OpenAI
+"""
+
+import os
+import pytest
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from cache_manager import CacheManager
+from models.schemas import Question, QuestionRequest, QuestionType, Subject, ValidationResult
+
+def _make_cache():
+  tmp_dir = tempfile.mkdtemp()
+  return CacheManager(os.path.join(tmp_dir, "questions_cache.db"))
+
+def _make_request(codigo="EF04MA01"):
+  return QuestionRequest(
+    codigo=codigo,
+    objeto_conhecimento="Comparação e ordenação de números naturais",
+    unidade_tematica="Números",
+    subject=Subject.MATEMATICA,
+    question_type=QuestionType.MULTIPLE_CHOICE
+  )
+
+def _add_question(cache, enunciado, confidence=0.9, codigo="EF04MA01"):
+  question = Question(
+    codigo=codigo,
+    enunciado=enunciado,
+    opcoes=["1", "2", "3", "4"],
+    gabarito="A",
+    question_type=QuestionType.MULTIPLE_CHOICE
+  )
+  validation = ValidationResult(is_aligned=True, confidence_score=confidence, feedback="ok")
+  return cache.cache_question(_make_request(codigo), question, validation)
+
+def test_dedupe_marks_near_duplicates():
+  from scripts.dedupe_cache import dedupe_cache
+
+  cache = _make_cache()
+  _add_question(cache, "Observe a sequência 1.245, 1.354, 1.463 e 1.572. Qual é o próximo número desta sequência?", confidence=0.7)
+  best = _add_question(cache, "Observe a sequência 1.245, 1.354, 1.463 e 1.572. Qual é o próximo número dessa sequência?", confidence=0.95)
+  _add_question(cache, "Maria tem 3 maçãs e ganhou mais 2. Quantas maçãs ela tem?")
+
+  report = dedupe_cache(cache, threshold=0.8)
+  assert report["duplicates"] == 1
+  assert len(cache.get_all_cache_entries()) == 3
+
+  report = dedupe_cache(cache, threshold=0.8, apply=True)
+  assert report["applied"] == 1
+  keys = {entry.cache_key for entry in cache.get_all_cache_entries()}
+  assert best in keys
+  assert len(keys) == 2
+
+def test_dedupe_clusters_only_items_similar_to_the_kept_one():
+  from scripts.dedupe_cache import find_duplicate_clusters
+
+  # a~b e b~c, mas a e c não são parecidas: c não pode ser descartada como duplicata de a
+  entries = [
+    ("a", "um dois três quatro cinco seis sete oito", 0.9, "2025-01-03"),
+    ("b", "um dois três quatro cinco seis sete oito nove dez", 0.8, "2025-01-02"),
+    ("c", "um dois três quatro cinco seis sete oito nove dez onze doze", 0.7, "2025-01-01"),
+  ]
+  assert find_duplicate_clusters(entries, threshold=0.8, chunk_size=1) == {"a": ["a", "b"]}
+
+def test_data_version_and_memory_reads():
+  cache = _make_cache()
+  key = _add_question(cache, "Quanto é 2 + 3?")
+  version = cache.get_data_version()
+  other_code_version = cache.get_data_version("EF04MA02")
+
+  first = cache.get_all_cache_entries()
+  assert [entry.cache_key for entry in first] == [key]
+  # Sem escrita, a mesma lista decodificada é reaproveitada
+  assert cache.get_all_cache_entries()[0] is first[0]
+
+  second = _add_question(cache, "Quanto é 7 - 4?")
+  assert cache.get_data_version() > version
+  assert cache.get_data_version("EF04MA01") > 0
+  assert cache.get_data_version("EF04MA02") == other_code_version
+  assert {entry.cache_key for entry in cache.get_all_cache_entries()} == {key, second}
+
+  assert cache.remove_by_key(key)
+  assert [entry.cache_key for entry in cache.get_all_cache_entries()] == [second]
+  assert [entry.cache_key for entry in cache.get_cached_questions(_make_request())] == [second]
+
+def test_cached_reads_ignore_writes_to_other_codes():
+  cache = _make_cache()
+  keys = {_add_question(cache, f"Quanto é {n} + 1?") for n in range(3)}
+  assert {entry.cache_key for entry in cache.get_cached_questions(_make_request())} == keys
+
+  # Muitas escritas em outro código não podem tirar as do EF04MA01 da janela consultada
+  for n in range(60):
+    _add_question(cache, f"Quanto é {n} x 3?", codigo="EF04MA02")
+  assert {entry.cache_key for entry in cache.get_cached_questions(_make_request())} == keys
+  # Leitura sem nada em memória (outro processo) vê o mesmo resultado
+  fresh = CacheManager(cache.db_path)
+  assert {entry.cache_key for entry in fresh.get_cached_questions(_make_request())} == keys
+  assert len(cache.get_cached_questions(_make_request("EF04MA02"), limit=100)) == 60
+
+def test_keyset_pagination():
+  cache = _make_cache()
+  keys = [_add_question(cache, f"Quanto é {n} + {n}?", codigo="EF04MA01" if n % 2 else "EF04MA02") for n in range(7)]
+
+  seen = []
+  cursor = None
+  while True:
+    page, cursor = cache.list_cache_entries(after=cursor, limit=3)
+    seen.extend(entry.cache_key for entry in page)
+    if cursor is None:
+      break
+  assert sorted(seen) == sorted(keys)
+  assert seen == [entry.cache_key for entry in cache.get_all_cache_entries()]
+
+  page, cursor = cache.list_cache_entries(limit=10, filters={"codigo": "EF04MA02"})
+  assert cursor is None
+  assert len(page) == 4
+  assert all(entry.question.codigo == "EF04MA02" for entry in page)
+
+def test_sql_filters_sort_and_stats():
+  cache = _make_cache()
+  _add_question(cache, "Quanto é 1 + 1?", confidence=0.9)
+  low = _add_question(cache, "Quanto é 2 + 2?", confidence=0.5)
+  _add_question(cache, "Quanto é 3 + 3?", confidence=0.7, codigo="EF04MA02")
+
+  stats = cache.get_cache_stats()
+  assert stats["total_entries"] == 3
+  assert stats["high_confidence"] == 1
+  assert stats["unique_codes"] == 2
+  assert stats["by_codigo"] == {"EF04MA01": 2, "EF04MA02": 1}
+  assert stats["by_subject"] == {"Matemática": 3}
+  assert stats["by_confidence_band"] == {"alta": 1, "media": 1, "baixa": 1}
+
+  page, _ = cache.list_cache_entries(order_by="confidence", descending=False, limit=1)
+  assert page[0].cache_key == low
+  assert cache.count_cache_entries({"min_confidence": 0.6}) == 2
+  assert cache.count_cache_entries({"codigo": "EF04MA01", "max_confidence": 0.6}) == 1
+  today = stats["latest_created_at"][:10]
+  assert cache.count_cache_entries({"date_from": today, "date_to": today, "is_aligned": True}) == 3
+
+def test_full_text_search_and_remove_by_content():
+  cache = _make_cache()
+  fractions = _add_question(cache, "Pedro comeu 2/8 de uma pizza. Que fração representa as frações da pizza restantes?")
+  _add_question(cache, "Quantos lados tem um triângulo?")
+  # Regravar a mesma questão não duplica o índice de busca
+  _add_question(cache, "Pedro comeu 2/8 de uma pizza. Que fração representa as frações da pizza restantes?")
+
+  results = cache.search_questions("fracoes")
+  assert [entry.cache_key for entry in results] == [fractions]
+  assert cache.search_questions("triâng")[0].question.enunciado.startswith("Quantos lados")
+  assert cache.search_questions("fração", filters={"codigo": "EF04MA02"}) == []
+
+  assert cache.remove_question_by_content("Quantos lados tem um triângulo?")
+  assert cache.search_questions("triângulo") == []
+  assert not cache.remove_question_by_content("Quantos lados tem um triângulo?")
+
+def test_insert_if_absent_is_atomic():
+  from concurrent.futures import ThreadPoolExecutor
+
+  cache = _make_cache()
+  question = Question(
+    codigo="EF04MA01",
+    enunciado="Quanto é  10 x 10?",
+    opcoes=["100", "10", "1", "1000"],
+    gabarito="A",
+    question_type=QuestionType.MULTIPLE_CHOICE
+  )
+  validation = ValidationResult(is_aligned=True, confidence_score=0.9, feedback="ok")
+
+  with ThreadPoolExecutor(max_workers=8) as executor:
+    results = list(executor.map(lambda _: cache.insert_question_if_absent(_make_request(), question, validation), range(16)))
+
+  assert sum(1 for _, inserted in results if inserted) == 1
+  assert len({key for key, _ in results}) == 1
+  # Conteúdo normalizado (caixa e espaços) conta como duplicata exata
+  assert cache.has_content("quanto é 10 x 10?")
+  assert cache.is_duplicate(_make_request(), question)
+  # Inserções ignoradas não apagam o texto indexado da questão existente
+  assert len(cache.search_questions("quanto")) == 1
+  assert cache.remove_question_by_content("QUANTO É 10 X 10?")
+  assert not cache.has_content("Quanto é 10 x 10?")
+
+def test_ignored_insert_keeps_search_text():
+  cache = _make_cache()
+  original = _add_question(cache, "Joana plantou 12 girassóis em 3 canteiros iguais. Quantos em cada canteiro?")
+  duplicate = Question(
+    codigo="EF04MA01",
+    enunciado="JOANA plantou 12 girassóis em 3 canteiros iguais.  Quantos em cada canteiro?",
+    opcoes=["4", "3", "12", "15"],
+    gabarito="A",
+    question_type=QuestionType.MULTIPLE_CHOICE
+  )
+  validation = ValidationResult(is_aligned=True, confidence_score=0.9, feedback="ok")
+  assert cache.insert_question_if_absent(_make_request(), duplicate, validation) == (original, False)
+  assert [entry.cache_key for entry in cache.search_questions("girassóis canteiros")] == [original]
+
+def test_retention_and_eviction():
+  import sqlite3
+  from models.schemas import CacheRetentionPolicy
+
+  cache = _make_cache()
+  low = _add_question(cache, "Quanto é 1 + 1?", confidence=0.3)
+  served_low = _add_question(cache, "Quanto é 2 + 2?", confidence=0.3)
+  high = _add_question(cache, "Quanto é 3 + 3?", confidence=0.95)
+  other = _add_question(cache, "Quanto é 4 + 4?", confidence=0.9, codigo="EF04MA02")
+  old = _add_question(cache, "Quanto é 5 + 5?", confidence=0.9, codigo="EF04MA03")
+  cache.mark_served([served_low])
+  with sqlite3.connect(cache.db_path) as conn:
+    conn.execute("UPDATE question_cache SET created_at = '2020-01-01T00:00:00' WHERE cache_key = ?", (old,))
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+  # Sem configuração, nada é descartado
+  assert CacheRetentionPolicy().max_rows_per_codigo is None and CacheRetentionPolicy().max_total_rows is None
+  assert cache.run_maintenance()["evicted"] == 0
+
+  cache.retention = CacheRetentionPolicy(max_rows_per_codigo=2, ttl_days=365)
+  report = cache.run_maintenance()
+  assert report["ttl"] == 1 and report["per_codigo"] == 1
+  keys = {entry.cache_key for entry in cache.get_all_cache_entries()}
+  # Entre as de baixa confiança, a já servida sai primeiro (o estoque nunca entregue fica)
+  assert keys == {low, high, other}
+  assert served_low not in keys
+  assert cache.count_archived() == 0
+
+  cache.retention = CacheRetentionPolicy(max_total_rows=2)
+  assert cache.run_maintenance()["total"] == 1
+  assert cache.run_maintenance()["evicted"] == 0
+  assert {entry.cache_key for entry in cache.get_all_cache_entries()} == {high, other}
+
+  # Com o arquivo frio ativo, o descarte arquiva em vez de apagar
+  cache.retention = CacheRetentionPolicy(max_total_rows=1, archive_after_days=3650)
+  report = cache.run_maintenance()
+  assert report["total"] == 1 and report["archived"] == 0
+  assert cache.count_archived() == 1
+  assert cache.restore_archived([other]) == 1
+
+  assert cache.clear_cache(older_than_days=0) == 2
+
+def test_legacy_rows_are_normalized_once():
+  import json
+  import sqlite3
+
+  tmp_dir = tempfile.mkdtemp()
+  db_path = os.path.join(tmp_dir, "questions_cache.db")
+  question = {
+    "codigo": "EF04LP01", "enunciado": "Qual palavra está escrita corretamente?",
+    "opcoes": ["a", "b", "c", "d"], "gabarito": "A", "question_type": "multipla_escolha", "materia": "LP"
+  }
+  validation = {"is_aligned": True, "confidence_score": 0.85, "feedback": "ok", "suggestions": "-"}
+  with sqlite3.connect(db_path) as conn:
+    conn.execute("""
+      CREATE TABLE question_cache (
+        cache_key TEXT PRIMARY KEY, question_data TEXT NOT NULL, validation_data TEXT NOT NULL, created_at TEXT NOT NULL
+      )
+    """)
+    conn.execute("INSERT INTO question_cache VALUES ('legacy', ?, ?, '2025-01-01T10:00:00')", (json.dumps(question), json.dumps(validation)))
+    conn.execute("INSERT INTO question_cache VALUES ('broken', '{invalido', ?, '2025-01-02T10:00:00')", (json.dumps(validation),))
+
+  cache = CacheManager(db_path)
+  entries = cache.get_all_cache_entries()
+  assert [entry.cache_key for entry in entries] == ["legacy"]
+  assert entries[0].question.materia == Subject.PORTUGUES
+  assert entries[0].question.question_type == QuestionType.MULTIPLE_CHOICE
+  assert entries[0].question.format_question().startswith("[EF04LP01] QUESTÃO:")
+  assert cache.get_cache_stats()["total_entries"] == 1
+  # A linha ilegível não é apagada: fica em quarentena com o motivo
+  with sqlite3.connect(db_path) as conn:
+    quarantined = conn.execute("SELECT cache_key, question_data, reason FROM question_quarantine").fetchall()
+  assert [(key, data) for key, data, _ in quarantined] == [("broken", "{invalido")]
+  assert quarantined[0][2]
+  # Linhas anteriores ao controle de entregas são histórico já entregue, não estoque inédito
+  assert cache.count_unserved() == {}
+  with sqlite3.connect(db_path) as conn:
+    assert conn.execute("SELECT served_count, last_served_at FROM question_cache WHERE cache_key = 'legacy'").fetchone() == (
+      1, "2025-01-01T10:00:00"
+    )
+
+def test_unreadable_row_is_skipped_not_raised():
+  import sqlite3
+
+  cache = _make_cache()
+  good = _add_question(cache, "Quanto é 9 + 9?")
+  bad = _add_question(cache, "Quanto é 8 + 8?")
+  with sqlite3.connect(cache.db_path) as conn:
+    conn.execute("UPDATE question_cache SET question_data = '{\"codigo\": \"EF04MA01\"}' WHERE cache_key = ?", (bad,))
+  fresh = CacheManager(cache.db_path)
+
+  assert [entry.cache_key for entry in fresh.get_all_cache_entries()] == [good]
+  assert [entry.cache_key for entry in fresh.get_cached_questions(_make_request())] == [good]
+  assert [entry.cache_key for entry in fresh.get_entries_by_keys([bad, good])] == [good]
+  page, _ = fresh.list_cache_entries(limit=10)
+  assert [entry.cache_key for entry in page] == [good]
+
+def test_schema_migrations_are_versioned_and_idempotent():
+  import sqlite3
+  from cache_migrations import MIGRATIONS, get_schema_version, run_migrations
+
+  tmp_dir = tempfile.mkdtemp()
+  db_path = os.path.join(tmp_dir, "questions_cache.db")
+  with sqlite3.connect(db_path) as conn:
+    conn.execute("""
+      CREATE TABLE question_cache (
+        cache_key TEXT PRIMARY KEY, question_data TEXT NOT NULL, validation_data TEXT NOT NULL, created_at TEXT NOT NULL
+      )
+    """)
+  cache = CacheManager(db_path)
+  for n in range(5):
+    _add_question(cache, f"Quanto é {n} x 3?")
+
+  # Simula um banco antigo: colunas extraídas vazias e sem registro de versão
+  with sqlite3.connect(db_path) as conn:
+    conn.execute("UPDATE question_cache SET codigo = NULL, content_hash = NULL, confidence_score = NULL")
+    conn.execute("DELETE FROM schema_version")
+    conn.commit()
+
+  progress = []
+  with sqlite3.connect(db_path) as conn:
+    applied = run_migrations(conn, chunk_size=2, progress=lambda name, done, total: progress.append((name, done, total)))
+    assert applied == [name for _, name, _ in MIGRATIONS]
+    assert get_schema_version(conn) == MIGRATIONS[-1][0]
+    assert run_migrations(conn) == []
+  assert ("content_hash", 5, 5) in progress
+  assert len([p for p in progress if p[0] == "metadata_columns"]) == 3
+
+  cache = CacheManager(db_path)
+  assert cache.get_cache_stats()["by_codigo"] == {"EF04MA01": 5}
+  assert cache.has_content("quanto é 4 x 3?")
+  assert len(cache.search_questions("Quanto")) == 5
+
+def test_concurrent_startups_apply_each_migration_once():
+  import sqlite3
+  from concurrent.futures import ThreadPoolExecutor
+  from cache_migrations import MIGRATIONS, run_migrations, vacuum_database
+
+  db_path = os.path.join(tempfile.mkdtemp(), "questions_cache.db")
+
+  def migrate(_):
+    with sqlite3.connect(db_path, timeout=30) as conn:
+      return run_migrations(conn, chunk_size=2, poll_seconds=0.01)
+
+  with ThreadPoolExecutor(max_workers=4) as executor:
+    results = list(executor.map(migrate, range(4)))
+  assert sorted(len(applied) for applied in results) == [0, 0, 0, len(MIGRATIONS)]
+  with sqlite3.connect(db_path) as conn:
+    assert conn.execute("SELECT COUNT(*) FROM schema_version").fetchone()[0] == len(MIGRATIONS)
+    assert conn.execute("SELECT COUNT(*) FROM schema_lock").fetchone()[0] == 0
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+  # Banco antigo: a inicialização não reescreve o arquivo; o VACUUM é um passo offline explícito
+  legacy_path = os.path.join(tempfile.mkdtemp(), "questions_cache.db")
+  with sqlite3.connect(legacy_path) as conn:
+    conn.execute("CREATE TABLE question_cache (cache_key TEXT PRIMARY KEY, question_data TEXT NOT NULL, validation_data TEXT NOT NULL, created_at TEXT NOT NULL)")
+  CacheManager(legacy_path)
+  with sqlite3.connect(legacy_path) as conn:
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+    assert vacuum_database(conn) == 2
+
+def test_remote_storage_shares_one_cache():
+  import threading
+  from cache_remote import RemoteCacheManager, make_server
+
+  server_cache = _make_cache()
+  server = make_server(server_cache, port=0, token="segredo")
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  url = f"http://127.0.0.1:{server.server_address[1]}"
+  try:
+    replica_a = RemoteCacheManager(url, token="segredo")
+    replica_b = RemoteCacheManager(url, token="segredo")
+    key = _add_question(replica_a, "Quanto é 6 x 7?")
+    # A outra réplica enxerga a mesma questão e o mesmo índice de duplicatas
+    assert [entry.cache_key for entry in replica_b.get_all_cache_entries()] == [key]
+    assert replica_b.has_content("quanto é 6 x 7?")
+    entry = replica_a.get_all_cache_entries()[0]
+    _, inserted = replica_b.insert_question_if_absent(_make_request(), entry.question, entry.validation)
+    assert not inserted
+    assert replica_b.search_questions("6 x 7")[0].cache_key == key
+    assert [row["cache_key"] for row in replica_b.iter_export_rows()] == [key]
+    assert replica_b.remove_by_key(key)
+    assert replica_a.get_all_cache_entries() == []
+
+    # Conexão caída: leituras reabrem e repetem; escritas não (o servidor pode já tê-las aplicado)
+    class DroppedConnection:
+      def request(self, *args, **kwargs):
+        raise ConnectionResetError("conexão encerrada")
+
+      def close(self):
+        pass
+
+    replica_a._local.conn = DroppedConnection()
+    assert replica_a.count_cache_entries() == 0
+    replica_a._local.conn = DroppedConnection()
+    with pytest.raises(ConnectionResetError):
+      _add_question(replica_a, "Quanto é 8 x 7?")
+    assert replica_b.count_cache_entries() == 0
+
+    # Só operações nomeadas: nada de SQL nem de manutenção vindos das réplicas
+    with pytest.raises(AttributeError):
+      replica_a.run_maintenance
+    with pytest.raises(PermissionError):
+      RemoteCacheManager(url, token="errado")
+  finally:
+    server.shutdown()
+    server.server_close()
+  # Fora do localhost o servidor não sobe sem token
+  with pytest.raises(ValueError):
+    make_server(server_cache, host="0.0.0.0", port=0)
+
+def test_maintenance_lease_elects_one_runner():
+  cache = _make_cache()
+  assert cache.claim_worker_lease("maintenance", "replica-a", lease_seconds=60)
+  assert not cache.claim_worker_lease("maintenance", "replica-b", lease_seconds=60)
+  # O dono renova; depois de liberado (ou expirado) outra réplica assume
+  assert cache.claim_worker_lease("maintenance", "replica-a", lease_seconds=60)
+  cache.release_worker_lease("maintenance", "replica-a")
+  assert cache.claim_worker_lease("maintenance", "replica-b", lease_seconds=60)
+  assert cache.claim_worker_lease("maintenance", "replica-a", lease_seconds=-1) is False
+  assert cache.claim_worker_lease("maintenance", "replica-b", lease_seconds=-1)
+  assert cache.claim_worker_lease("maintenance", "replica-a", lease_seconds=60)
+
+def test_question_pool_serves_stock_and_refills():
+  from models.schemas import QuestionWithValidation
+  from question_pool import QuestionPool
+
+  cache = _make_cache()
+  generated = []
+
+  def generate(request):
+    n = len(generated)
+    generated.append(n)
+    question = Question(codigo=request.codigo, enunciado=f"Quanto é {n} + {n}?", opcoes=["1", "2", "3", "4"], gabarito="A",
+                        question_type=request.question_type)
+    validation = ValidationResult(is_aligned=True, confidence_score=0.9, feedback="ok")
+    cache.insert_question_if_absent(request, question, validation, served=False)
+    return QuestionWithValidation(question=question, validation=validation)
+
+  pool = QuestionPool(cache, generate, target_per_codigo=3)
+  assert pool.take(_make_request(), 2, owner="sessao-a") == []
+  # Código pedido passa a ser reposto até o alvo, e só fora da geração em primeiro plano
+  with pool.foreground():
+    assert not pool.refill_once()
+  while pool.refill_once():
+    pass
+  assert cache.count_unserved() == {"EF04MA01": 3}
+
+  served = pool.take(_make_request(), 2, owner="sessao-a")
+  assert len(served) == 2
+  assert len({item.question.enunciado for item in served}) == 2
+  assert cache.count_unserved() == {"EF04MA01": 1}
+  # Questões já entregues não voltam ao estoque
+  assert len(pool.take(_make_request(), 5, owner="sessao-a")) == 1
+  assert pool.take(_make_request(), 5, owner="sessao-a") == []
+  # Estoque retirado sai com lease: outra sessão não recebe as mesmas questões do cache logo depois
+  assert cache.lease_questions(_make_request(), 5, owner="sessao-b") == []
+
+def test_return_unused_puts_questions_back():
+  cache = _make_cache()
+  for n in range(3):
+    _add_question(cache, f"Quanto é {n} + 7?")
+  taken = cache.take_unserved(_make_request(), 3, owner="sessao-a")
+  assert cache.count_unserved() == {}
+
+  # Geração cancelada: as duas questões não usadas voltam ao estoque e podem ser entregues de novo
+  assert cache.return_unused([entry.cache_key for entry in taken[1:]], owner="sessao-a") == 2
+  assert cache.count_unserved() == {"EF04MA01": 2}
+  assert {entry.cache_key for entry in cache.take_unserved(_make_request(), 3, owner="sessao-a")} == {
+    entry.cache_key for entry in taken[1:]
+  }
+
+def test_leases_hand_out_distinct_questions():
+  import sqlite3
+
+  cache = _make_cache()
+  keys = [_add_question(cache, f"Quanto é {n} x 2?", confidence=0.5 + n / 20) for n in range(6)]
+  _add_question(cache, "Quanto é 9 x 9?", codigo="EF04MA02")
+
+  first = cache.lease_questions(_make_request(), 3, owner="sessao-a")
+  second = cache.lease_questions(_make_request(), 3, owner="sessao-b")
+  # Maior confiança primeiro, e sessões concorrentes recebem conjuntos disjuntos
+  assert [entry.cache_key for entry in first] == [keys[5], keys[4], keys[3]]
+  assert {entry.cache_key for entry in second} == set(keys[:3])
+  assert cache.lease_questions(_make_request(), 3, owner="sessao-c") == []
+
+  # Lease vencido volta a ser entregue, mas nunca de novo ao mesmo owner
+  with sqlite3.connect(cache.db_path) as conn:
+    conn.execute("UPDATE question_lease SET leased_until = '2000-01-01T00:00:00' WHERE owner = 'sessao-a'")
+  assert cache.lease_questions(_make_request(), 3, owner="sessao-a") == []
+  assert len(cache.lease_questions(_make_request(), 3, owner="sessao-c")) == 3
+
+  assert cache.release_leases("sessao-b") == 3
+  assert len(cache.lease_questions(_make_request(), 10, owner="sessao-a")) == 3
+
+def test_leases_remember_every_owner_across_turns():
+  cache = _make_cache()
+  keys = [_add_question(cache, f"Quanto é {n} x 3?") for n in range(4)]
+
+  def take_turn(owner):
+    leased = {entry.cache_key for entry in cache.lease_questions(_make_request(), 2, owner=owner)}
+    cache.release_leases(owner)
+    return leased
+
+  # Duas sessões alternando: cada uma recebe primeiro as questões novas, depois as que só a outra viu
+  first_a, first_b = take_turn("sessao-a"), take_turn("sessao-b")
+  assert first_a | first_b == set(keys)
+  assert take_turn("sessao-a") == first_b
+  assert take_turn("sessao-b") == first_a
+  # Todas passaram pelas duas sessões: o último owner de cada questão não apaga o histórico do anterior
+  assert take_turn("sessao-a") == set()
+  assert take_turn("sessao-b") == set()
+
+def test_bulk_lookup_and_delete_by_keys():
+  cache = _make_cache()
+  keys = [_add_question(cache, f"Quanto é {n} - 1?") for n in range(1200)]
+
+  picked = [keys[1100], keys[3], "inexistente", keys[3], keys[600]]
+  assert [entry.cache_key for entry in cache.get_entries_by_keys(picked)] == [keys[1100], keys[3], keys[600]]
+
+  assert cache.delete_by_keys(keys[:700] + ["inexistente"]) == 700
+  assert cache.count_cache_entries() == 500
+  assert cache.get_entries_by_keys(keys[:3]) == []
+
+  assert cache.remove_questions_by_content(["QUANTO É 800 - 1?", "quanto é 801 - 1?", "outra"]) == 2
+  assert cache.count_cache_entries() == 498
+
+def test_archive_tier_compresses_and_restores():
+  import sqlite3
+  from models.schemas import CacheRetentionPolicy
+
+  cache = _make_cache()
+  keys = [_add_question(cache, f"Pedro tem {n} figurinhas e ganhou mais {n + 3}. Quantas figurinhas ele tem agora?") for n in range(40)]
+  recent = _add_question(cache, "Quanto é 1 + 1?")
+  stock = _add_question(cache, "Quanto é 2 + 2?", codigo="EF04MA02")
+  cache.mark_served(keys + [recent])
+  with sqlite3.connect(cache.db_path) as conn:
+    conn.execute("UPDATE question_cache SET created_at = '2024-01-01T00:00:00' WHERE cache_key != ?", (recent,))
+    raw_size = conn.execute("SELECT SUM(length(question_data) + length(validation_data)) FROM question_cache").fetchone()[0]
+
+  cache.retention = CacheRetentionPolicy(archive_after_days=365, archive_unserved_after_days=30)
+  assert cache.run_maintenance(batch_size=25)["archived"] == 25
+  assert cache.archive_entries(older_than_days=365, unserved_older_than_days=30) == 16
+  assert cache.get_cache_stats()["archived_entries"] == 41
+  assert [entry.cache_key for entry in cache.get_all_cache_entries()] == [recent]
+  with sqlite3.connect(cache.db_path) as conn:
+    archived_size = conn.execute("SELECT SUM(length(payload)) FROM question_archive").fetchone()[0]
+  assert archived_size * 4 < raw_size
+
+  archived = cache.list_archived("EF04MA01", limit=100)
+  assert len(archived) == 40 and cache.count_archived("EF04MA02") == 1
+  assert archived[0].question.enunciado.startswith("Pedro tem")
+  assert cache.restore_archived([keys[0], stock]) == 2
+  assert {entry.cache_key for entry in cache.get_all_cache_entries()} == {recent, keys[0], stock}
+  assert cache.search_questions("figurinhas")[0].cache_key == keys[0]
+  assert cache.count_archived() == 39
+
+def test_streaming_export_matches_list_export():
+  import io
+  import json
+  from utils.export import export_questions_list_json, export_row_to_question, question_export, write_questions_json
+
+  cache = _make_cache()
+  for n in range(7):
+    _add_question(cache, f"Ana tem {n} lápis e ganhou mais {n + 2}. Quantos lápis ela tem agora?")
+  _add_question(cache, "Quanto é 2 + 2?", codigo="EF04MA02")
+
+  rows = list(cache.iter_export_rows(batch_size=3))
+  assert len(rows) == 8 and len({row["cache_key"] for row in rows}) == 8
+  assert [row["codigo"] for row in cache.iter_export_rows({"codigo": "EF04MA02"}, batch_size=3)] == ["EF04MA02"]
+
+  expected = [question_export(entry.question) for entry in cache.get_all_cache_entries()]
+  streamed = io.StringIO()
+  assert write_questions_json((export_row_to_question(row) for row in rows), streamed) == 8
+  assert streamed.getvalue() == export_questions_list_json(expected)[0]
+  ndjson = io.StringIO()
+  write_questions_json((export_row_to_question(row) for row in rows), ndjson, ndjson=True)
+  assert [json.loads(line) for line in ndjson.getvalue().splitlines()] == expected
+  empty = io.StringIO()
+  assert write_questions_json([], empty) == 0 and json.loads(empty.getvalue()) == []
+
+def test_columnar_export_has_typed_columns():
+  import io
+  import pandas as pd
+  from utils.export import EXPORT_COLUMNS, parquet_available, write_cache_export
+
+  cache = _make_cache()
+  for n in range(5):
+    _add_question(cache, f"Bia tem {n} bolas e ganhou mais {n + 1}. Quantas bolas ela tem agora?", confidence=0.5 + n / 10)
+
+  csv_file = io.BytesIO()
+  assert write_cache_export(cache.iter_export_rows(batch_size=2), csv_file, "csv", chunk_size=2) == 5
+  frame = pd.read_csv(io.BytesIO(csv_file.getvalue()))
+  assert list(frame.columns) == EXPORT_COLUMNS and len(frame) == 5
+  assert frame["disciplina"].tolist() == ["MA"] * 5 and frame["alternativa_d"].tolist() == [4] * 5
+  assert frame["confidence"].tolist() == [0.9, 0.8, 0.7, 0.6, 0.5]
+
+  if parquet_available():
+    parquet_file = io.BytesIO()
+    assert write_cache_export(cache.iter_export_rows(), parquet_file, "parquet", chunk_size=2) == 5
+    parquet_file.seek(0)
+    frame = pd.read_parquet(parquet_file)
+    assert frame["is_aligned"].dtype == bool and frame["confidence"].dtype == "float64"
+    assert str(frame["created_at"].dtype).startswith("datetime64")
+
+def test_zip_export_has_one_file_per_question_and_manifest():
+  import csv
+  import io
+  import json
+  import zipfile
+  from utils.export import write_cache_export
+
+  cache = _make_cache()
+  keys = [_add_question(cache, f"Caio leu {n} páginas e depois mais {n + 4}. Quantas páginas ele leu?") for n in range(3)]
+  other = _add_question(cache, "Quanto é 3 + 3?", codigo="EF04MA02")
+
+  archive_file = io.BytesIO()
+  selection = [other, keys[0], "inexistente"]
+  assert write_cache_export(cache.iter_export_rows(cache_keys=selection, batch_size=1), archive_file, "zip") == 2
+  with zipfile.ZipFile(archive_file) as archive:
+    assert archive.namelist() == [
+      "EF04MA02_1_questao_individual.json", "EF04MA01_1_questao_individual.json", "manifest.csv"
+    ]
+    question = json.loads(archive.read("EF04MA02_1_questao_individual.json"))
+    assert question["questao"]["enunciado"] == "Quanto é 3 + 3?"
+    manifest = list(csv.DictReader(io.StringIO(archive.read("manifest.csv").decode("utf-8"))))
+  assert [row["cache_key"] for row in manifest] == [other, keys[0]]
+
+def test_selection_by_filter_resolves_in_the_database():
+  cache = _make_cache()
+  keys = [_add_question(cache, f"Davi tem {n} carrinhos e ganhou mais {n + 5}. Quantos carrinhos ele tem?") for n in range(7)]
+  other = _add_question(cache, "Quanto é 5 + 5?", codigo="EF04MA02")
+
+  assert set(cache.iter_cache_keys({"codigo": "EF04MA01"}, batch_size=3)) == {(key, "EF04MA01") for key in keys}
+  assert len(list(cache.iter_cache_keys(batch_size=2))) == 8
+  assert cache.filter_keys([keys[0], other, "inexistente"], {"codigo": "EF04MA02"}) == {other}
+  assert cache.filter_keys([keys[0], other]) == {keys[0], other}
+
+def test_keys_by_content_match_normalized_statement():
+  cache = _make_cache()
+  key = _add_question(cache, "Quanto é 7 + 8?")
+
+  assert cache.get_keys_by_content(["QUANTO É 7 + 8?", "Outra questão"]) == {"QUANTO É 7 + 8?": key}
+  assert cache.get_keys_by_content([]) == {}
+
+if __name__ == "__main__":
+  for name, test in list(globals().items()):
+    if name.startswith("test_"):
+      test()
+  print("✅ Testes do cache passaram")
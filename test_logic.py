@@ -51,5 +51,99 @@ def test_distribution_logic():
     print("\n" + "=" * 50)
     print("🎯 TESTE CONCLUÍDO - Sistema configurado para gerar apenas questões de múltipla escolha")
 
+def test_generation_job_progress_and_cancel():
+    """Job em segundo plano: lotes parciais, progresso por código e cancelamento entre questões"""
+    import threading
+    import time
+    from generation_job import GenerationJob
+    from models.schemas import Question, QuestionBatch, QuestionRequest, QuestionWithValidation, Subject, ValidationResult
+
+    release = threading.Event()
+
+    def generate_batch(code, progress, cancel):
+        request = QuestionRequest(
+            codigo=code, objeto_conhecimento="x", unidade_tematica="y",
+            subject=Subject.MATEMATICA, question_type=QuestionType.MULTIPLE_CHOICE
+        )
+        questions = []
+        for n in range(3):
+            if code == "EF04MA02" and n == 1:
+                release.wait(5)
+            if cancel.is_set():
+                break
+            question = Question(
+                codigo=code, enunciado=f"{code} {n}", opcoes=["1", "2", "3", "4"],
+                gabarito="A", question_type=QuestionType.MULTIPLE_CHOICE
+            )
+            validation = ValidationResult(is_aligned=True, confidence_score=0.9, feedback="ok")
+            questions.append(QuestionWithValidation(question=question, validation=validation))
+            progress(len(questions))
+        return QuestionBatch(request=request, questions=questions, total_generated=len(questions), total_approved=len(questions))
+
+    job = GenerationJob(["EF04MA01", "EF04MA02", "EF04MA03"], 3, generate_batch)
+    job.start()
+    while job.snapshot()["per_code"]["EF04MA02"] < 1:
+        time.sleep(0.01)
+    snapshot = job.snapshot()
+    assert snapshot["status"] == "running" and snapshot["total"] == 9
+    assert [batch.request.codigo for batch in snapshot["batches"]] == ["EF04MA01"]
+    assert snapshot["eta_seconds"] is not None
+
+    job.cancel()
+    release.set()
+    assert job.wait(5)
+    snapshot = job.snapshot()
+    assert snapshot["status"] == "cancelled" and snapshot["eta_seconds"] is None
+    assert snapshot["per_code"] == {"EF04MA01": 3, "EF04MA02": 1, "EF04MA03": 0}
+    assert [len(batch.questions) for batch in snapshot["batches"]] == [3, 1]
+
+def test_regenerate_questions_parallel_errors_and_progress():
+    """Regeneração em lote: um resultado por item, erro isolado por item e progresso"""
+    import os
+    import tempfile
+    from models.schemas import Question, QuestionRequest, QuestionWithValidation, Subject, ValidationResult
+
+    # O módulo do pipeline cria o cliente da OpenAI e o cache na importação: chave fictícia e banco temporário
+    os.environ.setdefault("OPENAI_API_KEY", "dummy")
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+    try:
+        from pipeline import QuestionGeneratorPipeline
+    finally:
+        os.chdir(cwd)
+
+    # Sem __init__: só o lote paralelo é exercitado, com a regeneração substituída
+    generator = QuestionGeneratorPipeline.__new__(QuestionGeneratorPipeline)
+
+    def regenerate(request, avoid_text=None):
+        item = int(avoid_text.split()[-1])
+        if item == 2:
+            raise RuntimeError("falha simulada")
+        question = Question(
+            codigo=request.codigo, enunciado=f"nova {item}", opcoes=["1", "2", "3", "4"],
+            gabarito="A", question_type=QuestionType.MULTIPLE_CHOICE
+        )
+        return QuestionWithValidation(question=question, validation=ValidationResult(is_aligned=True, confidence_score=0.9, feedback="ok"))
+
+    generator.regenerate_question_with_variety = regenerate
+    request = QuestionRequest(
+        codigo="EF04MA01", objeto_conhecimento="x", unidade_tematica="y",
+        subject=Subject.MATEMATICA, question_type=QuestionType.MULTIPLE_CHOICE
+    )
+    items = [(("EF04MA01", n), request, f"texto {n}") for n in range(5)]
+    progress = []
+    results = list(generator.regenerate_questions_parallel(items, max_workers=5, progress=progress.append))
+
+    # A ordem de conclusão varia entre execuções: cada item aparece uma vez, com o id de origem
+    assert sorted(item_id[1] for item_id, _ in results) == [0, 1, 2, 3, 4]
+    by_index = {item_id[1]: qwv for item_id, qwv in results}
+    assert [by_index[n].question.enunciado for n in (0, 1, 3, 4)] == ["nova 0", "nova 1", "nova 3", "nova 4"]
+    # A falha de um item vira questão de erro só para ele
+    assert not by_index[2].validation.is_aligned
+    assert "falha simulada" in by_index[2].validation.feedback
+    assert progress == [1, 2, 3, 4, 5]
+
 if __name__ == "__main__":
-    test_distribution_logic()
\ No newline at end of file
+    test_distribution_logic()
+    test_generation_job_progress_and_cancel()
+    test_regenerate_questions_parallel_errors_and_progress()
\ No newline at end of file
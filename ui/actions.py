@@ -1,6 +1,7 @@
 import streamlit as st
 from pipeline import pipeline
-from utils.export import export_question_json, export_questions_list_json
+from ui.generation_state import current_generation
+from utils.export import question_export
 
 
 def process_delete_question(delete_data):
@@ -17,33 +18,40 @@ def process_delete_question(delete_data):
 
 def process_delete_selected(selected_items):
     try:
-        deleted_count = 0
-        for item in selected_items:
-            if item['source'] == 'current':
-                deleted_count += _delete_current_item(item, count=True)
-            elif item['source'] == 'cache':
-                if _delete_cache_item(item['cache_key']):
-                    deleted_count += 1
+        cache_keys = [item['cache_key'] for item in selected_items if item['source'] == 'cache']
+        current_items = [item for item in selected_items if item['source'] == 'current']
+        deleted_count = _delete_current_items(current_items)
+        if cache_keys:
+            deleted_count += pipeline.cache_manager.delete_by_keys(cache_keys)
         st.success(f"✅ {deleted_count} questões removidas com sucesso!")
     except Exception as e:
         st.error(f"❌ Erro ao remover questões: {e}")
 
 
+def _delete_current_items(items) -> int:
+    """Remove vários itens da geração atual e suas cópias no cache (uma única transação)."""
+    generation = current_generation()
+    if not items or generation is None:
+        return 0
+    indexes_by_code = {}
+    for item in items:
+        indexes_by_code.setdefault(item['codigo'], set()).add(item.get('index', 0))
+
+    removed_keys = []
+    deleted = 0
+    for codigo, indexes in indexes_by_code.items():
+        keys, removed = generation.remove(codigo, indexes)
+        removed_keys.extend(keys)
+        deleted += removed
+
+    if removed_keys:
+        pipeline.cache_manager.delete_by_keys(removed_keys)
+    return deleted
+
+
 def _delete_current_item(item_or_delete_data, count: bool = False):
     """Remove um item da geração atual; pode receber tanto delete_data quanto item."""
-    delete_data = item_or_delete_data
-    removed = 0
-    if 'current_batches' in st.session_state:
-        for batch in st.session_state.current_batches:
-            if batch.request.codigo == delete_data['codigo']:
-                if delete_data.get('index', 0) < len(batch.questions):
-                    question_content = batch.questions[delete_data['index']].question.enunciado
-                    pipeline.cache_manager.remove_question_by_content(question_content)
-                    del batch.questions[delete_data['index']]
-                    batch.total_generated = len(batch.questions)
-                    batch.total_approved = sum(1 for q in batch.questions if q.validation.is_aligned)
-                    removed = 1
-                break
+    removed = _delete_current_items([item_or_delete_data])
     return removed if count else True
 
 
@@ -58,49 +66,39 @@ def prepare_export_list_from_batches(batches):
     export_list = []
     for batch in batches:
         for qwv in batch.questions:
-            q = qwv.question
-            disciplina = getattr(q, 'materia', getattr(q, 'subject', None))
-            alternativas = q.opcoes if hasattr(q, 'opcoes') else {}
-            gabarito = q.gabarito if q.gabarito in ['A', 'B', 'C', 'D'] else str(q.gabarito)
-            json_data_individual, _ = export_question_json(disciplina, batch.request.codigo, q.enunciado, alternativas, gabarito)
-            export_list.append(__import__('json').loads(json_data_individual))
+            export_list.append(question_export(qwv.question, batch.request.codigo))
     return export_list
 
 
-def prepare_export_list_from_selected(selected_items):
+def prepare_export_list_from_selected(selected_items, current_batches=None):
     """Cria uma lista pronta para exportação a partir de itens selecionados (current/cache)."""
+    cache_keys = [item['cache_key'] for item in selected_items if item['source'] == 'cache']
+    # Uma única consulta pela chave primária para todos os itens do cache
+    cache_entries = {entry.cache_key: entry for entry in pipeline.cache_manager.get_entries_by_keys(cache_keys)}
     export_list = []
     for item in selected_items:
         if item['source'] == 'current':
-            _append_current_item_export(export_list, item)
+            _append_current_item_export(export_list, item, current_batches)
         elif item['source'] == 'cache':
-            _append_cache_item_export(export_list, item)
+            _append_cache_item_export(export_list, cache_entries.get(item['cache_key']))
     return export_list
 
 
-def _append_current_item_export(export_list, item):
-    if 'current_batches' not in st.session_state:
+def _append_current_item_export(export_list, item, current_batches=None):
+    if current_batches is not None:
+        for batch in current_batches:
+            if batch.request.codigo == item['codigo']:
+                if item['index'] < len(batch.questions):
+                    export_list.append(question_export(batch.questions[item['index']].question, item['codigo']))
+                break
+        return
+    generation = current_generation()
+    qwv = generation.question_at(item['codigo'], item['index']) if generation is not None else None
+    if qwv is not None:
+        export_list.append(question_export(qwv.question, item['codigo']))
+
+
+def _append_cache_item_export(export_list, entry):
+    if entry is None:
         return
-    for batch in st.session_state.current_batches:
-        if batch.request.codigo == item['codigo']:
-            if item['index'] < len(batch.questions):
-                q = batch.questions[item['index']].question
-                disciplina = getattr(q, 'materia', getattr(q, 'subject', None))
-                alternativas = q.opcoes if hasattr(q, 'opcoes') else {}
-                gabarito = q.gabarito if q.gabarito in ['A', 'B', 'C', 'D'] else str(q.gabarito)
-                json_data_individual, _ = export_question_json(disciplina, item['codigo'], q.enunciado, alternativas, gabarito)
-                export_list.append(__import__('json').loads(json_data_individual))
-            break
-
-
-def _append_cache_item_export(export_list, item):
-    cache_entries = pipeline.cache_manager.get_all_cache_entries()
-    for entry in cache_entries:
-        if entry.cache_key == item['cache_key']:
-            q = entry.question
-            disciplina = getattr(q, 'materia', getattr(q, 'subject', None))
-            alternativas = q.opcoes if hasattr(q, 'opcoes') else {}
-            gabarito = q.gabarito if q.gabarito in ['A', 'B', 'C', 'D'] else str(q.gabarito)
-            json_data_individual, _ = export_question_json(disciplina, entry.question.codigo, q.enunciado, alternativas, gabarito)
-            export_list.append(__import__('json').loads(json_data_individual))
-            break
+    export_list.append(question_export(entry.question))
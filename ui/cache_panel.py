@@ -1,59 +1,91 @@
+import tempfile
+from functools import partial
+from itertools import islice
 import streamlit as st
-from utils.export import export_question_json, export_questions_list_json
+from utils.export import (
+    EXPORT_FORMATS, export_list_filename, export_questions_list_json, parquet_available, question_export_filename,
+    question_json_payload, write_cache_export
+)
 from pipeline import pipeline
 from ui.actions import prepare_export_list_from_selected
+from ui.data import cached_cache_stats, cached_count_cache_entries
+from ui.selection import cache_selection
 
 _MIME_JSON = "application/json"
+_EXPORT_FORMAT_LABELS = {"json": "JSON", "ndjson": "NDJSON", "csv": "CSV", "parquet": "Parquet", "zip": "ZIP"}
+_PAGE_SIZE = 20
+# O download do Streamlit serve bytes em memória: o ZIP inteiro é lido do arquivo temporário,
+# então a interface limita o tamanho da seleção (exportações maiores vão por scripts/export_cache.py)
+_ZIP_MAX_SELECTION = 500
+# Mesmo motivo para o histórico completo em qualquer formato
+_HISTORY_EXPORT_MAX_ROWS = 5000
+# rótulo -> (coluna de ordenação, decrescente)
+_SORT_OPTIONS = {
+    "Mais recentes": ("created_at", True),
+    "Mais antigas": ("created_at", False),
+    "Maior confiança": ("confidence", True),
+    "Menor confiança": ("confidence", False),
+    "Código BNCC": ("codigo", False),
+}
+_ALIGNMENT_OPTIONS = {"Todas": None, "Alinhadas": True, "Não alinhadas": False}
 
 
-def _render_actions_bar(cache_entries):
-    if 'selected_questions_cache' not in st.session_state:
-        st.session_state['selected_questions_cache'] = []
+def _render_actions_bar(stats, filters):
+    selection = cache_selection()
+    selected_count = selection.count()
 
     st.markdown("#### 🔧 Ações Disponíveis")
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        _handle_select_all(cache_entries)
+        _handle_select_all(filters, selected_count)
     with col2:
-        _handle_delete_selected()
+        _handle_delete_selected(selection, selected_count)
     with col3:
-        if st.button("💾 Exportar Selecionadas", key="export_selected_cache", disabled=len(st.session_state['selected_questions_cache']) == 0):
-            if len(st.session_state['selected_questions_cache']) > 0:
-                # Preparar lista de exportação usando helper central (evita import circular)
-                export_list = prepare_export_list_from_selected(st.session_state['selected_questions_cache'])
-                if export_list:
-                    json_data, filename = export_questions_list_json(export_list, filename_prefix="questoes_selecionadas")
-                    if json_data and filename:
-                        st.download_button(
-                            label=f"📥 Download {len(st.session_state['selected_questions_cache'])} Questões",
-                            data=json_data,
-                            file_name=filename,
-                            mime=_MIME_JSON,
-                            key="download_selected_cache"
-                        )
+        if st.button("💾 Exportar Selecionadas", key="export_selected_cache", disabled=selected_count == 0):
+            # Preparar lista de exportação usando helper central (evita import circular)
+            export_list = prepare_export_list_from_selected(selection.items())
+            if export_list:
+                json_data, filename = export_questions_list_json(export_list, filename_prefix="questoes_selecionadas")
+                if json_data and filename:
+                    st.download_button(
+                        label=f"📥 Download {len(export_list)} Questões",
+                        data=json_data,
+                        file_name=filename,
+                        mime=_MIME_JSON,
+                        key="download_selected_cache"
+                    )
+        if selected_count > _ZIP_MAX_SELECTION:
+            st.caption(
+                f"🗜️ ZIP pela interface até {_ZIP_MAX_SELECTION} questões; para mais, use "
+                "`python scripts/export_cache.py --format zip`"
+            )
+        elif selected_count:
+            # Um JSON por questão + manifest.csv, montado só no clique
+            st.download_button(
+                label="🗜️ ZIP das Selecionadas",
+                data=partial(_selected_zip_payload, selection.copy()),
+                file_name=export_list_filename(selection.codigos(stats['by_codigo']), "questoes_individuais", "zip"),
+                mime=EXPORT_FORMATS["zip"][0],
+                key="download_selected_cache_zip"
+            )
     with col4:
-        selected_count = len(st.session_state['selected_questions_cache'])
         st.metric("Selecionadas", selected_count)
 
 
-def _handle_select_all(cache_entries):
-    if st.button("📋 Selecionar Todas", key="select_all_cache"):
-        st.session_state['selected_questions_cache'] = []
-        for i, entry in enumerate(cache_entries):
-            st.session_state['selected_questions_cache'].append({
-                'source': 'cache',
-                'cache_key': entry.cache_key,
-                'codigo': entry.question.codigo,
-                'index': i
-            })
+def _handle_select_all(filters, selected_count):
+    # Seleção resolvida no banco pelo filtro atual; nenhuma chave é listada aqui
+    if st.button("📋 Selecionar Todas", key="select_all_cache", help="Seleciona todas as questões dos filtros atuais"):
+        cache_selection().select_all(filters)
+        st.rerun()
+    if selected_count and st.button("✖️ Limpar Seleção", key="clear_selection_cache"):
+        cache_selection().clear()
         st.rerun()
 
 
-def _handle_delete_selected():
-    if st.button("🗑️ Excluir Selecionadas", key="delete_selected_cache", disabled=len(st.session_state['selected_questions_cache']) == 0):
-        if len(st.session_state['selected_questions_cache']) > 0:
-            st.session_state['delete_selected_questions'] = st.session_state['selected_questions_cache']
-            st.rerun()
+def _handle_delete_selected(selection, selected_count):
+    if st.button("🗑️ Excluir Selecionadas", key="delete_selected_cache", disabled=selected_count == 0):
+        st.session_state['delete_selected_questions'] = selection.items()
+        st.rerun()
 
 
 def _format_date(created_at):
@@ -72,20 +104,17 @@ def _format_date(created_at):
         return None
 
 
-def _render_stats(cache_entries):
+def _render_stats(stats):
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        st.metric("Total no Cache", len(cache_entries))
+        st.metric("Total no Cache", stats['total_entries'])
     with col2:
-        high_confidence = sum(1 for entry in cache_entries if entry.validation.confidence_score >= 0.8)
-        st.metric("Alta Confiança", high_confidence)
+        st.metric("Alta Confiança", stats['high_confidence'])
     with col3:
-        unique_codes = len({entry.question.codigo for entry in cache_entries})
-        st.metric("Códigos Únicos", unique_codes)
+        st.metric("Códigos Únicos", stats['unique_codes'])
     with col4:
-        latest_dates = [d for d in (_format_date(entry.created_at) for entry in cache_entries) if d is not None]
-        if latest_dates:
-            latest_date = max(latest_dates)
+        latest_date = _format_date(stats['latest_created_at']) if stats['latest_created_at'] else None
+        if latest_date:
             st.metric("Última Atualização", latest_date.strftime("%d/%m/%Y"))
         else:
             st.metric("Última Atualização", "N/A")
@@ -99,7 +128,7 @@ def _confidence_icon(score: float) -> str:
     return "🔴"
 
 
-def _render_cache_item(i, entry):
+def _render_cache_item(i, entry, in_filter=False):
     question = entry.question
     validation = entry.validation
     confidence_score = validation.confidence_score
@@ -111,40 +140,26 @@ def _render_cache_item(i, entry):
 
     with st.container():
         col1, col2 = st.columns([4, 1])
-        _render_cache_item_selection(col1, entry, i, date_str, question, confidence_icon, confidence_score, status_icon)
+        _render_cache_item_selection(col1, entry, in_filter, date_str, question, confidence_icon, confidence_score, status_icon)
         _render_cache_item_actions(col2, entry, i, question)
     st.divider()
 
 
-def _render_cache_item_selection(col, entry, i, date_str, question, confidence_icon, confidence_score, status_icon):
+def _on_cache_item_toggle(cache_key, codigo, in_filter):
+    cache_selection().set_selected(cache_key, codigo, st.session_state[f"select_cache_{cache_key}"], in_filter)
+
+
+def _render_cache_item_selection(col, entry, in_filter, date_str, question, confidence_icon, confidence_score, status_icon):
     with col:
-        item_selected = {
-            'source': 'cache',
-            'cache_key': entry.cache_key,
-            'codigo': question.codigo,
-            'index': i
-        }
-        if 'selected_questions_cache' not in st.session_state:
-            st.session_state['selected_questions_cache'] = []
-        is_selected = any(item['cache_key'] == entry.cache_key for item in st.session_state['selected_questions_cache'])
-        checkbox_changed = False
-        if st.checkbox(
+        widget_key = f"select_cache_{entry.cache_key}"
+        # O estado do checkbox espelha a seleção (que pode mudar por "Selecionar Todas" ou exclusões)
+        st.session_state[widget_key] = cache_selection().is_selected(entry.cache_key, in_filter)
+        st.checkbox(
             f"{status_icon} **{question.codigo}** - {question.enunciado[:80]}{'...' if len(question.enunciado) > 80 else ''}",
-            key=f"select_cache_{i}",
-            value=is_selected
-        ):
-            if item_selected not in st.session_state['selected_questions_cache']:
-                st.session_state['selected_questions_cache'].append(item_selected)
-                checkbox_changed = True
-        else:
-            if any(item['cache_key'] == entry.cache_key for item in st.session_state['selected_questions_cache']):
-                st.session_state['selected_questions_cache'] = [
-                    item for item in st.session_state['selected_questions_cache']
-                    if item['cache_key'] != entry.cache_key
-                ]
-                checkbox_changed = True
-        if checkbox_changed:
-            st.rerun()
+            key=widget_key,
+            on_change=_on_cache_item_toggle,
+            args=(entry.cache_key, question.codigo, in_filter)
+        )
         col_info1, col_info2, col_info3, col_info4 = st.columns(4)
         with col_info1:
             st.write(f"**Data:** {date_str}")
@@ -159,31 +174,23 @@ def _render_cache_item_selection(col, entry, i, date_str, question, confidence_i
 def _render_cache_item_actions(col, entry, i, question):
     with col:
         st.markdown("**Ações:**")
-        show_question_key = f"show_cache_{i}"
+        show_question_key = f"show_cache_{entry.cache_key}"
         button_text = "🙈 Ocultar questão" if st.session_state.get(show_question_key, False) else "👁️ Ver questão completa"
-        if st.button(button_text, help="Alternar visualização da questão", key=f"view_cache_{i}"):
+        if st.button(button_text, help="Alternar visualização da questão", key=f"view_cache_{entry.cache_key}"):
             st.session_state[show_question_key] = not st.session_state.get(show_question_key, False)
             st.rerun()
         if st.session_state.get(show_question_key, False):
             st.code(question.format_question(), language="text")
-        json_data, filename = export_question_json(
-            getattr(question, 'materia', getattr(question, 'subject', None)),
-            question.codigo,
-            question.enunciado,
-            dict(zip(['A', 'B', 'C', 'D'], question.opcoes)) if question.opcoes else {},
-            question.gabarito,
-            f"_cache_{i+1}"
+        # Conteúdo montado só no clique (o Streamlit chama a função ao baixar)
+        st.download_button(
+            label="💾",
+            data=partial(question_json_payload, question),
+            file_name=question_export_filename(question.codigo, f"_cache_{i+1}"),
+            mime=_MIME_JSON,
+            help="Exportar questão individual",
+            key=f"export_cache_{entry.cache_key}"
         )
-        if json_data and filename:
-            st.download_button(
-                label="💾",
-                data=json_data,
-                file_name=filename,
-                mime=_MIME_JSON,
-                help="Exportar questão individual",
-                key=f"export_cache_{i}"
-            )
-        if st.button("🗑️", help="Excluir do cache", key=f"delete_cache_{i}"):
+        if st.button("🗑️", help="Excluir do cache", key=f"delete_cache_{entry.cache_key}"):
             st.session_state['delete_question'] = {
                 'source': 'cache',
                 'cache_key': entry.cache_key
@@ -191,41 +198,146 @@ def _render_cache_item_actions(col, entry, i, question):
             st.rerun()
 
 
+def _render_history_filters(stats):
+    """Controles de filtro e ordenação; tudo é aplicado no SQL da página (list_cache_entries)."""
+    with st.expander("🎛️ Filtros e ordenação"):
+        col1, col2 = st.columns(2)
+        with col1:
+            codigos = st.multiselect("Código BNCC", sorted(stats['by_codigo']), key="cache_filter_codigo")
+            subject = st.selectbox("Matéria", ["Todas"] + sorted(stats['by_subject']), key="cache_filter_subject")
+            alignment = st.selectbox("Alinhamento", list(_ALIGNMENT_OPTIONS), key="cache_filter_aligned")
+        with col2:
+            min_confidence = st.slider("Confiança mínima", 0.0, 1.0, 0.0, 0.05, key="cache_filter_min_confidence")
+            sort_label = st.selectbox("Ordenar por", list(_SORT_OPTIONS), key="cache_sort")
+    filters = {
+        "codigo": codigos,
+        "subject": None if subject == "Todas" else subject,
+        "min_confidence": min_confidence or None,
+        "is_aligned": _ALIGNMENT_OPTIONS[alignment],
+    }
+    return filters, _SORT_OPTIONS[sort_label]
+
+
+def _render_page_controls(page_number, next_cursor, total_pages):
+    # Pilha de cursores: o último elemento é o início da página atual
+    col_prev, col_info, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        if st.button("⬅️ Anterior", key="cache_page_prev", disabled=page_number == 0):
+            st.session_state['cache_page_cursors'].pop()
+            st.rerun()
+    with col_info:
+        st.markdown(f"**Página {page_number + 1} de {total_pages}**")
+    with col_next:
+        if st.button("Próxima ➡️", key="cache_page_next", disabled=next_cursor is None):
+            st.session_state['cache_page_cursors'].append(next_cursor)
+            st.rerun()
+
+
 def cache_panel():
-    cache_entries = pipeline.cache_manager.get_all_cache_entries()
-    if not cache_entries:
+    stats = cached_cache_stats()
+    if not stats['total_entries']:
         st.info("📭 Nenhuma questão encontrada no cache.")
         return
 
-    _render_actions_bar(cache_entries)
-    _render_stats(cache_entries)
+    # A barra de ações fica no topo, mas depende dos filtros renderizados abaixo dela
+    actions_area = st.container()
+    _render_stats(stats)
     st.markdown("---")
 
-    for i, entry in enumerate(cache_entries):
-        _render_cache_item(i, entry)
+    search_query = st.text_input("🔎 Buscar no histórico", key="cache_search", placeholder="Ex.: frações, triângulo, leitura...")
+    filters, sort = _render_history_filters(stats)
+    with actions_area:
+        _render_actions_bar(stats, filters)
+    if search_query.strip():
+        _render_search_results(search_query, filters)
+    else:
+        _render_history_page(filters, sort)
+    _render_full_history_export(stats)
+
+
+def _render_search_results(search_query, filters):
+    results = pipeline.cache_manager.search_questions(search_query, limit=_PAGE_SIZE, filters=filters)
+    if not results:
+        st.info("🔎 Nenhuma questão encontrada para esta busca.")
+        return
+    st.caption(f"{len(results)} resultado(s) mais relevantes para \"{search_query}\"")
+    in_filter = cache_selection().matching([entry.cache_key for entry in results])
+    for i, entry in enumerate(results):
+        _render_cache_item(i, entry, entry.cache_key in in_filter)
+
+
+def _render_history_page(filters, sort):
+    order_by, descending = sort
+    # Filtro ou ordenação diferentes invalidam os cursores: volta à primeira página
+    query = (repr(sorted(filters.items())), order_by, descending)
+    if st.session_state.get('cache_page_query') != query:
+        st.session_state['cache_page_query'] = query
+        st.session_state['cache_page_cursors'] = [None]
+    cursors = st.session_state['cache_page_cursors']
+    page_entries, next_cursor = pipeline.cache_manager.list_cache_entries(
+        after=cursors[-1], limit=_PAGE_SIZE, filters=filters, order_by=order_by, descending=descending
+    )
+    if not page_entries and len(cursors) > 1:
+        # Página esvaziada por exclusões: volta ao início
+        st.session_state['cache_page_cursors'] = [None]
+        st.rerun()
+
+    total = cached_count_cache_entries(filters)
+    if not total:
+        st.info("🔎 Nenhuma questão atende aos filtros.")
+        return
+    st.caption(f"{total} questão(ões) encontradas")
+    page_number = len(cursors) - 1
+    offset = page_number * _PAGE_SIZE
+    in_filter = cache_selection().matching([entry.cache_key for entry in page_entries])
+    for i, entry in enumerate(page_entries):
+        _render_cache_item(offset + i, entry, entry.cache_key in in_filter)
+    _render_page_controls(page_number, next_cursor, max(1, -(-total // _PAGE_SIZE)))
+
+
+def _selected_zip_payload(selection):
+    cache_keys = [cache_key for cache_key, _ in selection.iter_items()]
+    with tempfile.TemporaryFile() as tmp:
+        write_cache_export(pipeline.cache_manager.iter_export_rows(cache_keys=cache_keys), tmp, "zip")
+        tmp.seek(0)
+        return tmp.read()
+
+
+def _history_export_payload(export_format):
+    # Montado a cada clique, sem memo: o arquivo só fica em memória enquanto o download é servido.
+    # O limite vale também aqui, caso o cache tenha crescido desde a renderização do botão
+    rows = islice(pipeline.cache_manager.iter_export_rows(), _HISTORY_EXPORT_MAX_ROWS)
+    with tempfile.TemporaryFile() as tmp:
+        write_cache_export(rows, tmp, export_format)
+        tmp.seek(0)
+        return tmp.read()
+
 
-    # Exportação do histórico completo
+def _render_full_history_export(stats):
+    # Exportação do histórico completo: gerada só quando o download é pedido
     st.markdown("---")
     _, col2, _ = st.columns([1, 2, 1])
     with col2:
-        export_list = []
-        for entry in cache_entries:
-            q = entry.question
-            disciplina = getattr(q, 'materia', getattr(q, 'subject', None))
-            alternativas = dict(zip(['A', 'B', 'C', 'D'], q.opcoes)) if q.opcoes else {}
-            gabarito = q.gabarito if q.gabarito in ['A', 'B', 'C', 'D'] else str(q.gabarito)
-            # Use central exporter to normalize each item
-            json_ind, _ = export_question_json(disciplina, q.codigo, q.enunciado, alternativas, gabarito)
-            export_list.append(__import__('json').loads(json_ind))
-        if export_list:
-            json_export, file_name = export_questions_list_json(export_list, filename_prefix="historico_completo_questoes")
-            st.download_button(
-                label="📥 Exportar Histórico Completo (JSON)",
-                data=json_export,
-                file_name=file_name,
-                mime=_MIME_JSON,
-                type="secondary",
-                use_container_width=True
+        formats = [fmt for fmt in EXPORT_FORMATS if fmt != "parquet" or parquet_available()]
+        export_format = st.radio(
+            "Formato",
+            formats,
+            format_func=_EXPORT_FORMAT_LABELS.get,
+            horizontal=True,
+            key="history_export_format"
+        )
+        mime, extension = EXPORT_FORMATS[export_format]
+        if stats['total_entries'] > _HISTORY_EXPORT_MAX_ROWS:
+            st.caption(
+                f"📥 Histórico completo pela interface até {_HISTORY_EXPORT_MAX_ROWS} questões; para mais, use "
+                f"`python scripts/export_cache.py --format {export_format} --output historico.{extension}`"
             )
-        else:
-            st.warning("⚠️ Nenhum dado válido para exportação")
+            return
+        st.download_button(
+            label=f"📥 Exportar Histórico Completo ({_EXPORT_FORMAT_LABELS[export_format]})",
+            data=partial(_history_export_payload, export_format),
+            file_name=export_list_filename(stats['by_codigo'], "historico_completo_questoes", extension),
+            mime=mime,
+            type="secondary",
+            use_container_width=True
+        )
@@ -1,8 +1,8 @@
 import streamlit as st
-from pipeline import get_subjects, get_codes_for_subject
+from ui.data import cached_codes_for_subject, cached_subjects
 
 def config_panel():
-    subjects = get_subjects()
+    subjects = cached_subjects()
     if not subjects:
         st.error("❌ Dados da BNCC não encontrados! Verifique se o arquivo BNCC_4ano_Mapeamento.json existe.")
         return None, None, None
@@ -16,17 +16,21 @@ def config_panel():
     selected_codes = []
     codes_data = None
     if selected_subject:
-        codes_data = get_codes_for_subject(selected_subject)
+        codes_data = cached_codes_for_subject(selected_subject)
         if codes_data:
             st.subheader(f"📋 Códigos - {selected_subject}")
             select_all = st.checkbox("Selecionar todos os códigos")
             if select_all:
                 selected_codes = [code["codigo"] for code in codes_data]
             else:
+                labels = {
+                    c['codigo']: c['objeto_conhecimento'][:50] + '...' if len(c['objeto_conhecimento']) > 50 else c['objeto_conhecimento']
+                    for c in codes_data
+                }
                 selected_codes = st.multiselect(
                     "Códigos de Habilidade:",
-                    options=[code["codigo"] for code in codes_data],
-                    format_func=lambda x: f"{x} - {next(c['objeto_conhecimento'][:50] + '...' if len(c['objeto_conhecimento']) > 50 else c['objeto_conhecimento'] for c in codes_data if c['codigo'] == x)}",
+                    options=list(labels),
+                    format_func=lambda x: f"{x} - {labels[x]}",
                     key="codes_select"
                 )
     return selected_subject, selected_codes, codes_data
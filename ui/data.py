@@ -0,0 +1,40 @@
+import streamlit as st
+from pipeline import pipeline, get_subjects, get_codes_for_subject
+
+# Leituras usadas a cada rerun. O catálogo BNCC não muda durante a execução; as consultas ao
+# cache levam a versão dos dados (cache_meta) na chave, então uma escrita invalida o resultado.
+
+
+@st.cache_data(show_spinner=False)
+def cached_subjects():
+    return get_subjects()
+
+
+@st.cache_data(show_spinner=False)
+def cached_codes_for_subject(subject):
+    return get_codes_for_subject(subject)
+
+
+@st.cache_data(show_spinner=False)
+def cached_total_codes():
+    return sum(len(get_codes_for_subject(subject)) for subject in get_subjects())
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def _cache_stats(data_version):
+    return pipeline.cache_manager.get_cache_stats()
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _count_cache_entries(data_version, filters):
+    return pipeline.cache_manager.count_cache_entries(filters)
+
+
+def cached_cache_stats():
+    """Estatísticas do cache, recalculadas só quando a versão dos dados muda."""
+    return _cache_stats(pipeline.cache_manager.get_data_version())
+
+
+def cached_count_cache_entries(filters=None):
+    """Total de entradas para os filtros, recalculado só quando a versão dos dados muda."""
+    return _count_cache_entries(pipeline.cache_manager.get_data_version(), filters)
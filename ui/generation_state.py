@@ -0,0 +1,172 @@
+import streamlit as st
+from models.schemas import QuestionBatch, QuestionWithValidation
+from pipeline import pipeline
+
+
+def is_approved(qwv) -> bool:
+    """Aprovada na interface: alinhada e confiança >= 0.7."""
+    try:
+        return bool(qwv.validation.is_aligned) and float(qwv.validation.confidence_score) >= 0.7
+    except Exception:
+        return False
+
+
+class CurrentGeneration:
+    """Geração atual guardada na sessão de forma compacta.
+
+    Cada código guarda o pedido e a ordem das questões: as gravadas no cache ficam só como
+    (cache_key, aprovada) e as demais (reprovadas ou com erro) como objeto. Os totais são mantidos
+    a cada alteração e os lotes completos são montados sob demanda, com uma consulta ao cache.
+    """
+
+    def __init__(self):
+        # codigo -> pedido / [(cache_key, aprovada) ou QuestionWithValidation] / aprovadas (ordem de inserção = ordem dos códigos)
+        self.requests = {}
+        self.slots = {}
+        self.approved = {}
+        # codigo -> id de cada posição (único na geração; chave dos widgets e da seleção)
+        self.ids = {}
+        self._next_id = 0
+        # Questões que sumiram do cache (excluídas pelo histórico ou pela manutenção) desde o último aviso
+        self.lost = 0
+
+    @classmethod
+    def from_batches(cls, batches):
+        generation = cls()
+        for batch in batches:
+            generation.add_batch(batch)
+        return generation
+
+    def __len__(self):
+        return len(self.requests)
+
+    @property
+    def total_generated(self):
+        return sum(len(slots) for slots in self.slots.values())
+
+    @property
+    def total_approved(self):
+        return sum(self.approved.values())
+
+    @property
+    def has_rejected(self):
+        return self.total_approved < self.total_generated
+
+    @staticmethod
+    def _slot_approved(slot):
+        return slot[1] if isinstance(slot, tuple) else is_approved(slot)
+
+    def _slots_for(self, questions):
+        keys = pipeline.cache_manager.get_keys_by_content(
+            [qwv.question.enunciado for qwv in questions if qwv.validation.is_aligned]
+        )
+        return [
+            (keys[qwv.question.enunciado], is_approved(qwv))
+            if qwv.validation.is_aligned and qwv.question.enunciado in keys else qwv
+            for qwv in questions
+        ]
+
+    def _new_ids(self, count):
+        ids = list(range(self._next_id, self._next_id + count))
+        self._next_id += count
+        return ids
+
+    def add_batch(self, batch):
+        codigo = batch.request.codigo
+        self.requests[codigo] = batch.request
+        self.slots[codigo] = self._slots_for(batch.questions)
+        self.ids[codigo] = self._new_ids(len(self.slots[codigo]))
+        self.approved[codigo] = sum(1 for slot in self.slots[codigo] if self._slot_approved(slot))
+
+    def batches(self):
+        """Lotes completos (uma consulta por chave primária para todos os códigos)."""
+        keys = [slot[0] for slots in self.slots.values() for slot in slots if isinstance(slot, tuple)]
+        entries = {entry.cache_key: entry for entry in pipeline.cache_manager.get_entries_by_keys(keys)}
+        batches = []
+        for codigo, request in self.requests.items():
+            questions = []
+            kept = []
+            kept_ids = []
+            for slot_id, slot in zip(self.ids[codigo], self.slots[codigo]):
+                if not isinstance(slot, tuple):
+                    questions.append(slot)
+                elif slot[0] in entries:
+                    entry = entries[slot[0]]
+                    questions.append(QuestionWithValidation(question=entry.question, validation=entry.validation))
+                else:
+                    # Removida do cache por outro caminho: sai da geração e o painel avisa
+                    self.lost += 1
+                    self.approved[codigo] -= int(slot[1])
+                    continue
+                kept.append(slot)
+                kept_ids.append(slot_id)
+            self.slots[codigo] = kept
+            self.ids[codigo] = kept_ids
+            batches.append(QuestionBatch(
+                request=request,
+                questions=questions,
+                total_generated=len(questions),
+                total_approved=self.approved[codigo]
+            ))
+        return batches
+
+    def slot_ids(self, codigo):
+        """Ids das posições do código, na mesma ordem das questões de batches()."""
+        return list(self.ids.get(codigo, []))
+
+    def take_lost(self):
+        """Quantas questões sumiram do cache desde a última chamada (zera a contagem)."""
+        lost, self.lost = self.lost, 0
+        return lost
+
+    def rejected(self):
+        """(codigo, índice, questão) de todas as questões não aprovadas, na ordem da geração."""
+        return [
+            (batch.request.codigo, index, qwv)
+            for batch in self.batches()
+            for index, qwv in enumerate(batch.questions)
+            if not is_approved(qwv)
+        ]
+
+    def question_at(self, codigo, index):
+        slots = self.slots.get(codigo, [])
+        if index >= len(slots):
+            return None
+        slot = slots[index]
+        if not isinstance(slot, tuple):
+            return slot
+        entries = pipeline.cache_manager.get_entries_by_keys([slot[0]])
+        if not entries:
+            return None
+        return QuestionWithValidation(question=entries[0].question, validation=entries[0].validation)
+
+    def replace(self, codigo, index, qwv):
+        slots = self.slots.get(codigo, [])
+        if index >= len(slots):
+            return
+        old = slots[index]
+        slots[index] = self._slots_for([qwv])[0]
+        # Questão nova na posição: id novo (a seleção e o estado dos widgets não passam para ela)
+        self.ids[codigo][index] = self._new_ids(1)[0]
+        self.approved[codigo] += int(is_approved(qwv)) - int(self._slot_approved(old))
+
+    def remove(self, codigo, indexes):
+        """Remove posições de um código; retorna (chaves do cache removidas, quantidade removida)."""
+        slots = self.slots.get(codigo, [])
+        removed_keys = []
+        removed = 0
+        # Índices em ordem decrescente para não deslocar os próximos a remover
+        for index in sorted(set(indexes), reverse=True):
+            if index < len(slots):
+                slot = slots.pop(index)
+                self.ids[codigo].pop(index)
+                self.approved[codigo] -= int(self._slot_approved(slot))
+                if isinstance(slot, tuple):
+                    removed_keys.append(slot[0])
+                removed += 1
+        return removed_keys, removed
+
+
+def current_generation():
+    """Geração atual da sessão (None se ainda não houve geração)."""
+    return st.session_state.get('current_generation')
@@ -1,63 +1,49 @@
+from functools import partial
 import streamlit as st
-from utils.export import export_question_json
-
-
-def _ensure_selected_state():
-    if 'selected_questions_current' not in st.session_state:
-        st.session_state['selected_questions_current'] = []
+from utils.export import question_export_filename, question_json_payload
+from ui.generation_state import current_generation, is_approved
+from ui.selection import current_selection
 
 
 def _actions_bar(batches):
+    selection = current_selection()
     st.markdown("#### 🔧 Ações Disponíveis")
     col1, col2, col3, col4 = st.columns(4)
     with col1:
         if st.button("📋 Selecionar Todas", key="select_all_current"):
-            st.session_state['selected_questions_current'] = []
-            for i, batch in enumerate(batches):
-                for j, _ in enumerate(batch.questions):
-                    st.session_state['selected_questions_current'].append({
-                        'source': 'current',
-                        'codigo': batch.request.codigo,
-                        'batch_index': i,
-                        'index': j
-                    })
+            selection.update(st.session_state['current_item_positions'])
             st.rerun()
     with col2:
-        if st.button("🗑️ Excluir Selecionadas", key="delete_selected_current", disabled=len(st.session_state['selected_questions_current']) == 0):
-            if len(st.session_state['selected_questions_current']) > 0:
-                st.session_state['delete_selected_questions'] = st.session_state['selected_questions_current']
-                st.rerun()
+        if st.button("🗑️ Excluir Selecionadas", key="delete_selected_current", disabled=len(selection) == 0):
+            st.session_state['delete_selected_questions'] = list(selection.values())
+            st.rerun()
     with col3:
         _export_selected_current(batches)
     with col4:
-        selected_count = len(st.session_state['selected_questions_current'])
-        st.metric("Selecionadas", selected_count)
+        st.metric("Selecionadas", len(selection))
 
 
-def _render_question_block(batch_idx, q_idx, batch, qwv):
+def _current_item(batch, batch_idx, q_idx):
+    return {
+        'source': 'current',
+        'codigo': batch.request.codigo,
+        'batch_index': batch_idx,
+        'index': q_idx
+    }
+
+
+def _render_question_block(item_id, q_idx, batch, qwv):
     question = qwv.question
     validation = qwv.validation
-    # Considera aprovada apenas se alinhada e confiança >= 0.7
-    def _is_approved_local(q):
-        try:
-            return bool(q.validation.is_aligned) and float(q.validation.confidence_score) >= 0.7
-        except Exception:
-            return False
-
-    status_icon = "✅" if _is_approved_local(qwv) else "❌"
+    # Chaves dos widgets pelo id da posição: exclusões/regenerações não deslocam o estado para outra questão
+    status_icon = "✅" if is_approved(qwv) else "❌"
     confidence_icon = _confidence_icon(validation.confidence_score)
 
     with st.container():
         col1, col2 = st.columns([4, 1])
         with col1:
-            item_selected = {
-                'source': 'current',
-                'codigo': batch.request.codigo,
-                'batch_index': batch_idx,
-                'index': q_idx
-            }
             label = f"{status_icon} **{batch.request.codigo}** - {question.enunciado[:80]}" + ("..." if len(question.enunciado) > 80 else "")
-            _toggle_selection_for_item(item_selected, label, batch_idx, q_idx)
+            _toggle_selection_for_item(item_id, label)
             col_info1, col_info2, col_info3 = st.columns(3)
             with col_info1:
                 st.write(f"**Tipo:** {question.question_type.value.replace('_', ' ').title()}")
@@ -67,32 +53,23 @@ def _render_question_block(batch_idx, q_idx, batch, qwv):
                 st.write(f"**Confiança:** {confidence_icon} {validation.confidence_score:.2f}")
         with col2:
             st.markdown("**Ações:**")
-            show_question_key = f"show_current_{batch_idx}_{q_idx}"
+            show_question_key = f"show_current_{item_id}"
             button_text = "🙈 Ocultar questão" if st.session_state.get(show_question_key, False) else "👁️ Ver questão completa"
-            if st.button(button_text, help="Alternar visualização da questão", key=f"view_current_{batch_idx}_{q_idx}"):
+            if st.button(button_text, help="Alternar visualização da questão", key=f"view_current_{item_id}"):
                 st.session_state[show_question_key] = not st.session_state.get(show_question_key, False)
                 st.rerun()
             if st.session_state.get(show_question_key, False):
                 st.code(question.format_question(), language="text")
-            alternativas = dict(zip(['A', 'B', 'C', 'D'], question.opcoes)) if question.opcoes else {}
-            json_data, filename = export_question_json(
-                getattr(question, 'materia', getattr(question, 'subject', None)),
-                batch.request.codigo,
-                question.enunciado,
-                alternativas,
-                question.gabarito,
-                f"_atual_{q_idx+1}"
+            # Conteúdo montado só no clique (o Streamlit chama a função ao baixar)
+            st.download_button(
+                label="💾",
+                data=partial(question_json_payload, question, batch.request.codigo),
+                file_name=question_export_filename(batch.request.codigo, f"_atual_{q_idx+1}"),
+                mime="application/json",
+                help="Exportar questão individual",
+                key=f"export_current_{item_id}"
             )
-            if json_data and filename:
-                st.download_button(
-                    label="💾",
-                    data=json_data,
-                    file_name=filename,
-                    mime="application/json",
-                    help="Exportar questão individual",
-                    key=f"export_current_{batch_idx}_{q_idx}"
-                )
-            if st.button("🗑️", help="Excluir questão", key=f"delete_current_{batch_idx}_{q_idx}"):
+            if st.button("🗑️", help="Excluir questão", key=f"delete_current_{item_id}"):
                 st.session_state['delete_question'] = {
                     'source': 'current',
                     'codigo': batch.request.codigo,
@@ -111,57 +88,77 @@ def _confidence_icon(score: float) -> str:
 
 
 def _export_selected_current(batches):
-    if st.button("💾 Exportar Selecionadas", key="export_selected_current", disabled=len(st.session_state['selected_questions_current']) == 0):
-        if len(st.session_state['selected_questions_current']) > 0:
-            # Import local to avoid circular imports
-            from ui.actions import prepare_export_list_from_selected
-            export_list = prepare_export_list_from_selected(st.session_state['selected_questions_current'], current_batches=batches)
-            if export_list:
-                from utils.export import export_questions_list_json
-                json_data, filename = export_questions_list_json(export_list, filename_prefix="questoes_selecionadas")
-                if json_data and filename:
-                    st.download_button(
-                        label=f"📥 Download {len(st.session_state['selected_questions_current'])} Questões",
-                        data=json_data,
-                        file_name=filename,
-                        mime="application/json",
-                        key="download_selected_current"
-                    )
-
-
-def _toggle_selection_for_item(item_selected, label, batch_idx, q_idx):
-    # handle checkbox selection state for a question item
-    if 'selected_questions_current' not in st.session_state:
-        st.session_state['selected_questions_current'] = []
-    is_selected = any(item['batch_index'] == batch_idx and item['index'] == q_idx for item in st.session_state['selected_questions_current'])
-    checkbox_changed = False
-    if st.checkbox(label, key=f"select_current_{batch_idx}_{q_idx}", value=is_selected):
-        if item_selected not in st.session_state['selected_questions_current']:
-            st.session_state['selected_questions_current'].append(item_selected)
-            checkbox_changed = True
+    selection = current_selection()
+    if st.button("💾 Exportar Selecionadas", key="export_selected_current", disabled=len(selection) == 0):
+        # Import local to avoid circular imports
+        from ui.actions import prepare_export_list_from_selected
+        export_list = prepare_export_list_from_selected(list(selection.values()), current_batches=batches)
+        if export_list:
+            from utils.export import export_questions_list_json
+            json_data, filename = export_questions_list_json(export_list, filename_prefix="questoes_selecionadas")
+            if json_data and filename:
+                st.download_button(
+                    label=f"📥 Download {len(export_list)} Questões",
+                    data=json_data,
+                    file_name=filename,
+                    mime="application/json",
+                    key="download_selected_current"
+                )
+
+
+def _on_current_item_toggle(item_id, widget_key):
+    selection = current_selection()
+    if st.session_state[widget_key]:
+        selection[item_id] = st.session_state['current_item_positions'][item_id]
     else:
-        if any(item['batch_index'] == batch_idx and item['index'] == q_idx for item in st.session_state['selected_questions_current']):
-            st.session_state['selected_questions_current'] = [
-                item for item in st.session_state['selected_questions_current']
-                if not (item['batch_index'] == batch_idx and item['index'] == q_idx)
-            ]
-            checkbox_changed = True
-    if checkbox_changed:
-        st.rerun()
+        selection.pop(item_id, None)
+
+
+def _item_ids(batches):
+    """Id único de cada questão exibida (atribuído pela geração; iguais em conteúdo não colidem)."""
+    generation = current_generation()
+    if generation is None:
+        return [[f"{i}_{j}" for j in range(len(batch.questions))] for i, batch in enumerate(batches)]
+    return [generation.slot_ids(batch.request.codigo) for batch in batches]
+
+
+def _sync_current_selection(batches, item_ids):
+    """Atualiza a posição dos itens selecionados e descarta os que não existem mais (excluídos/regenerados)."""
+    positions = {}
+    for i, batch in enumerate(batches):
+        for j, item_id in enumerate(item_ids[i]):
+            positions[item_id] = _current_item(batch, i, j)
+    st.session_state['current_item_positions'] = positions
+    selection = current_selection()
+    for item_id in list(selection):
+        if item_id in positions:
+            selection[item_id] = positions[item_id]
+        else:
+            del selection[item_id]
+
+
+def _toggle_selection_for_item(item_id, label):
+    # handle checkbox selection state for a question item (id da posição na geração)
+    selection = current_selection()
+    widget_key = f"select_current_{item_id}"
+    st.session_state[widget_key] = item_id in selection
+    st.checkbox(label, key=widget_key, on_change=_on_current_item_toggle, args=(item_id, widget_key))
 
 
 def questions_table_panel(batches, handle_question_actions):
     handle_question_actions()
-    _ensure_selected_state()
+    item_ids = _item_ids(batches)
+    _sync_current_selection(batches, item_ids)
     _actions_bar(batches)
     st.markdown("---")
 
     for i, batch in enumerate(batches):
         st.markdown(f"### 📖 {batch.request.codigo} - {batch.request.objeto_conhecimento[:60]}...")
         for j, qwv in enumerate(batch.questions):
-            _render_question_block(i, j, batch, qwv)
-    total_questions = sum(len(batch.questions) for batch in batches)
-    total_approved = sum(sum(1 for q in batch.questions if (bool(q.validation.is_aligned) and float(q.validation.confidence_score) >= 0.7)) for batch in batches)
+            _render_question_block(item_ids[i][j], j, batch, qwv)
+    generation = current_generation()
+    total_questions = generation.total_generated if generation is not None else sum(len(batch.questions) for batch in batches)
+    total_approved = generation.total_approved if generation is not None else sum(sum(1 for q in batch.questions if is_approved(q)) for batch in batches)
     total_rejected = total_questions - total_approved
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -1,4 +1,5 @@
 import streamlit as st
+from ui.generation_state import is_approved
 
 
 def _confidence_icon(score: float) -> str:
@@ -9,21 +10,17 @@ def _confidence_icon(score: float) -> str:
     return "🔴"
 
 
-def _is_approved_local(qwv) -> bool:
-    try:
-        return bool(qwv.validation.is_aligned) and float(qwv.validation.confidence_score) >= 0.7
-    except Exception:
-        return False
-
-
-def _render_rejected_panel(batches):
-    rejected_exists = any(any(not _is_approved_local(q) for q in batch.questions) for batch in batches)
-    if not rejected_exists:
+def _render_rejected_panel(generation, batches):
+    if not generation.has_rejected:
         return
     with st.expander("⚠️ Questões Rejeitadas na Validação", expanded=True):
         st.markdown("**🔄 Estas questões não foram aprovadas e podem ser regeneradas:**")
+        rejected_count = generation.total_generated - generation.total_approved
+        if st.button(f"🔄 Regenerar Todas as Rejeitadas ({rejected_count})", key="regen_all_rejected", type="primary"):
+            st.session_state['bulk_regenerate_request'] = True
+            st.rerun()
         for batch in batches:
-            rejected_pairs = [(idx, q) for idx, q in enumerate(batch.questions) if not _is_approved_local(q)]
+            rejected_pairs = [(idx, q) for idx, q in enumerate(batch.questions) if not is_approved(q)]
             if not rejected_pairs:
                 continue
             st.markdown(f"### 📖 {batch.request.codigo} - {batch.request.objeto_conhecimento[:60]}...")
@@ -47,7 +44,7 @@ def _render_rejected_panel(batches):
 def _render_approved_panel(batches):
     with st.expander("🔍 Análise Detalhada das Questões Aprovadas", expanded=False):
         for batch in batches:
-            approved_questions = [q for q in batch.questions if _is_approved_local(q)]
+            approved_questions = [q for q in batch.questions if is_approved(q)]
             st.markdown(f"## 📖 {batch.request.codigo} - {batch.request.objeto_conhecimento[:80]}...")
             st.info(f"**Unidade Temática:** {batch.request.unidade_tematica}")
             if not approved_questions:
@@ -65,10 +62,15 @@ def _render_approved_panel(batches):
                 st.divider()
 
 
-def results_panel(batches, display_questions_table):
+def results_panel(generation, display_questions_table):
     st.header("📊 Resultados da Geração Atual")
-    total_generated = sum(batch.total_generated for batch in batches)
-    total_approved = sum(sum(1 for q in batch.questions if _is_approved_local(q)) for batch in batches)
+    # Monta os lotes completos uma vez por execução; os totais vêm dos agregados da sessão
+    batches = generation.batches()
+    lost = generation.take_lost()
+    if lost:
+        st.warning(f"⚠️ {lost} questão(ões) desta geração foram excluídas do histórico do cache e saíram da lista.")
+    total_generated = generation.total_generated
+    total_approved = generation.total_approved
     approval_rate = (total_approved / total_generated * 100) if total_generated > 0 else 0
     col1, col2, col3, col4 = st.columns(4)
     with col1:
@@ -78,9 +80,9 @@ def results_panel(batches, display_questions_table):
     with col3:
         st.metric("Taxa de Aprovação", f"{approval_rate:.1f}%")
     with col4:
-        st.metric("Códigos Processados", len(batches))
+        st.metric("Códigos Processados", len(generation))
 
-    _render_rejected_panel(batches)
+    _render_rejected_panel(generation, batches)
     _render_approved_panel(batches)
 
     # Tabela de questões
@@ -92,17 +94,12 @@ def results_panel(batches, display_questions_table):
     col1, col2, col3 = st.columns([1, 2, 1])
     with col2:
         try:
-            from utils.export import export_questions_list_json, export_question_json
-            import json
-            export_list = []
-            for batch in batches:
-                for idx, qwv in enumerate(batch.questions):
-                    q = qwv.question
-                    disciplina = getattr(q, 'materia', getattr(q, 'subject', None))
-                    alternativas = q.opcoes if hasattr(q, 'opcoes') else {}
-                    gabarito = q.gabarito if q.gabarito in ['A', 'B', 'C', 'D'] else str(q.gabarito)
-                    json_data_individual, _ = export_question_json(disciplina, batch.request.codigo, q.enunciado, alternativas, gabarito, f"_atual_{idx+1}")
-                    export_list.append(json.loads(json_data_individual))
+            from utils.export import export_questions_list_json, question_export
+            export_list = [
+                question_export(qwv.question, batch.request.codigo)
+                for batch in batches
+                for qwv in batch.questions
+            ]
             json_data, file_name = export_questions_list_json(export_list, filename_prefix="questoes_bncc_4ano")
             st.download_button(
                 label="💾 Exportar Geração Atual (JSON)",
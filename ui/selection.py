@@ -0,0 +1,92 @@
+import streamlit as st
+from pipeline import pipeline
+from ui.data import cached_count_cache_entries
+
+
+class CacheSelection:
+    """Seleção do histórico do cache.
+
+    Marcações individuais ficam em um dict cache_key -> codigo. "Selecionar Todas" guarda só o
+    filtro (resolvido no banco quando a seleção é usada) e as chaves desmarcadas depois disso.
+    """
+
+    def __init__(self):
+        self.keys = {}
+        self.filters = None
+        self.excluded = set()
+
+    def select_all(self, filters=None):
+        self.keys = {}
+        self.filters = dict(filters or {})
+        self.excluded = set()
+
+    def clear(self):
+        self.keys = {}
+        self.filters = None
+        self.excluded = set()
+
+    def copy(self):
+        selection = CacheSelection()
+        selection.keys = dict(self.keys)
+        selection.filters = None if self.filters is None else dict(self.filters)
+        selection.excluded = set(self.excluded)
+        return selection
+
+    def matching(self, cache_keys):
+        """Chaves (da página exibida) cobertas pelo filtro da seleção; uma consulta por página."""
+        if self.filters is None or not cache_keys:
+            return set()
+        return pipeline.cache_manager.filter_keys(cache_keys, self.filters)
+
+    def is_selected(self, cache_key, in_filter=False):
+        return cache_key in self.keys or (in_filter and cache_key not in self.excluded)
+
+    def set_selected(self, cache_key, codigo, selected, in_filter=False):
+        if in_filter:
+            if selected:
+                self.excluded.discard(cache_key)
+            else:
+                self.excluded.add(cache_key)
+        elif selected:
+            self.keys[cache_key] = codigo
+        else:
+            self.keys.pop(cache_key, None)
+
+    def count(self):
+        if self.filters is None:
+            return len(self.keys)
+        return max(cached_count_cache_entries(self.filters) - len(self.excluded), 0) + len(self.keys)
+
+    def codigos(self, all_codigos):
+        if self.filters is None:
+            return set(self.keys.values())
+        return set(self.filters.get('codigo') or all_codigos) | set(self.keys.values())
+
+    def iter_items(self):
+        """(cache_key, codigo) de todas as questões selecionadas."""
+        yield from self.keys.items()
+        if self.filters is not None:
+            for cache_key, codigo in pipeline.cache_manager.iter_cache_keys(self.filters):
+                if cache_key not in self.excluded and cache_key not in self.keys:
+                    yield cache_key, codigo
+
+    def items(self):
+        """Itens no formato usado pelas ações de exclusão/exportação."""
+        return [
+            {'source': 'cache', 'cache_key': cache_key, 'codigo': codigo}
+            for cache_key, codigo in self.iter_items()
+        ]
+
+
+def cache_selection():
+    if 'selected_questions_cache' not in st.session_state:
+        st.session_state['selected_questions_cache'] = CacheSelection()
+    return st.session_state['selected_questions_cache']
+
+
+def current_selection():
+    """Seleção da geração atual: id da posição -> item (posição atualizada a cada renderização)."""
+    if 'selected_questions_current' not in st.session_state:
+        st.session_state['selected_questions_current'] = {}
+    return st.session_state['selected_questions_current']
+
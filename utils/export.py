@@ -1,4 +1,10 @@
+import csv
+import io
 import json
+import tempfile
+import zipfile
+
+import pandas as pd
 
 
 _SUBJECT_MAP = {
@@ -41,7 +47,8 @@ def _clean_alternativa(alt):
     return alt
 
 
-def export_question_json(disciplina, codigo, enunciado, alternativas, gabarito, filename_suffix="", ano=4, url=None):
+def build_question_export(disciplina, codigo, enunciado, alternativas, gabarito, ano=4, url=None):
+    """Monta o objeto de exportação de uma questão (mesmo formato de export_question_json, sem serializar)."""
     disciplina_corrigida = _normalize_disciplina_for_export(disciplina, codigo)
 
     alternativas_corrigidas = {}
@@ -54,7 +61,7 @@ def export_question_json(disciplina, codigo, enunciado, alternativas, gabarito,
             if idx < 4:
                 alternativas_corrigidas[letras[idx]] = _clean_alternativa(alt)
 
-    export_data = {
+    return {
         "disciplina": disciplina_corrigida,
         "ano": ano,
         "codigo": codigo,
@@ -65,25 +72,228 @@ def export_question_json(disciplina, codigo, enunciado, alternativas, gabarito,
             "url": url
         }
     }
+
+
+def question_export(question, codigo=None, ano=4, url=None):
+    """Objeto de exportação a partir de um modelo Question (usa o código da questão se não informado)."""
+    disciplina = getattr(question, 'materia', getattr(question, 'subject', None))
+    alternativas = getattr(question, 'opcoes', None) or {}
+    gabarito = question.gabarito if question.gabarito in ['A', 'B', 'C', 'D'] else str(question.gabarito)
+    return build_question_export(disciplina, codigo or question.codigo, question.enunciado, alternativas, gabarito, ano=ano, url=url)
+
+
+def export_row_to_question(row):
+    """Objeto de exportação a partir de uma linha de CacheManager.iter_export_rows."""
+    return build_question_export(row["materia"], row["codigo"], row["enunciado"], row["alternativas"], row["gabarito"])
+
+
+def question_export_filename(codigo, filename_suffix=""):
+    return f"{codigo}{filename_suffix}_questao_individual.json"
+
+
+def question_json_payload(question, codigo=None):
+    """JSON individual de um modelo Question (para downloads montados só quando pedidos)."""
+    return json.dumps(question_export(question, codigo), ensure_ascii=False, indent=2)
+
+
+def export_question_json(disciplina, codigo, enunciado, alternativas, gabarito, filename_suffix="", ano=4, url=None):
+    export_data = build_question_export(disciplina, codigo, enunciado, alternativas, gabarito, ano=ano, url=url)
     json_data = json.dumps(export_data, ensure_ascii=False, indent=2)
-    filename = f"{codigo}{filename_suffix}_questao_individual.json"
-    return json_data, filename
+    return json_data, question_export_filename(codigo, filename_suffix)
+
+
+def export_list_filename(codes, filename_prefix="questoes_selecionadas", extension="json"):
+    codes_str = "_".join(sorted(codes)) if codes else "export"
+    return f"{codes_str}_{filename_prefix}.{extension}"
 
 
 def export_questions_list_json(export_list, filename_prefix="questoes_selecionadas"):
     export_objects = []
     for item in export_list:
-        disciplina = item.get("disciplina")
-        codigo = item.get("codigo")
-        enunciado = item["questao"]["enunciado"]
-        alternativas = item["questao"].get("alternativas")
-        gabarito = item["questao"].get("gabarito")
-        url = item["questao"].get("url")
-        ano = item.get("ano", 4)
-        obj_json, _ = export_question_json(disciplina, codigo, enunciado, alternativas, gabarito, ano=ano, url=url)
-        export_objects.append(json.loads(obj_json))
-    codes = {item["codigo"] for item in export_list}
-    codes_str = "_".join(sorted(codes)) if codes else "export"
-    filename = f"{codes_str}_{filename_prefix}.json"
+        export_objects.append(build_question_export(
+            item.get("disciplina"),
+            item.get("codigo"),
+            item["questao"]["enunciado"],
+            item["questao"].get("alternativas"),
+            item["questao"].get("gabarito"),
+            ano=item.get("ano", 4),
+            url=item["questao"].get("url")
+        ))
+    filename = export_list_filename({item["codigo"] for item in export_list}, filename_prefix)
     json_data = json.dumps(export_objects, ensure_ascii=False, indent=2)
     return json_data, filename
+
+
+def iter_questions_json(export_objects, ndjson=False):
+    """Serializa objetos de exportação em pedaços: array JSON (mesmo formato de export_questions_list_json) ou NDJSON."""
+    if ndjson:
+        for obj in export_objects:
+            yield json.dumps(obj, ensure_ascii=False) + "\n"
+        return
+
+    first = True
+    for obj in export_objects:
+        item = json.dumps(obj, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+        yield ("[\n  " if first else ",\n  ") + item
+        first = False
+    yield "[]" if first else "\n]"
+
+
+def write_questions_json(export_objects, fp, ndjson=False):
+    """Grava a exportação incrementalmente em um arquivo texto; retorna quantas questões foram escritas."""
+    count = 0
+
+    def counted():
+        nonlocal count
+        for obj in export_objects:
+            count += 1
+            yield obj
+
+    for chunk in iter_questions_json(counted(), ndjson=ndjson):
+        fp.write(chunk)
+    return count
+
+
+# Colunas da exportação tabular (CSV/Parquet), uma linha por questão
+EXPORT_COLUMNS = [
+    "codigo", "disciplina", "enunciado",
+    "alternativa_a", "alternativa_b", "alternativa_c", "alternativa_d",
+    "gabarito", "confidence", "is_aligned", "created_at"
+]
+
+# formato -> (mime, extensão)
+EXPORT_FORMATS = {
+    "json": ("application/json", "json"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "zip": ("application/zip", "zip"),
+}
+
+_MANIFEST_COLUMNS = ["arquivo", "cache_key", "codigo", "gabarito", "confidence", "is_aligned", "created_at"]
+
+
+def parquet_available():
+    """Parquet depende do pyarrow, que é opcional."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def export_row_to_record(row):
+    """Linha plana (colunas de EXPORT_COLUMNS) a partir de uma linha de CacheManager.iter_export_rows."""
+    alternativas = [_clean_alternativa(alt) for alt in row["alternativas"][:4]]
+    alternativas += [None] * (4 - len(alternativas))
+    return {
+        "codigo": row["codigo"],
+        "disciplina": _normalize_disciplina_for_export(row["materia"], row["codigo"]),
+        "enunciado": row["enunciado"],
+        "alternativa_a": alternativas[0],
+        "alternativa_b": alternativas[1],
+        "alternativa_c": alternativas[2],
+        "alternativa_d": alternativas[3],
+        "gabarito": row["gabarito"],
+        "confidence": row["confidence_score"],
+        "is_aligned": row["is_aligned"],
+        "created_at": row["created_at"],
+    }
+
+
+def _records_frame(records):
+    frame = pd.DataFrame.from_records(records, columns=EXPORT_COLUMNS)
+    for column in EXPORT_COLUMNS[:8]:
+        frame[column] = frame[column].astype("string")
+    frame["confidence"] = frame["confidence"].astype("float64")
+    frame["is_aligned"] = frame["is_aligned"].astype("bool")
+    frame["created_at"] = pd.to_datetime(frame["created_at"], format="ISO8601", errors="coerce")
+    return frame
+
+
+def iter_export_frames(rows, chunk_size=5000):
+    """Agrupa as linhas do cache em DataFrames tipados de até chunk_size linhas."""
+    records = []
+    for row in rows:
+        records.append(export_row_to_record(row))
+        if len(records) >= chunk_size:
+            yield _records_frame(records)
+            records = []
+    if records:
+        yield _records_frame(records)
+
+
+def write_questions_csv(rows, fp, chunk_size=5000):
+    """Grava CSV (com cabeçalho) em partes em um arquivo texto; retorna quantas questões foram escritas."""
+    count = 0
+    for frame in iter_export_frames(rows, chunk_size):
+        frame.to_csv(fp, header=count == 0, index=False)
+        count += len(frame)
+    if count == 0:
+        fp.write(",".join(EXPORT_COLUMNS) + "\n")
+    return count
+
+
+def write_questions_parquet(rows, fp, chunk_size=5000):
+    """Grava Parquet (um row group por parte) em um arquivo binário; retorna quantas questões foram escritas."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(column, pa.string()) for column in EXPORT_COLUMNS[:8]] + [
+        ("confidence", pa.float64()),
+        ("is_aligned", pa.bool_()),
+        ("created_at", pa.timestamp("us")),
+    ])
+    count = 0
+    with pq.ParquetWriter(fp, schema, compression="zstd") as writer:
+        for frame in iter_export_frames(rows, chunk_size):
+            writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+            count += len(frame)
+    return count
+
+
+def write_questions_zip(rows, fp):
+    """Grava um ZIP com um JSON individual por questão e um manifest.csv; retorna quantas questões foram escritas.
+
+    Cada arquivo é comprimido e gravado assim que a linha chega; o manifesto é acumulado em
+    arquivo temporário e entra no fim, então nem o ZIP nem o manifesto ficam inteiros em memória.
+    """
+    count = 0
+    per_codigo = {}
+    with zipfile.ZipFile(fp, "w", compression=zipfile.ZIP_DEFLATED) as archive, \
+            tempfile.TemporaryFile(mode="w+", encoding="utf-8", newline="") as manifest:
+        writer = csv.writer(manifest)
+        writer.writerow(_MANIFEST_COLUMNS)
+        for row in rows:
+            per_codigo[row["codigo"]] = per_codigo.get(row["codigo"], 0) + 1
+            filename = question_export_filename(row["codigo"], f"_{per_codigo[row['codigo']]}")
+            archive.writestr(filename, json.dumps(export_row_to_question(row), ensure_ascii=False, indent=2))
+            writer.writerow([
+                filename, row["cache_key"], row["codigo"], row["gabarito"],
+                row["confidence_score"], row["is_aligned"], row["created_at"]
+            ])
+            count += 1
+        manifest.seek(0)
+        with archive.open("manifest.csv", "w") as target:
+            for line in manifest:
+                target.write(line.encode("utf-8"))
+    return count
+
+
+def write_cache_export(rows, fp, export_format="json", chunk_size=5000):
+    """Grava as linhas de CacheManager.iter_export_rows em um arquivo binário no formato pedido (ver EXPORT_FORMATS)."""
+    if export_format == "parquet":
+        return write_questions_parquet(rows, fp, chunk_size)
+    if export_format == "zip":
+        return write_questions_zip(rows, fp)
+    text = io.TextIOWrapper(fp, encoding="utf-8", newline="")
+    try:
+        if export_format == "csv":
+            return write_questions_csv(rows, text, chunk_size)
+        return write_questions_json(
+            (export_row_to_question(row) for row in rows), text, ndjson=export_format == "ndjson"
+        )
+    finally:
+        # Devolve o arquivo binário sem fechá-lo
+        text.flush()
+        text.detach()